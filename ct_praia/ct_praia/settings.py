@@ -80,6 +80,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'main.permissions.PermissionContextMiddleware',  # perfil/vínculos do usuário, uma vez por requisição
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -178,13 +179,15 @@ from datetime import timedelta
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # JWT; leituras usam a claim de papel do token sem consultar o usuário
+        'main.authentication.ClaimsJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',  # Para o Swagger UI
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ),
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    # Número de página por padrão; keyset (cursor) quando o cliente envia ?limit= ou ?cursor=
+    'DEFAULT_PAGINATION_CLASS': 'main.pagination.KeysetPagination',
     'PAGE_SIZE': 721,
     'DEFAULT_FILTER_BACKENDS': (
         'rest_framework.filters.SearchFilter',
@@ -195,10 +198,46 @@ REST_FRAMEWORK = {
     'TIME_FORMAT': '%H:%M:%S',
 }
 
+# ============================================================================
+# TREINOS RECORRENTES
+# ============================================================================
+# "eager": o comando gerar_treinos_recorrentes materializa toda a janela.
+# "lazy": ocorrências são calculadas em memória e só viram linhas de Treino
+# na primeira inscrição (ou quando materializadas explicitamente). Nesse modo a
+# listagem /api/treinos/ é sempre paginada por cursor (?limit=/?cursor=).
+RECURRING_MATERIALIZATION_MODE = os.getenv("RECURRING_MATERIALIZATION_MODE", "eager")
+# Horizonte (em dias) das ocorrências virtuais listadas no modo lazy
+RECURRING_VIRTUAL_HORIZON_DAYS = int(os.getenv("RECURRING_VIRTUAL_HORIZON_DAYS", "365"))
+# Opt-in: com "1", salvar um agendamento pela API apenas enfileira a regeneração
+# e o comando processar_regeneracoes (processo `worker` do Procfile) executa as
+# tarefas pendentes. Só ative onde esse worker estiver rodando; sem ele as
+# tarefas ficam na fila e as agendas deixam de ser regeneradas.
+AGENDAMENTO_REGENERACAO_ASSINCRONA = os.getenv("AGENDAMENTO_REGENERACAO_ASSINCRONA", "0") == "1"
+# Tempo (segundos) que uma tarefa pode ficar EXECUTANDO antes de ser retomada
+# por outro worker (o anterior é considerado morto). Deve superar a regeneração
+# mais lenta; cada retomada consome uma tentativa.
+REGENERACAO_LEASE_SEGUNDOS = int(os.getenv("REGENERACAO_LEASE_SEGUNDOS", "600"))
+# Listagem/detalhe de treinos na API montados a partir de values(), sem
+# instanciar modelos (mesma saída do TreinoSerializer). Ignorado no modo lazy.
+TREINO_LEITURA_RAPIDA = os.getenv("TREINO_LEITURA_RAPIDA", "0") == "1"
+
+# ============================================================================
+# MÉTRICAS PÚBLICAS
+# ============================================================================
+# Validade (segundos) das métricas da home e de /api/metrics/ no cache padrão
+# (LocMem, por processo). Criar/excluir CTs, usuários e treinos invalida só o
+# cache do worker que fez a escrita: com vários workers do gunicorn, os outros
+# podem servir números desatualizados por até METRICS_CACHE_TTL segundos. Use
+# um CACHES compartilhado (ex.: Redis/Memcached) para invalidar em todos.
+METRICS_CACHE_TTL = int(os.getenv("METRICS_CACHE_TTL", "60"))
+
 # ============================================================================
 # SIMPLE JWT CONFIGURATION
 # ============================================================================
 SIMPLE_JWT = {
+    # Leituras com token confiam nas claims até ele expirar, sem reconferir is_active
+    # (ver main.authentication.ClaimsJWTAuthentication): este é o prazo máximo em que
+    # um usuário desativado ainda consegue ler.
     'ACCESS_TOKEN_LIFETIME': timedelta(hours=5),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
     'ROTATE_REFRESH_TOKENS': True,
@@ -4,9 +4,13 @@ from django.contrib.auth.admin import UserAdmin
 
 from .models import (
 	AgendamentoTreino,
+	BloqueioCT,
 	CentroTreinamento,
+	ExcecaoAgendamento,
 	HorarioRecorrente,
 	Inscricao,
+	IntencaoInscricao,
+	TarefaRegeneracao,
 	Treino,
 	Usuario,
 )
@@ -50,15 +54,27 @@ class HorarioRecorrenteInline(admin.TabularInline):
 	extra = 0
 
 
+class ExcecaoAgendamentoInline(admin.TabularInline):
+	model = ExcecaoAgendamento
+	extra = 0
+
+
 @admin.register(AgendamentoTreino)
 class AgendamentoTreinoAdmin(admin.ModelAdmin):
 	list_display = ("ct", "professor", "modalidade", "vagas", "nivel", "criado_em")
 	search_fields = ("modalidade", "ct__nome", "professor__username")
 	list_filter = ("ct", "professor")
-	inlines = [HorarioRecorrenteInline]
+	inlines = [HorarioRecorrenteInline, ExcecaoAgendamentoInline]
 	autocomplete_fields = ("ct", "professor")
 
 
+@admin.register(BloqueioCT)
+class BloqueioCTAdmin(admin.ModelAdmin):
+	list_display = ("ct", "data", "motivo")
+	list_filter = ("ct",)
+	date_hierarchy = "data"
+
+
 @admin.register(Inscricao)
 class InscricaoAdmin(admin.ModelAdmin):
 	list_display = ("treino", "aluno", "status", "criado_em")
@@ -67,6 +83,21 @@ class InscricaoAdmin(admin.ModelAdmin):
 	autocomplete_fields = ("treino", "aluno")
 
 
+@admin.register(IntencaoInscricao)
+class IntencaoInscricaoAdmin(admin.ModelAdmin):
+	list_display = ("treino", "aluno", "prioridade", "criado_em")
+	list_filter = ("treino__ct",)
+	search_fields = ("treino__modalidade", "aluno__username")
+	autocomplete_fields = ("treino", "aluno")
+
+
+@admin.register(TarefaRegeneracao)
+class TarefaRegeneracaoAdmin(admin.ModelAdmin):
+	list_display = ("agendamento", "status", "tentativas", "criado_em", "concluido_em")
+	list_filter = ("status",)
+	readonly_fields = ("criadas", "atualizadas", "removidas", "erro", "iniciado_em", "concluido_em")
+
+
 # Optionally re-register the default User with default UserAdmin
 try:
 	admin.site.unregister(get_user_model())
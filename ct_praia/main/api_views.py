@@ -1,46 +1,198 @@
+from dataclasses import asdict
+from datetime import date, time, timedelta
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Count, Q
+from django.db.models import Count, Max, Prefetch, Q, Sum
+from django.http import StreamingHttpResponse
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from rest_framework import mixins, status, viewsets
 from rest_framework.decorators import action, api_view, permission_classes
-from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
-from rest_framework_simplejwt.tokens import RefreshToken
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
-from .models import AgendamentoTreino, CentroTreinamento, Inscricao, ProfessorCentroTreinamento, Treino, Usuario
+from .authentication import tokens_para
+from .conditional import respond_conditionally
+from .exports import (
+    INSCRICAO_EXPORT_COLUMNS,
+    TREINO_EXPORT_COLUMNS,
+    CSVStreamRenderer,
+    NDJSONStreamRenderer,
+    exportar_inscricoes,
+    exportar_treinos,
+)
+from .jobs import schedule_regeneration
+from .metrics import get_metrics
+from .models import AgendamentoTreino, CentroTreinamento, Inscricao, ProfessorCentroTreinamento, TarefaRegeneracao, Treino, Usuario
+from .permissions import permission_context
 from .serializers import (
     AgendamentoTreinoSerializer,
     CentroTreinamentoSerializer,
+    ClonarSemanaSerializer,
     ProfessorCentroTreinamentoSerializer,
+    InscricaoLoteSerializer,
     InscricaoSerializer,
     LoginSerializer,
     SignupSerializer,
+    TarefaRegeneracaoSerializer,
+    TreinoLoteSerializer,
     TreinoSerializer,
     UpdateProfileSerializer,
     UsuarioCompletoSerializer,
     UsuarioSerializer,
+    serialize_treino_rows,
+    sparse_params,
+    treino_values,
+)
+from .recurrence import prefetch_recurrence
+from .services import (
+    DEFAULT_WINDOW_DAYS,
+    ConfirmacaoInvalida,
+    OcorrenciaInvalida,
+    TreinoLotado,
+    cancelar_inscricao,
+    confirmar_inscricao,
+    copias_da_semana,
+    criar_treinos_em_lote,
+    find_conflicts,
+    inscrever_em_lote,
+    lazy_materialization_enabled,
+    materialize_ocorrencia,
+    pagina_ocorrencias,
+    parse_ocorrencia_chave,
+    posicao_ocorrencia,
+    preview_agendamento,
+    registrar_intencao,
+    virtual_horizon_days,
 )
-from .services import regenerate_agendamento_ocorrencias
 
 User = get_user_model()
 
 
 def _is_gerente_do_ct(user, ct: CentroTreinamento) -> bool:
-    return bool(user.is_superuser or (hasattr(user, "usuario") and user.usuario.tipo == Usuario.Tipo.GERENTE and ct.gerente_id == user.id))
+    return permission_context(user).gerencia(ct)
+
 
+def _require_professor_associado(ct: CentroTreinamento, professor_id: int):
+    # Vínculo de outro usuário (o professor escolhido pelo gerente): fora do contexto da requisição
+    if not ct.get_vinculo_professor(professor_id):
+        raise PermissionDenied("Professor não está associado a este CT.")
 
-def _professor_vinculo(ct: CentroTreinamento, professor_id: int | None):
-    if not professor_id:
+
+def _scope_agenda(queryset, user):
+    """Restringe treinos/agendamentos ao que o perfil pode listar (gerente: seus CTs; professor: os seus)."""
+    if user.is_superuser:
+        return queryset
+    perfil = permission_context(user)
+    if not perfil.tem_perfil:
+        return queryset.none()
+    if perfil.is_gerente:
+        return queryset.filter(ct__gerente_id=user.pk)
+    if perfil.is_professor:
+        return queryset.filter(professor_id=user.pk)
+    # ALUNO: pode listar treinos futuros para se inscrever
+    return queryset
+
+
+def _safe_parse_date(value):
+    try:
+        return parse_date(value or '')
+    except ValueError:
         return None
-    return ct.get_vinculo_professor(professor_id)
 
 
-def _require_professor_associado(ct: CentroTreinamento, professor_id: int):
-    if not _professor_vinculo(ct, professor_id):
-        raise PermissionDenied("Professor não está associado a este CT.")
+def _filtrar_pk(queryset, pk):
+    """`queryset.filter(pk=pk)` com o 404 de `get_object()` para pk malformada."""
+    try:
+        return queryset.filter(pk=pk)
+    except (TypeError, ValueError):
+        raise NotFound
+
+
+def _pede(only, *names):
+    """True se algum dos campos entra na resposta (`only` None = todos os campos)."""
+    return only is None or any(name in only for name in names)
+
+
+def _relacoes_treino(queryset, request):
+    """Joins de `TreinoSerializer` restritos ao que `?fields=`/`?expand=` pedem."""
+    only, expand = sparse_params(request)
+    related = []
+    if _pede(only, 'ct_nome') or 'ct' in (expand or ()):
+        related.append('ct')
+    if _pede(only, 'professor_nome'):
+        related.append('professor')
+    if related:
+        queryset = queryset.select_related(*related)
+    return queryset
+
+
+def _mais_recente(*datas):
+    datas = [data for data in datas if data is not None]
+    return max(datas) if datas else None
+
+
+def _estado_cts(queryset):
+    """Agregado barato para o ETag dos CTs: última alteração e total de CTs.
+
+    Vínculos e nomes de gerente/professores vêm de outras tabelas; os receivers de
+    `signals` avançam o `atualizado_em` dos CTs afetados quando eles mudam.
+    """
+    estado = queryset.order_by().aggregate(atualizado=Max('atualizado_em'), total=Count('id'))
+    return (estado['atualizado'], estado['total']), estado['atualizado']
+
+
+def _estado_treinos(queryset):
+    """Idem para treinos; os contadores de inscritos (que mudam `vagas_disponiveis`) são colunas."""
+    estado = queryset.order_by().aggregate(
+        atualizado=Max('atualizado_em'),
+        total=Count('id'),
+        confirmados=Sum('inscritos_confirmados'),
+        pendentes=Sum('inscritos_pendentes'),
+        professores_atualizados=Max('professor__usuario__atualizado_em'),
+    )
+    return (
+        tuple(estado[chave] for chave in sorted(estado)),
+        _mais_recente(estado['atualizado'], estado['professores_atualizados']),
+    )
+
+
+def _exportar(request, columns, rows, nome):
+    """Resposta em streaming no formato negociado (`?format=csv|ndjson`)."""
+    renderer = request.accepted_renderer
+    response = StreamingHttpResponse(
+        renderer.stream(columns, rows),
+        content_type=f'{renderer.media_type}; charset={renderer.charset}',
+    )
+    response['Content-Disposition'] = f'attachment; filename="{nome}.{renderer.format}"'
+    return response
+
+
+def _agendamentos_para_ocorrencias():
+    return prefetch_recurrence(AgendamentoTreino.objects.select_related('professor'))
+
+
+def _cursor_ocorrencia(treino):
+    return list(posicao_ocorrencia(treino))
+
+
+def _posicao_ocorrencia(values):
+    """Posição da listagem lazy a partir dos valores (texto) do cursor; ValueError se inválida."""
+    if values is None:
+        return None
+    data, hora_inicio, pk, chave = values
+    if not isinstance(data, str) or not isinstance(hora_inicio, str) or (pk is None) == (chave is None):
+        raise ValueError('cursor inválido')
+    return (
+        date.fromisoformat(data),
+        time.fromisoformat(hora_inicio),
+        None if pk is None else int(pk),
+        chave,
+    )
 
 
 @swagger_auto_schema(
@@ -72,8 +224,8 @@ def signup_view(request):
     if serializer.is_valid():
         user = serializer.save()
         
-        # Gerar tokens JWT
-        refresh = RefreshToken.for_user(user)
+        # Gerar tokens JWT (papel nas claims)
+        refresh = tokens_para(user)
         
         # Buscar dados completos do usuário
         usuario_completo = UsuarioCompletoSerializer(user).data
@@ -120,7 +272,7 @@ def login_view(request):
     user = authenticate(username=username, password=password)
     
     if user is not None:
-        refresh = RefreshToken.for_user(user)
+        refresh = tokens_para(user)
         usuario_completo = UsuarioCompletoSerializer(user).data
         
         return Response({
@@ -141,16 +293,8 @@ def metrics_view(request):
     """
     Retorna métricas públicas da plataforma
     """
-    hoje = timezone.now().date()
-    
-    metrics = {
-        'metric_cts': CentroTreinamento.objects.count(),
-        'metric_professores': Usuario.objects.filter(tipo=Usuario.Tipo.PROFESSOR).count(),
-        'metric_treinos': Treino.objects.filter(data__gte=hoje).count(),
-        'metric_alunos': Usuario.objects.filter(tipo=Usuario.Tipo.ALUNO).count(),
-    }
-    
-    return Response(metrics)
+    metrics = get_metrics()
+    return respond_conditionally(request, tuple(metrics.values()), None, lambda: Response(metrics))
 
 
 class CentroTreinamentoViewSet(viewsets.ModelViewSet):
@@ -165,7 +309,27 @@ class CentroTreinamentoViewSet(viewsets.ModelViewSet):
     """
     queryset = CentroTreinamento.objects.all()
     serializer_class = CentroTreinamentoSerializer
+    keyset_ordering = ('nome', 'id')
+
+    def _leitura(self, queryset):
+        """gerente_nome e professores/professores_nomes sem consultas por CT (só se pedidos)."""
+        only, _ = sparse_params(self.request)
+        if _pede(only, 'gerente_nome'):
+            queryset = queryset.select_related('gerente')
+        if _pede(only, 'professores', 'professores_nomes'):
+            queryset = queryset.prefetch_related(
+                Prefetch('professores', queryset=User.objects.only('id', 'username', 'first_name', 'last_name'))
+            )
+        return queryset
     
+    def list(self, request, *args, **kwargs):
+        estado, atualizado = _estado_cts(self.filter_queryset(self.get_queryset()))
+        return respond_conditionally(request, estado, atualizado, lambda: super(CentroTreinamentoViewSet, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        estado, atualizado = _estado_cts(_filtrar_pk(self.get_queryset(), kwargs['pk']))
+        return respond_conditionally(request, estado, atualizado, lambda: super(CentroTreinamentoViewSet, self).retrieve(request, *args, **kwargs))
+
     def get_permissions(self):
         if self.action in ['list', 'retrieve', 'treinos']:
             return [AllowAny()]
@@ -177,20 +341,22 @@ class CentroTreinamentoViewSet(viewsets.ModelViewSet):
         user = self.request.user
 
         # Leitura é pública (inclui ct/{id}/treinos)
-        if self.action in ['list', 'retrieve', 'treinos']:
+        if self.action in ['list', 'retrieve']:
+            return self._leitura(qs)
+        if self.action == 'treinos':
             return qs
 
         if user.is_superuser:
             return qs
 
         # Para create/update/destroy/add_professor etc: somente gerente do CT
-        if not hasattr(user, 'usuario') or user.usuario.tipo != Usuario.Tipo.GERENTE:
+        if not permission_context(user).is_gerente:
             return qs.none()
-        return qs.filter(gerente=user)
+        return qs.filter(gerente_id=user.pk)
     
     def perform_create(self, serializer):
         user = self.request.user
-        if not user.is_superuser and (not hasattr(user, 'usuario') or user.usuario.tipo != Usuario.Tipo.GERENTE):
+        if not user.is_superuser and not permission_context(user).is_gerente:
             raise PermissionDenied('Apenas gerentes podem criar Centros de Treinamento.')
         serializer.save(gerente=user)
     
@@ -210,31 +376,24 @@ class CentroTreinamentoViewSet(viewsets.ModelViewSet):
         Listar apenas os CTs do gerente autenticado
         """
         user = request.user
-        
-        # Debug logs
-        print(f"User: {user}, Authenticated: {user.is_authenticated}")
-        print(f"Has usuario: {hasattr(user, 'usuario')}")
-        
-        if hasattr(user, 'usuario'):
-            print(f"Tipo: {user.usuario.tipo}")
+        perfil = permission_context(user)
         
         # Verificar se o usuário tem perfil
-        if not hasattr(user, 'usuario'):
+        if not perfil.tem_perfil:
             return Response(
                 {'detail': 'Usuário sem perfil associado'},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
         # Verificar se é gerente
-        if user.usuario.tipo != Usuario.Tipo.GERENTE:
+        if not perfil.is_gerente:
             return Response(
                 {'detail': 'Apenas gerentes podem acessar este endpoint'},
                 status=status.HTTP_403_FORBIDDEN
             )
         
         # Filtrar CTs do gerente
-        cts = CentroTreinamento.objects.filter(gerente=user)
-        print(f"CTs encontrados: {cts.count()}")
+        cts = self._leitura(CentroTreinamento.objects.filter(gerente_id=user.pk))
         serializer = self.get_serializer(cts, many=True)
         return Response(serializer.data)
     
@@ -245,9 +404,31 @@ class CentroTreinamentoViewSet(viewsets.ModelViewSet):
         """
         ct = self.get_object()
         hoje = timezone.localdate()
-        treinos = ct.treinos.filter(data__gte=hoje)
-        serializer = TreinoSerializer(treinos, many=True)
-        return Response(serializer.data)
+        futuros = ct.treinos.filter(data__gte=hoje)
+        treinos = _relacoes_treino(futuros, request)
+
+        if lazy_materialization_enabled():
+            # Mesma paginação por cursor de `TreinoViewSet.list`: cada página expande só o
+            # trecho da agenda que alcança. Ocorrências virtuais dependem de agendamentos/
+            # exceções/bloqueios (sem `atualizado_em`): sem validação condicional.
+            agendamentos = _agendamentos_para_ocorrencias().filter(ct=ct)
+            fim = hoje + timedelta(days=virtual_horizon_days())
+
+            def fetch(after, limit):
+                return pagina_ocorrencias(treinos, agendamentos, hoje, fim, limit, _posicao_ocorrencia(after))
+
+            page = self.paginator.paginate_rows(fetch, _cursor_ocorrencia, 4, request, view=self)
+            serializer = TreinoSerializer(page, many=True, context=self.get_serializer_context())
+            return self.get_paginated_response(serializer.data)
+
+        def render():
+            serializer = TreinoSerializer(treinos, many=True, context=self.get_serializer_context())
+            return Response(serializer.data)
+
+        estado, atualizado = _estado_treinos(futuros)
+        return respond_conditionally(
+            request, (hoje, ct.atualizado_em, *estado), _mais_recente(atualizado, ct.atualizado_em), render
+        )
     
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def add_professor(self, request, pk=None):
@@ -299,12 +480,13 @@ class ProfessorCentroTreinamentoViewSet(
         user = self.request.user
         if user.is_superuser:
             return qs
-        if not hasattr(user, 'usuario'):
+        perfil = permission_context(user)
+        if not perfil.tem_perfil:
             return qs.none()
-        if user.usuario.tipo == Usuario.Tipo.GERENTE:
-            return qs.filter(ct__gerente=user)
-        if user.usuario.tipo == Usuario.Tipo.PROFESSOR:
-            return qs.filter(professor=user)
+        if perfil.is_gerente:
+            return qs.filter(ct__gerente_id=user.pk)
+        if perfil.is_professor:
+            return qs.filter(professor_id=user.pk)
         return qs.none()
 
     def update(self, request, *args, **kwargs):
@@ -344,49 +526,55 @@ class ProfessorCentroTreinamentoViewSet(
 class AgendamentoTreinoViewSet(viewsets.ModelViewSet):
     """ViewSet responsável pelo CRUD dos agendamentos de treinos recorrentes."""
 
-    queryset = (
-        AgendamentoTreino.objects
-        .select_related('ct', 'professor')
-        .prefetch_related('horarios')
-    )
+    queryset = AgendamentoTreino.objects.all()
     serializer_class = AgendamentoTreinoSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
         qs = super().get_queryset()
+        only, _ = sparse_params(self.request)
+        if _pede(only, 'ct_nome'):
+            qs = qs.select_related('ct')
+        if _pede(only, 'professor_nome'):
+            qs = qs.select_related('professor')
+        for relacao in ('horarios', 'excecoes'):
+            if _pede(only, relacao):
+                qs = qs.prefetch_related(relacao)
         user = self.request.user
         if user.is_superuser:
             return qs
-        if not hasattr(user, 'usuario'):
+        perfil = permission_context(user)
+        if not perfil.tem_perfil:
             return qs.none()
-        if user.usuario.tipo == Usuario.Tipo.GERENTE:
-            return qs.filter(ct__gerente=user)
-        if user.usuario.tipo == Usuario.Tipo.PROFESSOR:
-            return qs.filter(professor=user)
+        if perfil.is_gerente:
+            return qs.filter(ct__gerente_id=user.pk)
+        if perfil.is_professor:
+            return qs.filter(professor_id=user.pk)
         return qs.none()
 
     def perform_create(self, serializer):
         user = self.request.user
         if user.is_superuser:
             instance = serializer.save()
-            regenerate_agendamento_ocorrencias(instance)
+            schedule_regeneration(instance)
             return
 
-        if not hasattr(user, 'usuario'):
+        perfil = permission_context(user)
+        if not perfil.tem_perfil:
             raise PermissionDenied('Usuário sem perfil associado.')
 
         ct = serializer.validated_data.get('ct')
         professor = serializer.validated_data.get('professor')
 
-        if user.usuario.tipo == Usuario.Tipo.GERENTE:
+        if perfil.is_gerente:
             if not ct or ct.gerente_id != user.id:
                 raise PermissionDenied('Apenas o gerente do CT pode criar agendamentos.')
             if not professor:
                 raise ValidationError({'professor': 'Informe o professor responsável pelo agendamento.'})
             _require_professor_associado(ct, professor.id)
             instance = serializer.save()
-        elif user.usuario.tipo == Usuario.Tipo.PROFESSOR:
-            vinculo = _professor_vinculo(ct, user.id)
+        elif perfil.is_professor:
+            vinculo = perfil.vinculo(ct.pk)
             if not vinculo:
                 raise PermissionDenied('Você não está associado a este CT.')
             if not vinculo.pode_criar_treino:
@@ -395,13 +583,80 @@ class AgendamentoTreinoViewSet(viewsets.ModelViewSet):
         else:
             raise PermissionDenied('Somente gerente ou professor podem criar agendamentos.')
 
-        regenerate_agendamento_ocorrencias(instance)
+        schedule_regeneration(instance)
 
     def perform_update(self, serializer):
         instance = self.get_object()
         self._ensure_can_mutate(instance, self.request.user, action='update')
         instance = serializer.save()
-        regenerate_agendamento_ocorrencias(instance)
+        schedule_regeneration(instance)
+
+    @action(detail=False, methods=['post'])
+    def preview(self, request):
+        """
+        Ocorrências que o agendamento geraria e os conflitos com treinos existentes, sem gravar nada
+        """
+        agendamento = None
+        if request.data.get('agendamento'):
+            agendamento = self.get_queryset().filter(pk=request.data.get('agendamento')).first()
+            if agendamento is None:
+                raise ValidationError({'agendamento': 'Agendamento não encontrado.'})
+        serializer = self.get_serializer(agendamento, data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        user = request.user
+        professor = data.get('professor') or getattr(agendamento, 'professor', None)
+        if professor is None and permission_context(user).is_professor:
+            professor = user
+        if professor is None:
+            raise ValidationError({'professor': 'Informe o professor responsável pelo agendamento.'})
+        try:
+            days = int(request.query_params.get('days', DEFAULT_WINDOW_DAYS))
+        except ValueError:
+            raise ValidationError({'days': 'Informe um número inteiro de dias.'})
+        days = max(0, min(days, max(DEFAULT_WINDOW_DAYS, virtual_horizon_days())))
+
+        preview = preview_agendamento(
+            data['ct'],
+            professor.pk,
+            data['horarios'],
+            data.get('excecoes', ()),
+            inicio_vigencia=data.get('inicio_vigencia'),
+            days_ahead=days,
+            agendamento=agendamento,
+        )
+        em_conflito = {(c.data, c.hora_inicio, c.hora_fim) for c in preview.conflitos}
+        return Response({
+            'inicio': preview.window.start,
+            'fim': preview.window.end,
+            'ocorrencias': [
+                {
+                    'data': data_ocorrencia,
+                    'hora_inicio': hora_inicio,
+                    'hora_fim': hora_fim,
+                    'conflito': (data_ocorrencia, hora_inicio, hora_fim) in em_conflito,
+                }
+                for data_ocorrencia, hora_inicio, hora_fim in preview.ocorrencias
+            ],
+            'conflitos': [asdict(conflito) for conflito in preview.conflitos],
+        })
+
+    @action(detail=True, methods=['get'], url_path='status')
+    def regeneracao_status(self, request, pk=None):
+        """
+        Situação da última regeneração (assíncrona) das ocorrências do agendamento
+        """
+        agendamento = self.get_object()
+        tarefa = (
+            TarefaRegeneracao.objects
+            .filter(agendamento=agendamento)
+            .order_by('-criado_em', '-pk')
+            .first()
+        )
+        if tarefa is None:
+            return Response({'agendamento': agendamento.pk, 'status': None})
+        return Response(TarefaRegeneracaoSerializer(tarefa).data)
 
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -411,18 +666,19 @@ class AgendamentoTreinoViewSet(viewsets.ModelViewSet):
     def _ensure_can_mutate(self, instance, user, action: str):
         if user.is_superuser:
             return
-        if not hasattr(user, 'usuario'):
+        perfil = permission_context(user)
+        if not perfil.tem_perfil:
             raise PermissionDenied('Usuário sem perfil associado.')
 
-        if user.usuario.tipo == Usuario.Tipo.GERENTE:
+        if perfil.is_gerente:
             if instance.ct.gerente_id != user.id:
                 raise PermissionDenied('Você não pode alterar este agendamento.')
             return
 
-        if user.usuario.tipo == Usuario.Tipo.PROFESSOR:
+        if perfil.is_professor:
             if instance.professor_id != user.id:
                 raise PermissionDenied('Você não pode alterar este agendamento.')
-            vinculo = _professor_vinculo(instance.ct, user.id)
+            vinculo = perfil.vinculo(instance.ct_id)
             if not vinculo:
                 raise PermissionDenied('Você não está associado a este CT.')
             if action == 'destroy':
@@ -446,12 +702,13 @@ class TreinoViewSet(viewsets.ModelViewSet):
     update/partial_update: Atualizar treino (apenas professor responsável)
     destroy: Deletar treino (apenas professor responsável)
     """
-    queryset = Treino.objects.select_related('ct', 'professor').all()
+    queryset = Treino.objects.all()
     serializer_class = TreinoSerializer
+    keyset_ordering = ('-data', 'hora_inicio', 'id')
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        queryset = super().get_queryset()
+        queryset = _relacoes_treino(super().get_queryset(), self.request)
 
         # Regra de plataforma: apenas treinos futuros por padrão
         hoje = timezone.localdate()
@@ -474,50 +731,256 @@ class TreinoViewSet(viewsets.ModelViewSet):
         if data_max:
             queryset = queryset.filter(data__lte=data_max)
 
-        user = self.request.user
-        if user.is_superuser:
-            return queryset
-        if not hasattr(user, 'usuario'):
-            return queryset.none()
-        if user.usuario.tipo == Usuario.Tipo.GERENTE:
-            return queryset.filter(ct__gerente=user)
-        if user.usuario.tipo == Usuario.Tipo.PROFESSOR:
-            return queryset.filter(professor=user)
-        # ALUNO: pode listar treinos futuros para se inscrever
-        return queryset
+        return _scope_agenda(queryset, self.request.user)
+
+    def _leitura_rapida(self):
+        # A projeção values() reproduz apenas a resposta completa (sem ?fields=/?expand=)
+        return (
+            getattr(settings, 'TREINO_LEITURA_RAPIDA', False)
+            and not lazy_materialization_enabled()
+            and sparse_params(self.request) == (None, None)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        if not self._leitura_rapida():
+            return super().retrieve(request, *args, **kwargs)
+        rows = treino_values(_filtrar_pk(self.filter_queryset(self.get_queryset()), kwargs['pk']))[:1]
+        data = serialize_treino_rows(rows)
+        if not data:
+            raise NotFound
+        return Response(data[0])
+
+    def list(self, request, *args, **kwargs):
+        if self._leitura_rapida():
+            rows = treino_values(self.filter_queryset(self.get_queryset()))
+            page = self.paginate_queryset(rows)
+            if page is not None:
+                return self.get_paginated_response(serialize_treino_rows(page))
+            return Response(serialize_treino_rows(rows))
+        if not lazy_materialization_enabled():
+            return super().list(request, *args, **kwargs)
+        # Modo lazy: treinos reais + ocorrências recorrentes calculadas em memória, sempre
+        # por cursor; cada página lê só o trecho da agenda que ela alcança.
+        treinos = self.filter_queryset(self.get_queryset())
+        agendamentos, inicio, fim = self._agenda_virtual()
+
+        def fetch(after, limit):
+            return pagina_ocorrencias(treinos, agendamentos, inicio, fim, limit, _posicao_ocorrencia(after))
+
+        page = self.paginator.paginate_rows(fetch, _cursor_ocorrencia, 4, request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['get'], renderer_classes=[CSVStreamRenderer, NDJSONStreamRenderer])
+    def export(self, request):
+        """
+        Exporta os treinos visíveis ao usuário (mesmos filtros da listagem) em CSV ou NDJSON.
+        Apenas treinos materializados; as linhas são lidas e enviadas em blocos.
+        """
+        queryset = self.filter_queryset(self.get_queryset()).order_by(*self.keyset_ordering)
+        return _exportar(request, TREINO_EXPORT_COLUMNS, exportar_treinos(queryset), 'treinos')
+
+    def _agenda_virtual(self):
+        params = self.request.query_params
+        hoje = timezone.localdate()
+        inicio = max(_safe_parse_date(params.get('data_min')) or hoje, hoje)
+        fim = hoje + timedelta(days=virtual_horizon_days())
+        data_max = _safe_parse_date(params.get('data_max'))
+        if data_max:
+            fim = min(fim, data_max)
+        agendamentos = _agendamentos_para_ocorrencias()
+        if params.get('ct'):
+            agendamentos = agendamentos.filter(ct_id=params.get('ct'))
+        return _scope_agenda(agendamentos, self.request.user), inicio, fim
+
+    @action(detail=False, methods=['post'])
+    def materializar(self, request):
+        """
+        Materializa uma ocorrência recorrente virtual (gerente do CT ou professor responsável)
+        """
+        chave = request.data.get('ocorrencia')
+        try:
+            agendamento_id = parse_ocorrencia_chave(chave)[0]
+        except OcorrenciaInvalida as exc:
+            raise ValidationError({'ocorrencia': str(exc)})
+        if permission_context(request.user).is_aluno:
+            raise PermissionDenied('Alunos materializam ocorrências ao se inscrever nelas.')
+        if not _scope_agenda(AgendamentoTreino.objects.all(), request.user).filter(pk=agendamento_id).exists():
+            raise PermissionDenied('Você não pode materializar esta ocorrência.')
+        try:
+            treino = materialize_ocorrencia(chave)
+        except OcorrenciaInvalida as exc:
+            raise ValidationError({'ocorrencia': str(exc)})
+        serializer = self.get_serializer(treino)
+        return Response(serializer.data)
     
     def perform_create(self, serializer):
         user = self.request.user
         if user.is_superuser:
+            self._ensure_sem_conflito(serializer, serializer.validated_data.get('professor'))
             serializer.save()
             return
 
-        if not hasattr(user, 'usuario'):
+        perfil = permission_context(user)
+        if not perfil.tem_perfil:
             raise PermissionDenied('Usuário sem perfil associado.')
 
         ct = serializer.validated_data.get('ct')
         professor = serializer.validated_data.get('professor')
 
-        if user.usuario.tipo == Usuario.Tipo.GERENTE:
+        if perfil.is_gerente:
             if not ct or ct.gerente_id != user.id:
                 raise PermissionDenied('Apenas o gerente do CT pode criar treinos.')
             if not professor:
                 raise ValidationError({'professor': 'Informe o professor responsável pelo treino.'})
             _require_professor_associado(ct, professor.id)
+            self._ensure_sem_conflito(serializer, professor)
             serializer.save()
             return
 
-        if user.usuario.tipo == Usuario.Tipo.PROFESSOR:
-            vinculo = _professor_vinculo(ct, user.id)
+        if perfil.is_professor:
+            vinculo = perfil.vinculo(ct.pk)
             if not vinculo:
                 raise PermissionDenied('Você não está associado a este CT.')
             if not vinculo.pode_criar_treino:
                 raise PermissionDenied('Você não tem permissão para criar treinos neste CT.')
+            self._ensure_sem_conflito(serializer, user)
             serializer.save(professor=user)
             return
 
         raise PermissionDenied('Somente gerente ou professor podem criar treinos.')
 
+    def perform_update(self, serializer):
+        self._ensure_sem_conflito(
+            serializer,
+            serializer.validated_data.get('professor', serializer.instance.professor),
+            instance=serializer.instance,
+        )
+        serializer.save()
+
+    def _autorizar_criacao(self, cts, pares):
+        """Regras de `perform_create`, avaliadas uma vez por CT e por (ct, professor)."""
+        user = self.request.user
+        perfil = permission_context(user)
+        if not user.is_superuser:
+            if not perfil.tem_perfil:
+                raise PermissionDenied('Usuário sem perfil associado.')
+            if perfil.is_professor:
+                for ct_id, professor_id in pares:
+                    vinculo = perfil.vinculo(ct_id)
+                    if professor_id != user.id:
+                        raise PermissionDenied('Professores só podem manipular seus próprios treinos.')
+                    if vinculo is None:
+                        raise PermissionDenied('Você não está associado a este CT.')
+                    if not vinculo.pode_criar_treino:
+                        raise PermissionDenied('Você não tem permissão para criar treinos neste CT.')
+                return
+            if not perfil.is_gerente:
+                raise PermissionDenied('Somente gerente ou professor podem criar treinos.')
+            if not all(perfil.gerencia(ct) for ct in cts.values()):
+                raise PermissionDenied('Apenas o gerente do CT pode criar treinos.')
+
+        # Gerente/superusuário escolhe o professor: vínculos de terceiros em uma consulta
+        associados = set(
+            ProfessorCentroTreinamento.objects.filter(
+                ct_id__in={ct_id for ct_id, _ in pares},
+                professor_id__in={professor_id for _, professor_id in pares},
+            ).values_list('ct_id', 'professor_id')
+        )
+        if not pares <= associados:
+            raise PermissionDenied('Professor não está associado a este CT.')
+
+    def _professor_padrao(self):
+        user = self.request.user
+        if not user.is_superuser and permission_context(user).is_professor:
+            return user.id
+        return None
+
+    @swagger_auto_schema(method='post', request_body=TreinoLoteSerializer, security=[{'Bearer': []}])
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Criar vários treinos avulsos de uma vez (tudo ou nada em caso de conflito de horário)
+        """
+        serializer = TreinoLoteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        itens = serializer.validated_data['treinos']
+        professor_padrao = self._professor_padrao()
+        for item in itens:
+            if professor_padrao is not None:
+                item.setdefault('professor', professor_padrao)
+            elif 'professor' not in item:
+                raise ValidationError({'professor': 'Informe o professor responsável pelo treino.'})
+
+        cts = CentroTreinamento.objects.in_bulk({item['ct'] for item in itens})
+        if len(cts) != len({item['ct'] for item in itens}):
+            raise ValidationError({'ct': 'Centro de Treinamento não encontrado.'})
+        self._autorizar_criacao(cts, {(item['ct'], item['professor']) for item in itens})
+        professores = User.objects.in_bulk({item['professor'] for item in itens})
+
+        treinos = [
+            Treino(**{**item, 'ct': cts[item['ct']], 'professor': professores[item['professor']]})
+            for item in itens
+        ]
+        criados, conflitos = criar_treinos_em_lote(treinos)
+        if conflitos:
+            raise ValidationError({
+                'detail': 'Conflito de horário com outro treino do professor.',
+                'conflitos': [asdict(conflito) for conflito in conflitos],
+            })
+        return Response(self.get_serializer(criados, many=True).data, status=status.HTTP_201_CREATED)
+
+    @swagger_auto_schema(method='post', request_body=ClonarSemanaSerializer, security=[{'Bearer': []}])
+    @action(detail=False, methods=['post'], url_path='clonar-semana')
+    def clonar_semana(self, request):
+        """
+        Copiar os treinos avulsos de uma semana do CT para outra semana (conflitos são pulados)
+        """
+        serializer = ClonarSemanaSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        ct = data['ct']
+        professor_id = data.get('professor') or self._professor_padrao()
+
+        copias = copias_da_semana(ct.pk, data['origem'], data['destino'], professor_id)
+        pares = {(ct.pk, copia.professor_id) for copia in copias}
+        if professor_id is not None:
+            pares.add((ct.pk, professor_id))
+        self._autorizar_criacao({ct.pk: ct}, pares)
+
+        professores = User.objects.in_bulk({professor for _, professor in pares})
+        for copia in copias:
+            copia.ct = ct
+            copia.professor = professores[copia.professor_id]
+        criados, conflitos = criar_treinos_em_lote(copias, parcial=True)
+        return Response(
+            {'criados': self.get_serializer(criados, many=True).data, 'conflitos': [asdict(conflito) for conflito in conflitos]},
+            status=status.HTTP_201_CREATED,
+        )
+
+    def _ensure_sem_conflito(self, serializer, professor, instance=None):
+        """Rejeita treinos que sobrepõem outro treino do professor (em qualquer CT)."""
+        if professor is None:
+            return
+        campos = serializer.validated_data
+
+        def valor(campo):
+            return campos.get(campo, getattr(instance, campo, None))
+
+        slot = (valor('data'), valor('hora_inicio'), valor('hora_fim'))
+        if None in slot:
+            return
+        conflitos = find_conflicts(
+            [slot],
+            professor.pk,
+            exclude_treino_ids=[instance.pk] if instance is not None else (),
+        )
+        if conflitos:
+            raise ValidationError({
+                'detail': 'Conflito de horário com outro treino do professor.',
+                'conflitos': [asdict(conflito) for conflito in conflitos],
+            })
+
     def update(self, request, *args, **kwargs):
         instance = self.get_object()
         self._ensure_manual(instance)
@@ -543,16 +1006,17 @@ class TreinoViewSet(viewsets.ModelViewSet):
     def _ensure_can_mutate(self, instance: Treino, user, action: str):
         if user.is_superuser:
             return
-        if not hasattr(user, 'usuario'):
+        perfil = permission_context(user)
+        if not perfil.tem_perfil:
             raise PermissionDenied('Usuário sem perfil associado.')
-        if user.usuario.tipo == Usuario.Tipo.GERENTE:
+        if perfil.is_gerente:
             if instance.ct.gerente_id != user.id:
                 raise PermissionDenied('Você não pode alterar este treino.')
             return
-        if user.usuario.tipo == Usuario.Tipo.PROFESSOR:
+        if perfil.is_professor:
             if instance.professor_id != user.id:
                 raise PermissionDenied('Você não pode alterar este treino.')
-            vinculo = _professor_vinculo(instance.ct, user.id)
+            vinculo = perfil.vinculo(instance.ct_id)
             if not vinculo:
                 raise PermissionDenied('Você não está associado a este CT.')
             if action == 'destroy':
@@ -590,24 +1054,34 @@ class InscricaoViewSet(viewsets.ModelViewSet):
     update/partial_update: Atualizar status da inscrição
     destroy: Cancelar inscrição
     """
-    queryset = Inscricao.objects.select_related('treino', 'aluno').all()
+    queryset = Inscricao.objects.all()
     serializer_class = InscricaoSerializer
     permission_classes = [IsAuthenticated]
+    keyset_ordering = ('-criado_em', '-id')
     
     def get_queryset(self):
         queryset = super().get_queryset()
+        only, expand = sparse_params(self.request)
+        if _pede(only, 'aluno_nome'):
+            queryset = queryset.select_related('aluno')
+        if (only is None and expand is None) or 'treino' in (expand or ()):
+            # treino_detalhes: treino + CT + professor em uma consulta (vagas vêm dos contadores)
+            queryset = queryset.prefetch_related(
+                Prefetch('treino', queryset=Treino.objects.select_related('ct', 'professor'))
+            )
 
         user = self.request.user
+        perfil = permission_context(user)
         if user.is_superuser:
             scoped = queryset
-        elif not hasattr(user, 'usuario'):
+        elif not perfil.tem_perfil:
             scoped = queryset.none()
-        elif user.usuario.tipo == Usuario.Tipo.ALUNO:
-            scoped = queryset.filter(aluno=user)
-        elif user.usuario.tipo == Usuario.Tipo.PROFESSOR:
-            scoped = queryset.filter(treino__professor=user)
-        elif user.usuario.tipo == Usuario.Tipo.GERENTE:
-            scoped = queryset.filter(treino__ct__gerente=user)
+        elif perfil.is_aluno:
+            scoped = queryset.filter(aluno_id=user.pk)
+        elif perfil.is_professor:
+            scoped = queryset.filter(treino__professor_id=user.pk)
+        elif perfil.is_gerente:
+            scoped = queryset.filter(treino__ct__gerente_id=user.pk)
         else:
             scoped = queryset.none()
         
@@ -625,12 +1099,61 @@ class InscricaoViewSet(viewsets.ModelViewSet):
         
         return scoped
     
-    def perform_create(self, serializer):
+    def _ensure_aluno(self):
         user = self.request.user
-        if not hasattr(user, 'usuario') or user.usuario.tipo != Usuario.Tipo.ALUNO:
+        if not permission_context(user).is_aluno:
             raise PermissionDenied('Apenas alunos podem se inscrever em treinos.')
-        serializer.save(aluno=user)
+        return user
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        treino = serializer.validated_data['treino']
+        if treino.pk is None:
+            # Ocorrência virtual validada: só agora vira linha de Treino
+            try:
+                treino = serializer.validated_data['treino'] = materialize_ocorrencia(treino.ocorrencia_chave)
+            except OcorrenciaInvalida as exc:
+                raise ValidationError({'ocorrencia': str(exc)})
+        if treino.sorteio_pendente:
+            # Janela de sorteio: só registra o pedido; `sortear_inscricoes` cria a inscrição
+            registrar_intencao(treino.pk, self._ensure_aluno())
+            return Response(
+                {'treino': treino.pk, 'sorteio_encerra_em': treino.sorteio_encerra_em},
+                status=status.HTTP_202_ACCEPTED,
+            )
+        self.perform_create(serializer)
+        headers = self.get_success_headers(serializer.data)
+        return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
+
+    def perform_create(self, serializer):
+        serializer.save(aluno=self._ensure_aluno())
+
+    @swagger_auto_schema(method='post', request_body=InscricaoLoteSerializer, security=[{'Bearer': []}])
+    @action(detail=False, methods=['post'], url_path='batch')
+    def batch(self, request):
+        """
+        Inscrever o aluno em vários treinos de uma vez, com resultado por treino
+        """
+        aluno = self._ensure_aluno()
+        serializer = InscricaoLoteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        resultados = inscrever_em_lote(aluno, serializer.validated_data['treinos'])
+        criadas = sum(1 for resultado in resultados if resultado.inscricao is not None)
+        return Response(
+            {'inscritos': criadas, 'resultados': [asdict(resultado) for resultado in resultados]},
+            status=status.HTTP_201_CREATED if criadas else status.HTTP_200_OK,
+        )
     
+    @action(detail=False, methods=['get'], renderer_classes=[CSVStreamRenderer, NDJSONStreamRenderer])
+    def export(self, request):
+        """
+        Exporta as inscrições visíveis ao usuário (gerente: as dos seus CTs) em CSV ou NDJSON.
+        Aceita os mesmos filtros da listagem; as linhas são lidas e enviadas em blocos.
+        """
+        queryset = self.filter_queryset(self.get_queryset()).order_by(*self.keyset_ordering)
+        return _exportar(request, INSCRICAO_EXPORT_COLUMNS, exportar_inscricoes(queryset), 'inscricoes')
+
     @action(detail=True, methods=['post'])
     def confirmar(self, request, pk=None):
         """
@@ -639,8 +1162,10 @@ class InscricaoViewSet(viewsets.ModelViewSet):
         inscricao = self.get_object()
         if not request.user.is_superuser and inscricao.aluno_id != request.user.id:
             raise PermissionDenied('Você não pode confirmar esta inscrição.')
-        inscricao.status = Inscricao.Status.CONFIRMADA
-        inscricao.save()
+        try:
+            inscricao = confirmar_inscricao(inscricao)
+        except (ConfirmacaoInvalida, TreinoLotado) as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_409_CONFLICT)
         serializer = self.get_serializer(inscricao)
         return Response(serializer.data)
     
@@ -652,7 +1177,7 @@ class InscricaoViewSet(viewsets.ModelViewSet):
         inscricao = self.get_object()
         if not request.user.is_superuser and inscricao.aluno_id != request.user.id:
             raise PermissionDenied('Você não pode cancelar esta inscrição.')
-        inscricao.delete()
+        cancelar_inscricao(inscricao, excluir=True)
         return Response(
             {'message': 'Inscrição cancelada com sucesso'},
             status=status.HTTP_200_OK
@@ -665,6 +1190,10 @@ class InscricaoViewSet(viewsets.ModelViewSet):
             raise PermissionDenied('Você não pode cancelar esta inscrição.')
         return super().destroy(request, *args, **kwargs)
 
+    def perform_destroy(self, instance):
+        # A vaga liberada vai para o primeiro da lista de espera
+        cancelar_inscricao(instance, excluir=True)
+
 
 class UsuarioViewSet(viewsets.ReadOnlyModelViewSet):
     """
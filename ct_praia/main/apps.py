@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class MainConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'main'
+
+    def ready(self):
+        from . import metrics, signals
+
+        metrics.connect_signals()
+        signals.connect_signals()
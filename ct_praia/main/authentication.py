@@ -0,0 +1,84 @@
+from django.contrib.auth import get_user_model
+from django.utils.functional import cached_property
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.tokens import RefreshToken
+
+User = get_user_model()
+
+# Claim de autorização gravada nos tokens emitidos por `tokens_para`
+CLAIM_TIPO = 'tipo'
+
+
+def tokens_para(user) -> RefreshToken:
+    """Refresh token (e o access derivado dele) com o papel do usuário nas claims.
+
+    O papel vale até o token expirar; escritas sempre recarregam o usuário do banco.
+    Os CTs do usuário não viajam no token: um CT criado ou vinculado depois da emissão
+    ficaria fora do escopo até o próximo login, e o escopo por CT já é um filtro da
+    própria consulta da listagem (não custa uma consulta a mais).
+    """
+    usuario = getattr(user, 'usuario', None)
+    refresh = RefreshToken.for_user(user)
+    refresh['username'] = user.get_username()
+    refresh['is_superuser'] = user.is_superuser
+    refresh[CLAIM_TIPO] = usuario.tipo if usuario is not None else None
+    return refresh
+
+
+class TokenUsuario(TokenUser):
+    """Usuário das leituras autenticadas por JWT, montado só com as claims do token.
+
+    Atende `IsAuthenticated` e as checagens de papel (`permission_context`) sem consultas.
+    Atributos fora das claims (nome, e-mail, perfil...) carregam o `User` uma única vez.
+    """
+
+    @cached_property
+    def tipo(self):
+        return self.token[CLAIM_TIPO]
+
+    @cached_property
+    def _user(self):
+        try:
+            return User.objects.get(pk=self.pk, is_active=True)
+        except User.DoesNotExist:
+            raise AuthenticationFailed('Usuário não encontrado.', code='user_not_found')
+
+    def __getattr__(self, attr):
+        if attr.startswith('_'):
+            raise AttributeError(attr)
+        return getattr(self._user, attr)
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """`JWTAuthentication` que dispensa o banco em leituras (GET/HEAD/OPTIONS).
+
+    Tokens com as claims de `tokens_para` viram `TokenUsuario` nos métodos seguros; escritas
+    e tokens antigos (sem as claims) continuam resolvendo o `User` no banco.
+
+    Tokens de superusuário não usam as claims: a flag só é confiável vinda do banco, então
+    essas leituras também carregam o `User` (e um superusuário rebaixado perde o acesso).
+
+    Compromisso assumido: as demais leituras não conferem `is_active` nem o papel atual. Um
+    usuário desativado (ou que mudou de papel) continua lendo com o papel antigo até o access
+    token expirar (`SIMPLE_JWT['ACCESS_TOKEN_LIFETIME']`); um novo login e qualquer escrita já
+    o recusam. Para encurtar essa janela, reduza o tempo de vida do access token.
+    """
+
+    def authenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        if (
+            request.method in SAFE_METHODS
+            and CLAIM_TIPO in validated_token
+            and not validated_token.get('is_superuser', False)
+        ):
+            return TokenUsuario(validated_token), validated_token
+        return self.get_user(validated_token), validated_token
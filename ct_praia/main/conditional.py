@@ -0,0 +1,27 @@
+"""Conditional GET (ETag / Last-Modified) for the public API listings."""
+
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+
+def respond_conditionally(request, state, last_modified, render):
+    """Answer `304 Not Modified` when the client already has `state`; otherwise `render()`.
+
+    `state` é um agregado barato do escopo (ex.: maior `atualizado_em` + quantidade de
+    linhas) e entra no ETag junto com a URL completa (filtros, página, `fields`...).
+    Nada é serializado quando o cliente está atualizado.
+    """
+    digest = hashlib.sha1(repr((request.get_full_path(), *state)).encode()).hexdigest()
+    etag = quote_etag(digest)
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+
+    cached = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    response = Response(status=cached.status_code) if cached is not None else render()
+    if response.status_code in (200, 304):
+        response["ETag"] = etag
+        if timestamp is not None:
+            response["Last-Modified"] = http_date(timestamp)
+    return response
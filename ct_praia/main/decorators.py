@@ -4,6 +4,7 @@ from django.contrib.auth.decorators import login_required
 from django.shortcuts import redirect
 
 from .models import Usuario
+from .permissions import permission_context
 
 
 def role_required(*allowed_tipos: str):
@@ -19,16 +20,16 @@ def role_required(*allowed_tipos: str):
         @wraps(view_func)
         @login_required
         def _wrapped(request, *args, **kwargs):
-            user = request.user
+            perfil = permission_context(request.user)
             # Must have associated Usuario profile and be an allowed tipo
-            if not hasattr(user, "usuario"):
+            if not perfil.tem_perfil:
                 # Usuário autenticado mas sem perfil: envia para home genérica
                 return redirect("home")
-            if user.usuario.tipo not in allowed_tipos:
+            if perfil.tipo not in allowed_tipos:
                 # Redireciona para a landing do seu perfil
-                if user.usuario.tipo == Usuario.Tipo.ALUNO:
+                if perfil.is_aluno:
                     return redirect("meus_treinos")
-                if user.usuario.tipo == Usuario.Tipo.PROFESSOR:
+                if perfil.is_professor:
                     return redirect("prof_dashboard")
                 return redirect("home")
             return view_func(request, *args, **kwargs)
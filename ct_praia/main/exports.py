@@ -0,0 +1,115 @@
+import csv
+import io
+import json
+from itertools import islice
+
+from rest_framework import serializers
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from .serializers import serialize_treino_rows, treino_values
+
+# Linhas por ida ao banco (cursor do servidor) e por pedaço enviado ao cliente
+EXPORT_CHUNK_SIZE = 2000
+
+TREINO_EXPORT_COLUMNS = (
+    'id', 'ct', 'ct_nome', 'professor', 'professor_nome', 'modalidade', 'data', 'hora_inicio',
+    'hora_fim', 'vagas', 'vagas_disponiveis', 'nivel', 'observacoes', 'agendado', 'agendamento', 'ocorrencia',
+    'sorteio_encerra_em',
+)
+
+INSCRICAO_EXPORT_COLUMNS = (
+    'id', 'status', 'criado_em', 'aluno', 'aluno_username', 'aluno_nome',
+    'treino', 'ct', 'ct_nome', 'modalidade', 'data', 'hora_inicio', 'hora_fim',
+)
+
+INSCRICAO_EXPORT_VALUES = (
+    'id', 'status', 'criado_em', 'aluno_id', 'aluno__username', 'aluno__first_name', 'aluno__last_name',
+    'treino_id', 'treino__ct_id', 'treino__ct__nome', 'treino__modalidade',
+    'treino__data', 'treino__hora_inicio', 'treino__hora_fim',
+)
+
+
+def _lotes(rows, size=EXPORT_CHUNK_SIZE):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+def _sem_prefetch(queryset):
+    # values() + iterator() não usam os prefetches das listagens
+    return queryset.prefetch_related(None)
+
+
+def exportar_treinos(queryset):
+    """Linhas no formato de `TreinoSerializer`, lidas do banco em blocos."""
+    rows = treino_values(_sem_prefetch(queryset)).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    for batch in _lotes(rows):
+        yield from serialize_treino_rows(batch)
+
+
+def exportar_inscricoes(queryset):
+    """Inscrições com aluno e treino achatados em uma linha, lidas do banco em blocos."""
+    criado_repr = serializers.DateTimeField().to_representation
+    data_repr = serializers.DateField().to_representation
+    hora_repr = serializers.TimeField().to_representation
+    rows = _sem_prefetch(queryset).values(*INSCRICAO_EXPORT_VALUES).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    for row in rows:
+        yield {
+            'id': row['id'],
+            'status': row['status'],
+            'criado_em': criado_repr(row['criado_em']),
+            'aluno': row['aluno_id'],
+            'aluno_username': row['aluno__username'],
+            'aluno_nome': f"{row['aluno__first_name']} {row['aluno__last_name']}".strip(),
+            'treino': row['treino_id'],
+            'ct': row['treino__ct_id'],
+            'ct_nome': row['treino__ct__nome'],
+            'modalidade': row['treino__modalidade'],
+            'data': data_repr(row['treino__data']),
+            'hora_inicio': hora_repr(row['treino__hora_inicio']),
+            'hora_fim': hora_repr(row['treino__hora_fim']),
+        }
+
+
+class StreamRenderer(BaseRenderer):
+    """Base dos renderers de exportação; cada formato define `stream(columns, rows)`, que
+    gera o corpo em pedaços para `StreamingHttpResponse`.
+
+    `render()` só é usado para respostas comuns da view (erros de autenticação/permissão).
+    """
+
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        rows = data if isinstance(data, list) else [data]
+        columns = list(rows[0]) if rows and isinstance(rows[0], dict) else []
+        return b''.join(self.stream(columns, rows))
+
+
+class CSVStreamRenderer(StreamRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, columns, rows):
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction='ignore')
+        writer.writeheader()
+        for batch in _lotes(rows):
+            writer.writerows(batch)
+            yield buffer.getvalue().encode(self.charset)
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode(self.charset)
+
+
+class NDJSONStreamRenderer(StreamRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def stream(self, columns, rows):
+        for batch in _lotes(rows):
+            yield ''.join(
+                json.dumps(row, cls=JSONEncoder, ensure_ascii=False) + '\n' for row in batch
+            ).encode(self.charset)
@@ -2,6 +2,7 @@ from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import get_user_model
 from .models import CentroTreinamento, Treino, Usuario
+from .permissions import permission_context
 
 User = get_user_model()
 
@@ -73,15 +74,16 @@ class TreinoForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         # Limita CTs se usuário professor informado
         if self.user and not self.user.is_superuser:
-            if hasattr(self.user, "usuario") and self.user.usuario.tipo == Usuario.Tipo.PROFESSOR:
+            if permission_context(self.user).is_professor:
                 self.fields["ct"].queryset = CentroTreinamento.objects.filter(professores=self.user).order_by("nome")
 
     def clean_ct(self):
         ct = self.cleaned_data.get("ct")
         if self.user and ct and not self.user.is_superuser:
-            if hasattr(self.user, "usuario") and self.user.usuario.tipo == Usuario.Tipo.PROFESSOR:
+            perfil = permission_context(self.user)
+            if perfil.is_professor:
                 # Double check de segurança
-                if not ct.professores.filter(pk=self.user.pk).exists():
+                if perfil.vinculo(ct.pk) is None:
                     raise forms.ValidationError("Você não está associado a este CT.")
         return ct
 
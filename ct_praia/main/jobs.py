@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import AgendamentoTreino, TarefaRegeneracao
+from .recurrence import prefetch_recurrence
+from .services import regenerate_agendamento_ocorrencias
+
+
+RETRY_BASE_DELAY = timedelta(seconds=30)
+DEFAULT_LEASE_SECONDS = 600
+
+
+def async_regeneration_enabled() -> bool:
+    return getattr(settings, "AGENDAMENTO_REGENERACAO_ASSINCRONA", False)
+
+
+def job_lease() -> timedelta:
+    """How long a claimed job may stay EXECUTANDO before another worker may take it over."""
+    return timedelta(seconds=getattr(settings, "REGENERACAO_LEASE_SEGUNDOS", DEFAULT_LEASE_SECONDS))
+
+
+def _runnable_jobs(now):
+    """PENDENTE jobs that are due, plus EXECUTANDO jobs whose worker outlived the lease."""
+    expired = now - job_lease()
+    return TarefaRegeneracao.objects.filter(
+        Q(status=TarefaRegeneracao.Status.PENDENTE, executar_apos__lte=now)
+        | Q(
+            status=TarefaRegeneracao.Status.EXECUTANDO,
+            iniciado_em__lt=expired,
+            tentativas__lt=F("max_tentativas"),
+        )
+    )
+
+
+def fail_exhausted_jobs(now=None) -> int:
+    """Mark as FALHOU the abandoned EXECUTANDO jobs that have no attempts left."""
+    now = now or timezone.now()
+    return TarefaRegeneracao.objects.filter(
+        status=TarefaRegeneracao.Status.EXECUTANDO,
+        iniciado_em__lt=now - job_lease(),
+        tentativas__gte=F("max_tentativas"),
+    ).update(
+        status=TarefaRegeneracao.Status.FALHOU,
+        erro="Worker abandonou a tarefa (lease expirado).",
+        concluido_em=now,
+        atualizado_em=now,
+    )
+
+
+def enqueue_regeneration(agendamento: AgendamentoTreino) -> TarefaRegeneracao:
+    """Return the pending job of `agendamento`, creating one when there is none."""
+    pending = TarefaRegeneracao.objects.filter(
+        agendamento=agendamento, status=TarefaRegeneracao.Status.PENDENTE
+    )
+    tarefa = pending.first()
+    if tarefa is not None:
+        return tarefa
+    try:
+        with transaction.atomic():
+            return TarefaRegeneracao.objects.create(agendamento=agendamento)
+    except IntegrityError:
+        # Outra requisição enfileirou ao mesmo tempo (restrição de pendente única).
+        return pending.get()
+
+
+def schedule_regeneration(agendamento: AgendamentoTreino) -> TarefaRegeneracao | None:
+    """Enqueue when the async mode is on; otherwise regenerate inline (legacy behaviour)."""
+    if async_regeneration_enabled():
+        return enqueue_regeneration(agendamento)
+    regenerate_agendamento_ocorrencias(agendamento)
+    return None
+
+
+def claim_next_job() -> TarefaRegeneracao | None:
+    """Atomically move the oldest runnable job to EXECUTANDO.
+
+    Jobs left EXECUTANDO by a worker that died are taken over once `iniciado_em`
+    is older than the lease; `iniciado_em` is renewed on every claim, so the
+    lease must be longer than the slowest regeneration.
+    """
+    fail_exhausted_jobs()
+    while True:
+        now = timezone.now()
+        candidate = (
+            _runnable_jobs(now)
+            .order_by("executar_apos", "pk")
+            .values_list("pk", flat=True)
+            .first()
+        )
+        if candidate is None:
+            return None
+        claimed = _runnable_jobs(now).filter(pk=candidate).update(
+            status=TarefaRegeneracao.Status.EXECUTANDO,
+            tentativas=F("tentativas") + 1,
+            iniciado_em=now,
+            atualizado_em=now,
+        )
+        if claimed:
+            return TarefaRegeneracao.objects.select_related("agendamento").get(pk=candidate)
+        # Outro worker pegou a mesma tarefa; tenta a próxima.
+
+
+def run_job(tarefa: TarefaRegeneracao) -> TarefaRegeneracao:
+    """Execute a claimed job, recording the result or scheduling a retry."""
+    try:
+        agendamento = prefetch_recurrence(AgendamentoTreino.objects).get(pk=tarefa.agendamento_id)
+        result = regenerate_agendamento_ocorrencias(agendamento)
+    except Exception as exc:  # qualquer falha vira nova tentativa ou FALHOU
+        tarefa.erro = f"{type(exc).__name__}: {exc}"
+        if tarefa.tentativas < tarefa.max_tentativas:
+            tarefa.status = TarefaRegeneracao.Status.PENDENTE
+            tarefa.executar_apos = timezone.now() + RETRY_BASE_DELAY * (2 ** (tarefa.tentativas - 1))
+        else:
+            tarefa.status = TarefaRegeneracao.Status.FALHOU
+            tarefa.concluido_em = timezone.now()
+        try:
+            with transaction.atomic():
+                tarefa.save()
+        except IntegrityError:
+            # Já existe uma nova tarefa pendente para o agendamento; ela refará o trabalho.
+            tarefa.status = TarefaRegeneracao.Status.FALHOU
+            tarefa.concluido_em = timezone.now()
+            tarefa.save()
+        return tarefa
+
+    tarefa.status = TarefaRegeneracao.Status.CONCLUIDA
+    tarefa.criadas = result.created
+    tarefa.atualizadas = result.updated
+    tarefa.removidas = result.deleted
+    tarefa.erro = ""
+    tarefa.concluido_em = timezone.now()
+    tarefa.save()
+    return tarefa
+
+
+def process_jobs(max_jobs: int | None = None) -> list[TarefaRegeneracao]:
+    """Drain the queue (up to `max_jobs`) and return the processed jobs."""
+    processed: list[TarefaRegeneracao] = []
+    while max_jobs is None or len(processed) < max_jobs:
+        tarefa = claim_next_job()
+        if tarefa is None:
+            break
+        processed.append(run_job(tarefa))
+    return processed
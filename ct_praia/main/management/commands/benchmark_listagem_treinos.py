@@ -0,0 +1,75 @@
+from datetime import time, timedelta
+from time import perf_counter
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from ...models import CentroTreinamento, Treino, Usuario
+from ...serializers import TreinoSerializer, serialize_treino_rows, treino_values
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara o TreinoSerializer com o caminho rápido baseado em values() "
+        "(TREINO_LEITURA_RAPIDA). Os dados de teste são criados e descartados em uma transação."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=10_000, help="Quantidade de treinos (default: 10000).")
+        parser.add_argument("--repeat", type=int, default=3, help="Execuções de cada caminho; vale a melhor (default: 3).")
+
+    def handle(self, *args, **options):
+        if options["rows"] < 1 or options["repeat"] < 1:
+            raise CommandError("--rows e --repeat devem ser maiores que zero.")
+        with transaction.atomic():
+            treinos = self._seed(options["rows"])
+            serializer_time, expected = self._best(
+                options["repeat"], lambda: TreinoSerializer(treinos.select_related("ct", "professor"), many=True).data
+            )
+            fast_time, obtained = self._best(options["repeat"], lambda: serialize_treino_rows(treino_values(treinos)))
+            if [dict(row) for row in expected] != obtained:
+                raise CommandError("O caminho rápido não reproduz a saída do TreinoSerializer.")
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"{options['rows']} treinos")
+        self.stdout.write(f"TreinoSerializer: {serializer_time * 1000:.0f} ms")
+        self.stdout.write(f"values():         {fast_time * 1000:.0f} ms")
+        self.stdout.write(self.style.SUCCESS(f"Ganho: {serializer_time / fast_time:.1f}x"))
+
+    def _best(self, repeat, run):
+        best, result = None, None
+        for _ in range(repeat):
+            start = perf_counter()
+            result = run()
+            elapsed = perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
+
+    def _seed(self, rows):
+        User = get_user_model()
+        professor = User.objects.create_user("benchmark_prof", first_name="Bench", last_name="Mark")
+        Usuario.objects.create(user=professor, tipo=Usuario.Tipo.PROFESSOR)
+        ct = CentroTreinamento.objects.create(
+            nome="CT Benchmark",
+            endereco="-",
+            contato="-",
+            modalidades="Vôlei",
+            cnpj="00.000.000/0000-00",
+        )
+        inicio = timezone.localdate() + timedelta(days=1)
+        Treino.objects.bulk_create(
+            Treino(
+                ct=ct,
+                professor=professor,
+                modalidade="Vôlei",
+                data=inicio + timedelta(days=index // 10),
+                hora_inicio=time(6 + index % 10),
+                hora_fim=time(7 + index % 10),
+                vagas=12,
+                nivel="Iniciante",
+            )
+            for index in range(rows)
+        )
+        return Treino.objects.filter(ct=ct).com_inscricoes_ativas()
@@ -1,14 +1,48 @@
-from django.core.management.base import BaseCommand
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
 from django.utils import timezone
 
 from ...models import AgendamentoTreino
 from ...services import (
+    DEFAULT_CHUNK_SIZE,
+    DEFAULT_PURGE_BATCH_SIZE,
     DEFAULT_WINDOW_DAYS,
+    RegenerationResult,
+    lazy_materialization_enabled,
     purge_future_treinos_beyond_window,
-    regenerate_agendamento_ocorrencias,
+    regenerate_shard,
+    shard_agendamentos,
+    virtual_horizon_days,
 )
 
 
+def _init_worker():
+    # Cada processo abre a sua própria conexão; nunca reutiliza a herdada do pai.
+    connections.close_all()
+
+
+def _mp_context():
+    # Os workers dependem de herdar o registro de apps já configurado pelo
+    # processo pai: com "spawn"/"forkserver" (padrão no macOS, no Windows e no
+    # Linux a partir do Python 3.14) este módulo seria reimportado antes de
+    # django.setup() e falharia com AppRegistryNotReady. Por isso --workers > 1
+    # exige uma plataforma com suporte a "fork".
+    try:
+        return multiprocessing.get_context("fork")
+    except ValueError:
+        raise CommandError("--workers > 1 requer suporte a multiprocessing 'fork' nesta plataforma.")
+
+
+def _run_shard(args):
+    try:
+        return regenerate_shard(*args)
+    finally:
+        connections.close_all()
+
+
 class Command(BaseCommand):
     help = (
         "Gera ocorrências de treinos para todos os agendamentos ativos e remove "
@@ -23,35 +57,120 @@ class Command(BaseCommand):
             default=DEFAULT_WINDOW_DAYS,
             help="Quantidade de dias no futuro que devem permanecer disponíveis (default: 30).",
         )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Quantidade de processos paralelos; agendamentos são divididos em shards por CT (default: 1).",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            dest="chunk_size",
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help=f"Quantidade de agendamentos carregados por consulta em cada shard (default: {DEFAULT_CHUNK_SIZE}).",
+        )
+        parser.add_argument(
+            "--purge-batch-size",
+            dest="purge_batch_size",
+            type=int,
+            default=DEFAULT_PURGE_BATCH_SIZE,
+            help=f"Treinos removidos por transação na limpeza além da janela (default: {DEFAULT_PURGE_BATCH_SIZE}).",
+        )
+        parser.add_argument(
+            "--no-raw-purge",
+            dest="raw_purge",
+            action="store_false",
+            help="Sempre usa o delete do ORM (com sinais) na limpeza, mesmo sem receivers conectados.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Apenas informa quantos treinos/inscrições seriam removidos; não altera o banco.",
+        )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help=(
+                "Acrescenta apenas as datas após a marca d'água de cada agendamento; "
+                "regenera a janela inteira só dos agendamentos alterados desde a última execução."
+            ),
+        )
 
     def handle(self, *args, **options):
         days_ahead = options["days_ahead"]
+        workers = options["workers"]
+        chunk_size = options["chunk_size"]
+        if workers < 1:
+            raise CommandError("--workers deve ser maior que zero.")
+        if chunk_size < 1:
+            raise CommandError("--chunk-size deve ser maior que zero.")
+        if options["purge_batch_size"] < 1:
+            raise CommandError("--purge-batch-size deve ser maior que zero.")
         today = timezone.localdate()
 
-        purged = purge_future_treinos_beyond_window(days_ahead=days_ahead)
-        if purged:
-            self.stdout.write(self.style.WARNING(f"Removidos {purged} treinos além de {days_ahead} dias."))
-
-        total_created = 0
-        agendamentos = (
-            AgendamentoTreino.objects
-            .select_related("ct", "professor")
-            .prefetch_related("horarios")
-        )
-        for agendamento in agendamentos:
-            created = regenerate_agendamento_ocorrencias(
-                agendamento,
-                start_date=today,
-                days_ahead=days_ahead,
+        # No modo lazy, ocorrências materializadas por inscrição valem até o horizonte virtual.
+        purge_days = max(days_ahead, virtual_horizon_days()) if lazy_materialization_enabled() else days_ahead
+        purged = purge_future_treinos_beyond_window(
+            days_ahead=purge_days,
+            batch_size=options["purge_batch_size"],
+            dry_run=options["dry_run"],
+            raw=options["raw_purge"],
+        )
+        if options["dry_run"]:
+            self.stdout.write(
+                f"[dry-run] Seriam removidos {purged.treinos} treinos além de {purge_days} dias "
+                f"({purged.inscricoes} inscrições). Nenhuma ocorrência foi gerada."
             )
-            total_created += created
+            return
+        if purged:
             self.stdout.write(
-                self.style.SUCCESS(
-                    f"Agendamento {agendamento.pk}: {created} ocorrências recriadas."
+                self.style.WARNING(
+                    f"Removidos {purged.treinos} treinos além de {purge_days} dias "
+                    f"({purged.inscricoes} inscrições, {purged.batches} lotes)."
                 )
             )
 
-        if total_created == 0 and purged == 0:
+        rows = AgendamentoTreino.objects.order_by("pk").values_list("pk", "ct_id")
+        shards = shard_agendamentos(rows, workers)
+        tasks = [
+            (index, ids, today, days_ahead, chunk_size, options["incremental"])
+            for index, ids in enumerate(shards)
+        ]
+
+        if workers == 1 or len(tasks) <= 1:
+            results = [_run_shard(task) for task in tasks]
+        else:
+            # Conexões abertas no processo pai não podem ser compartilhadas com os filhos.
+            connections.close_all()
+            with ProcessPoolExecutor(
+                max_workers=min(workers, len(tasks)),
+                mp_context=_mp_context(),
+                initializer=_init_worker,
+            ) as pool:
+                results = list(pool.map(_run_shard, tasks))
+
+        total = RegenerationResult()
+        for shard_result in results:
+            total += shard_result.result
+            self.stdout.write(
+                f"Shard {shard_result.shard}: {shard_result.agendamentos} agendamentos, "
+                f"{shard_result.result.created} criadas, {shard_result.result.updated} atualizadas, "
+                f"{shard_result.result.deleted} removidas em {shard_result.elapsed:.2f}s."
+            )
+
+        if not total.changed and not purged:
             self.stdout.write("Nenhuma alteração necessária.")
         else:
-            self.stdout.write(self.style.SUCCESS(f"Total de ocorrências criadas: {total_created}"))
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Total de ocorrências: {total.created} criadas, "
+                    f"{total.updated} atualizadas, {total.deleted} removidas."
+                )
+            )
+        if total.conflicts:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"{total.conflicts} ocorrências não foram geradas por conflito com a agenda do professor."
+                )
+            )
@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ...jobs import process_jobs
+from ...models import TarefaRegeneracao
+
+
+class Command(BaseCommand):
+    help = (
+        "Worker da fila de regeneração de agendamentos: executa as tarefas pendentes "
+        "enfileiradas pela API."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Processa as tarefas disponíveis e encerra (útil em cron).",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=2.0,
+            help="Intervalo, em segundos, entre consultas à fila quando ela está vazia (default: 2).",
+        )
+        parser.add_argument(
+            "--max-jobs",
+            dest="max_jobs",
+            type=int,
+            default=None,
+            help="Quantidade máxima de tarefas por ciclo.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            for tarefa in process_jobs(max_jobs=options["max_jobs"]):
+                if tarefa.status == TarefaRegeneracao.Status.CONCLUIDA:
+                    self.stdout.write(
+                        self.style.SUCCESS(
+                            f"Agendamento {tarefa.agendamento_id}: {tarefa.criadas} criadas, "
+                            f"{tarefa.atualizadas} atualizadas, {tarefa.removidas} removidas."
+                        )
+                    )
+                else:
+                    self.stdout.write(
+                        self.style.WARNING(
+                            f"Agendamento {tarefa.agendamento_id}: {tarefa.get_status_display()} "
+                            f"(tentativa {tarefa.tentativas}) - {tarefa.erro}"
+                        )
+                    )
+            if options["once"]:
+                return
+            time.sleep(options["sleep"])
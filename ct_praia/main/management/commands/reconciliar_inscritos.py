@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from ...services import reconciliar_inscritos
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula os contadores de inscritos (confirmados/pendentes/em espera) dos treinos que "
+        "divergem das inscrições gravadas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Apenas informa quantos treinos estão divergentes, sem corrigir.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            dest="batch_size",
+            type=int,
+            default=500,
+            help="Treinos corrigidos por transação (default: 500).",
+        )
+
+    def handle(self, *args, **options):
+        divergentes = reconciliar_inscritos(dry_run=options["dry_run"], batch_size=options["batch_size"])
+        if options["dry_run"]:
+            self.stdout.write(f"{divergentes} treino(s) com contadores divergentes.")
+        elif divergentes:
+            self.stdout.write(self.style.SUCCESS(f"{divergentes} treino(s) corrigido(s)."))
+        else:
+            self.stdout.write(self.style.SUCCESS("Contadores de inscritos consistentes."))
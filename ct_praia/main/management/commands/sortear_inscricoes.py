@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from ...services import sortear_inscricoes
+
+
+class Command(BaseCommand):
+    help = (
+        "Sorteia as vagas dos treinos cuja janela de sorteio já fechou: as intenções viram "
+        "inscrições confirmadas até lotar e o restante entra na lista de espera."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=None,
+            help="Semente do sorteio (reprodutível; por padrão, aleatória).",
+        )
+
+    def handle(self, *args, **options):
+        resultados = sortear_inscricoes(seed=options["seed"])
+        for resultado in resultados:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Treino {resultado.treino}: {resultado.inscritos} inscritos, "
+                    f"{resultado.espera} na lista de espera."
+                )
+            )
+        if not resultados:
+            self.stdout.write("Nenhum sorteio pendente.")
@@ -0,0 +1,80 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Value
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
+from .models import AgendamentoTreino, CentroTreinamento, Treino, Usuario
+
+METRICS_CACHE_KEY = "main:metrics:{dia}"
+
+
+def _cache_key():
+    # `metric_treinos` conta treinos a partir de hoje: a chave muda à meia-noite
+    return METRICS_CACHE_KEY.format(dia=timezone.localdate().isoformat())
+
+
+def _contagem(nome, queryset):
+    """`SELECT 'nome', COUNT(pk)` do queryset: sempre uma linha, mesmo com a tabela vazia."""
+    return (
+        queryset.order_by()
+        .annotate(metrica=Value(nome))
+        .values("metrica")
+        .annotate(total=Count("pk"))
+        .values_list("metrica", "total")
+    )
+
+
+def compute_metrics() -> dict[str, int]:
+    """As quatro métricas públicas em uma única ida ao banco (`UNION ALL` das contagens).
+
+    As contagens vêm de três tabelas sem relação entre si: um `aggregate()` com
+    `Count(filter=...)` precisaria de uma tabela base e, com joins, multiplicaria as
+    linhas. Cada ramo do `UNION ALL` é um `COUNT` simples sobre a sua tabela.
+    """
+    primeira, *demais = (
+        _contagem("metric_cts", CentroTreinamento.objects.all()),
+        _contagem("metric_professores", Usuario.objects.filter(tipo=Usuario.Tipo.PROFESSOR)),
+        _contagem("metric_treinos", Treino.objects.filter(data__gte=timezone.localdate())),
+        _contagem("metric_alunos", Usuario.objects.filter(tipo=Usuario.Tipo.ALUNO)),
+    )
+    return dict(primeira.union(*demais, all=True))
+
+
+def get_metrics() -> dict[str, int]:
+    """Métricas da home e de `/api/metrics/`, em cache por `METRICS_CACHE_TTL` segundos.
+
+    Com o cache padrão (LocMem, por processo) a invalidação dos receivers só limpa o
+    processo que fez a escrita; nos demais workers o TTL é o limite real de atraso.
+    """
+    key = _cache_key()
+    metrics = cache.get(key)
+    if metrics is None:
+        metrics = compute_metrics()
+        cache.set(key, metrics, getattr(settings, "METRICS_CACHE_TTL", 60))
+    return metrics
+
+
+def invalidate_metrics(**kwargs):
+    """Descarta as métricas em cache deste processo (ou de todos, com cache compartilhado).
+
+    Também serve de receiver de `post_save`/`post_delete`.
+    """
+    cache.delete(_cache_key())
+
+
+def _dispatch_uid(signal, model):
+    return f"metrics_{'save' if signal is post_save else 'delete'}_{model.__name__}"
+
+
+def connect_signals():
+    # Exclusões de Treino invalidam pelo próprio `Treino.delete()`/`TreinoQuerySet.delete()`;
+    # as em cascata, pelo CT ou agendamento apagado.
+    receivers = (
+        (post_save, (CentroTreinamento, Usuario, Treino)),
+        (post_delete, (CentroTreinamento, Usuario, AgendamentoTreino)),
+    )
+    for signal, models in receivers:
+        for model in models:
+            signal.connect(invalidate_metrics, sender=model, dispatch_uid=_dispatch_uid(signal, model))
+
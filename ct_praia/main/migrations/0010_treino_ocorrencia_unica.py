@@ -0,0 +1,79 @@
+# Generated by Django 4.1.7 on 2026-10-17 02:22
+
+from django.db import migrations, models
+
+
+def remove_duplicated_ocorrencias(apps, schema_editor):
+    Treino = apps.get_model("main", "Treino")
+    Inscricao = apps.get_model("main", "Inscricao")
+    kept = {}
+    duplicated = {}
+    rows = (
+        Treino.objects
+        .filter(agendamento__isnull=False)
+        .order_by("pk")
+        .values_list("pk", "agendamento_id", "data", "hora_inicio", "hora_fim")
+    )
+    for pk, *key in rows:
+        key = tuple(key)
+        if key in kept:
+            duplicated[pk] = kept[key]
+        else:
+            kept[key] = pk
+    if not duplicated:
+        return
+    # As inscrições das cópias passam para a ocorrência mantida; só se perdem as
+    # de alunos que já estão inscritos nela (unique treino+aluno). As ativas
+    # ocupam vaga: se não couberem, a migração falha antes de alterar qualquer
+    # linha em vez de deixar o treino acima da lotação (a lista de espera só
+    # existe a partir da 0018).
+    ativas = ("PENDENTE", "CONFIRMADA")
+    vagas = dict(Treino.objects.filter(pk__in=set(duplicated.values())).values_list("pk", "vagas"))
+    ocupadas = {kept_pk: 0 for kept_pk in vagas}
+    alunos = {kept_pk: set() for kept_pk in vagas}
+    for treino_id, aluno_id, status in Inscricao.objects.filter(treino_id__in=vagas).values_list(
+        "treino_id", "aluno_id", "status"
+    ):
+        alunos[treino_id].add(aluno_id)
+        if status in ativas:
+            ocupadas[treino_id] += 1
+    antes = dict(ocupadas)
+    moves = {}
+    for pk, treino_id, aluno_id, status in (
+        Inscricao.objects.filter(treino_id__in=duplicated)
+        .order_by("criado_em", "pk")
+        .values_list("pk", "treino_id", "aluno_id", "status")
+    ):
+        kept_pk = duplicated[treino_id]
+        if aluno_id in alunos[kept_pk]:
+            continue
+        alunos[kept_pk].add(aluno_id)
+        if status in ativas:
+            ocupadas[kept_pk] += 1
+        moves.setdefault(kept_pk, []).append(pk)
+    lotados = sorted(
+        pk for pk, total in ocupadas.items() if total > max(vagas[pk], antes[pk])
+    )
+    if lotados:
+        raise RuntimeError(
+            "Ocorrências duplicadas com mais inscrições ativas do que vagas no "
+            f"treino mantido (ids {lotados}); resolva-as manualmente antes de migrar."
+        )
+    for kept_pk, pks in moves.items():
+        Inscricao.objects.filter(pk__in=pks).update(treino_id=kept_pk)
+    Treino.objects.filter(pk__in=duplicated).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_professorcentrotreinamento_permissions'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicated_ocorrencias, reverse_code=migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='treino',
+            constraint=models.UniqueConstraint(condition=models.Q(('agendamento__isnull', False)), fields=('agendamento', 'data', 'hora_inicio', 'hora_fim'), name='treino_ocorrencia_unica'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.1.7 on 2026-10-17 02:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_treino_ocorrencia_unica'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agendamentotreino',
+            name='horarios_assinatura',
+            field=models.CharField(blank=True, editable=False, max_length=40),
+        ),
+        migrations.AddField(
+            model_name='agendamentotreino',
+            name='materializado_ate',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='agendamentotreino',
+            name='materializado_em',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
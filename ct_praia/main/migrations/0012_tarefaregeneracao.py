@@ -0,0 +1,42 @@
+# Generated by Django 4.1.7 on 2026-10-17 02:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0011_agendamentotreino_materializacao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TarefaRegeneracao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('PENDENTE', 'Pendente'), ('EXECUTANDO', 'Executando'), ('CONCLUIDA', 'Concluída'), ('FALHOU', 'Falhou')], default='PENDENTE', max_length=20)),
+                ('tentativas', models.PositiveIntegerField(default=0)),
+                ('max_tentativas', models.PositiveIntegerField(default=3)),
+                ('executar_apos', models.DateTimeField(default=django.utils.timezone.now)),
+                ('erro', models.TextField(blank=True)),
+                ('criadas', models.PositiveIntegerField(default=0)),
+                ('atualizadas', models.PositiveIntegerField(default=0)),
+                ('removidas', models.PositiveIntegerField(default=0)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+                ('iniciado_em', models.DateTimeField(blank=True, null=True)),
+                ('concluido_em', models.DateTimeField(blank=True, null=True)),
+                ('agendamento', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tarefas_regeneracao', to='main.agendamentotreino')),
+            ],
+            options={
+                'ordering': ['-criado_em'],
+                'indexes': [models.Index(fields=['status', 'executar_apos'], name='main_tarefa_status_afd997_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='tarefaregeneracao',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'PENDENTE')), fields=('agendamento',), name='tarefa_regeneracao_pendente_unica'),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 4.1.7 on 2026-10-17 02:27
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0012_tarefaregeneracao'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agendamentotreino',
+            name='inicio_vigencia',
+            field=models.DateField(blank=True, help_text='Primeira data em que o agendamento gera treinos; também é a referência das regras a cada N semanas.', null=True),
+        ),
+        migrations.AddField(
+            model_name='horariorecorrente',
+            name='intervalo_semanas',
+            field=models.PositiveSmallIntegerField(default=1, help_text='1 = toda semana, 2 = semana sim, semana não, ...', validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+        migrations.CreateModel(
+            name='ExcecaoAgendamento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField()),
+                ('tipo', models.CharField(choices=[('CANCELADA', 'Cancelada'), ('REMARCADA', 'Remarcada')], default='CANCELADA', max_length=20)),
+                ('nova_hora_inicio', models.TimeField(blank=True, null=True)),
+                ('nova_hora_fim', models.TimeField(blank=True, null=True)),
+                ('motivo', models.CharField(blank=True, max_length=150)),
+                ('agendamento', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='excecoes', to='main.agendamentotreino')),
+                ('horario', models.ForeignKey(blank=True, help_text='Horário afetado; vazio aplica a todos os horários da data.', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='excecoes', to='main.horariorecorrente')),
+            ],
+            options={
+                'verbose_name': 'Exceção de agendamento',
+                'verbose_name_plural': 'Exceções de agendamento',
+                'ordering': ['data'],
+            },
+        ),
+        migrations.CreateModel(
+            name='BloqueioCT',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField()),
+                ('motivo', models.CharField(blank=True, max_length=150)),
+                ('ct', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bloqueios', to='main.centrotreinamento')),
+            ],
+            options={
+                'verbose_name': 'Bloqueio do CT',
+                'verbose_name_plural': 'Bloqueios do CT',
+                'ordering': ['data'],
+                'unique_together': {('ct', 'data')},
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='excecaoagendamento',
+            constraint=models.UniqueConstraint(fields=('agendamento', 'data', 'horario'), name='excecao_agendamento_horario_unica'),
+        ),
+        migrations.AddConstraint(
+            model_name='excecaoagendamento',
+            constraint=models.UniqueConstraint(condition=models.Q(('horario__isnull', True)), fields=('agendamento', 'data'), name='excecao_agendamento_data_unica'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.1.7 on 2026-10-17 02:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0013_regras_recorrencia'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='treino',
+            index=models.Index(fields=['professor', 'data', 'hora_inicio'], name='treino_agenda_professor_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='treino',
+            index=models.Index(fields=['ct', 'data', 'hora_inicio'], name='treino_agenda_ct_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.1.7 on 2026-10-17 02:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0014_treino_agenda_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='inscricao',
+            index=models.Index(fields=['-criado_em', '-id'], name='inscricao_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inscricao',
+            index=models.Index(fields=['aluno', '-criado_em', '-id'], name='inscricao_aluno_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='treino',
+            index=models.Index(fields=['-data', 'hora_inicio', 'id'], name='treino_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='centrotreinamento',
+            index=models.Index(fields=['nome', 'id'], name='ct_keyset_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.1.7 on 2026-10-17 02:46
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0015_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='centrotreinamento',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='treino',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='inscricao',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='usuario',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.1.7 on 2026-10-17 03:06
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def preencher_inscritos(apps, schema_editor):
+    Treino = apps.get_model("main", "Treino")
+    Inscricao = apps.get_model("main", "Inscricao")
+
+    def contagem(status):
+        return Coalesce(
+            Subquery(
+                Inscricao.objects.filter(treino=OuterRef("pk"), status=status)
+                .order_by()
+                .values("treino")
+                .annotate(total=Count("pk"))
+                .values("total")
+            ),
+            0,
+        )
+
+    Treino.objects.update(
+        inscritos_confirmados=contagem("CONFIRMADA"),
+        inscritos_pendentes=contagem("PENDENTE"),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0016_atualizado_em'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='treino',
+            name='inscritos_confirmados',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='treino',
+            name='inscritos_pendentes',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(preencher_inscritos, reverse_code=migrations.RunPython.noop),
+    ]
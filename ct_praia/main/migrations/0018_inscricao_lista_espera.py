@@ -0,0 +1,32 @@
+# Generated by Django 4.1.7 on 2026-10-17 03:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0017_treino_inscritos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inscricao',
+            name='fila_desde',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='treino',
+            name='inscritos_espera',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='inscricao',
+            name='status',
+            field=models.CharField(choices=[('PENDENTE', 'Pendente'), ('CONFIRMADA', 'Confirmada'), ('CANCELADA', 'Cancelada'), ('ESPERA', 'Lista de espera')], default='CONFIRMADA', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='inscricao',
+            index=models.Index(condition=models.Q(('status', 'ESPERA')), fields=['treino', 'fila_desde', 'id'], name='inscricao_fila_idx'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.1.7 on 2026-10-17 03:16
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('main', '0018_inscricao_lista_espera'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IntencaoInscricao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prioridade', models.SmallIntegerField(default=0, help_text='Maior prioridade é sorteada primeiro; empates são decididos ao acaso.')),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Intenção de inscrição',
+                'verbose_name_plural': 'Intenções de inscrição',
+            },
+        ),
+        migrations.AddField(
+            model_name='agendamentotreino',
+            name='janela_sorteio',
+            field=models.DurationField(blank=True, help_text='Se definida, cada ocorrência gerada abre uma janela de sorteio com esta duração.', null=True),
+        ),
+        migrations.AddField(
+            model_name='treino',
+            name='sorteado_em',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='treino',
+            name='sorteio_encerra_em',
+            field=models.DateTimeField(blank=True, help_text='Se definido, as inscrições são sorteadas após este momento em vez de atendidas por ordem de chegada.', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='treino',
+            index=models.Index(condition=models.Q(('sorteado_em__isnull', True), ('sorteio_encerra_em__isnull', False)), fields=['sorteio_encerra_em'], name='treino_sorteio_pendente_idx'),
+        ),
+        migrations.AddField(
+            model_name='intencaoinscricao',
+            name='aluno',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='intencoes_inscricao', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='intencaoinscricao',
+            name='treino',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='intencoes', to='main.treino'),
+        ),
+        migrations.AddConstraint(
+            model_name='intencaoinscricao',
+            constraint=models.UniqueConstraint(fields=('treino', 'aluno'), name='intencao_inscricao_unica'),
+        ),
+    ]
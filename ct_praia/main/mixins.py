@@ -1,5 +1,6 @@
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from .models import Usuario
+from .permissions import permission_context
 
 class ProfOrManagerRequiredMixin(LoginRequiredMixin, UserPassesTestMixin):
     login_url = "/accounts/login/"
@@ -10,7 +11,7 @@ class ProfOrManagerRequiredMixin(LoginRequiredMixin, UserPassesTestMixin):
             return False
         if u.is_superuser:
             return True
-        return hasattr(u, "usuario") and u.usuario.tipo in (Usuario.Tipo.PROFESSOR, Usuario.Tipo.GERENTE)
+        return permission_context(u).tipo in (Usuario.Tipo.PROFESSOR, Usuario.Tipo.GERENTE)
 
 
 class ProfessorRequiredMixin(LoginRequiredMixin, UserPassesTestMixin):
@@ -22,4 +23,4 @@ class ProfessorRequiredMixin(LoginRequiredMixin, UserPassesTestMixin):
             return False
         if u.is_superuser:
             return True
-        return hasattr(u, "usuario") and u.usuario.tipo == Usuario.Tipo.PROFESSOR
+        return permission_context(u).is_professor
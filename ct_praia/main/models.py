@@ -1,6 +1,10 @@
+from collections import Counter, defaultdict
+
 from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.core.validators import MinValueValidator
+from django.db import models, transaction
+from django.utils import timezone
 
 
 class Usuario(models.Model):
@@ -29,6 +33,9 @@ class Usuario(models.Model):
 	telefone = models.CharField(max_length=30, blank=True)
 	nivel = models.CharField(max_length=50, blank=True, help_text="Ex.: Iniciante, Intermediário, Avançado")
 	certificacoes = models.TextField(blank=True, help_text="Certificações (uma por linha ou texto livre)")
+	# Também avança quando nome/username do User mudam (ver signals.py): entra no
+	# ETag das listagens que exibem o nome de gerentes e professores.
+	atualizado_em = models.DateTimeField(auto_now=True)
 
 	def __str__(self) -> str:  # pragma: no cover - simples representação
 		return f"{self.user.get_full_name() or self.user.username} ({self.get_tipo_display()})"
@@ -78,11 +85,16 @@ class CentroTreinamento(models.Model):
 		blank=True,
 		help_text="Longitude da localização do CT (ex: -43.1729)"
 	)
+	atualizado_em = models.DateTimeField(auto_now=True)
 
 	class Meta:
 		verbose_name = "Centro de Treinamento"
 		verbose_name_plural = "Centros de Treinamento"
 		ordering = ["nome"]
+		indexes = [
+			# Paginação keyset da API (nome, id).
+			models.Index(fields=["nome", "id"], name="ct_keyset_idx"),
+		]
 
 	def __str__(self) -> str:  # pragma: no cover
 		return self.nome
@@ -121,6 +133,48 @@ class ProfessorCentroTreinamento(models.Model):
 		return f"{self.professor} em {self.ct}"
 
 
+def _invalidar_metricas():
+	from .metrics import invalidate_metrics  # metrics importa os models
+
+	invalidate_metrics()
+
+
+class TreinoQuerySet(models.QuerySet):
+	def delete(self):
+		"""Invalida as métricas sem `post_delete` em `Treino` (ver `Treino.delete`)."""
+		resultado = super().delete()
+		_invalidar_metricas()
+		return resultado
+
+	def com_inscricoes_ativas(self):
+		"""Anota `inscricoes_ativas` (confirmadas + pendentes) para `treino_values` e as reservas em lote.
+
+		Soma dos contadores mantidos no próprio treino: não faz join com as inscrições.
+		"""
+		return self.annotate(inscricoes_ativas=models.F("inscritos_confirmados") + models.F("inscritos_pendentes"))
+
+	def com_vaga(self, quantidade=1):
+		"""Treinos com pelo menos `quantidade` vagas livres (confirmadas + pendentes < vagas)."""
+		return self.filter(
+			vagas__gte=models.F("inscritos_confirmados") + models.F("inscritos_pendentes") + quantidade
+		)
+
+	def ajustar_inscritos(self, deltas):
+		"""Soma `{status: delta}` aos contadores com F(), em uma única UPDATE.
+
+		Deve rodar na mesma transação que grava a mudança de status da inscrição.
+		"""
+		campos = {
+			INSCRITOS_POR_STATUS[status]: models.F(INSCRITOS_POR_STATUS[status]) + delta
+			for status, delta in deltas.items()
+			if delta and status in INSCRITOS_POR_STATUS
+		}
+		if not campos:
+			return 0
+		# vagas_disponiveis mudou: atualizado_em entra no ETag das listagens
+		return self.update(atualizado_em=timezone.now(), **campos)
+
+
 class Treino(models.Model):
 	ct = models.ForeignKey(
 		CentroTreinamento,
@@ -140,6 +194,18 @@ class Treino(models.Model):
 	vagas = models.PositiveIntegerField()
 	nivel = models.CharField(max_length=50)
 	observacoes = models.TextField(blank=True)
+	# Contadores desnormalizados, mantidos por `Inscricao.save()/delete()` e `inscrever_em_lote`;
+	# `python manage.py reconciliar_inscritos` corrige divergências.
+	inscritos_confirmados = models.PositiveIntegerField(default=0, editable=False)
+	inscritos_pendentes = models.PositiveIntegerField(default=0, editable=False)
+	inscritos_espera = models.PositiveIntegerField(default=0, editable=False)
+	# Janela de sorteio (opcional): até o sorteio, pedidos de inscrição viram `IntencaoInscricao`
+	sorteio_encerra_em = models.DateTimeField(
+		null=True,
+		blank=True,
+		help_text="Se definido, as inscrições são sorteadas após este momento em vez de atendidas por ordem de chegada.",
+	)
+	sorteado_em = models.DateTimeField(null=True, blank=True, editable=False)
 	agendado = models.BooleanField(default=False, help_text="Identifica treinos gerados a partir de um agendamento.")
 	agendamento = models.ForeignKey(
 		"AgendamentoTreino",
@@ -148,9 +214,33 @@ class Treino(models.Model):
 		null=True,
 		blank=True,
 	)
+	atualizado_em = models.DateTimeField(auto_now=True)
+
+	objects = TreinoQuerySet.as_manager()
 
 	class Meta:
 		ordering = ["-data", "hora_inicio"]
+		constraints = [
+			# Cada horário de um agendamento gera no máximo uma ocorrência por data.
+			models.UniqueConstraint(
+				fields=["agendamento", "data", "hora_inicio", "hora_fim"],
+				condition=models.Q(agendamento__isnull=False),
+				name="treino_ocorrencia_unica",
+			),
+		]
+		indexes = [
+			# Agenda do professor / do CT em um intervalo de datas (detecção de conflitos).
+			models.Index(fields=["professor", "data", "hora_inicio"], name="treino_agenda_professor_idx"),
+			models.Index(fields=["ct", "data", "hora_inicio"], name="treino_agenda_ct_idx"),
+			# Paginação keyset da API (mesma ordem de `keyset_ordering`).
+			models.Index(fields=["-data", "hora_inicio", "id"], name="treino_keyset_idx"),
+			# Treinos com sorteio ainda por fazer (`sortear_inscricoes`).
+			models.Index(
+				fields=["sorteio_encerra_em"],
+				condition=models.Q(sorteio_encerra_em__isnull=False, sorteado_em__isnull=True),
+				name="treino_sorteio_pendente_idx",
+			),
+		]
 
 	def clean(self):
 		# hora_fim deve ser depois de hora_inicio
@@ -169,6 +259,36 @@ class Treino(models.Model):
 			if not self.ct.professores.filter(pk=self.professor_id).exists():
 				raise ValidationError({"professor": "Professor não está associado a este CT."})
 
+	def save(self, *args, **kwargs):
+		"""Gravações comuns de um treino existente não tocam nos campos mantidos por UPDATEs atômicas.
+
+		Os contadores de inscritos (e `sorteado_em`) do objeto em memória podem estar defasados:
+		regravá-los desfaria inscrições feitas desde que ele foi lido.
+		"""
+		if not self._state.adding and kwargs.get("update_fields") is None and not kwargs.get("force_insert"):
+			kwargs["update_fields"] = [
+				field.name
+				for field in self._meta.concrete_fields
+				if not field.primary_key and field.name not in CAMPOS_ATOMICOS_TREINO
+			]
+		super().save(*args, **kwargs)
+
+	def delete(self, *args, **kwargs):
+		"""Apaga e invalida as métricas.
+
+		As métricas não escutam `post_delete` de `Treino`: sem receivers nele, a limpeza de
+		ocorrências pode usar DELETEs diretos. Exclusões em cascata vêm de CT/agendamento,
+		cujos `post_delete` invalidam as métricas.
+		"""
+		resultado = super().delete(*args, **kwargs)
+		_invalidar_metricas()
+		return resultado
+
+	@property
+	def sorteio_pendente(self) -> bool:
+		"""Inscrições ainda são intenções: há janela de sorteio e o sorteio não foi feito."""
+		return self.sorteio_encerra_em is not None and self.sorteado_em is None
+
 	def __str__(self) -> str:  # pragma: no cover
 		return f"{self.modalidade} - {self.data} ({self.ct})"
 
@@ -198,8 +318,22 @@ class AgendamentoTreino(models.Model):
 	vagas = models.PositiveIntegerField()
 	nivel = models.CharField(max_length=50)
 	observacoes = models.TextField(blank=True)
+	inicio_vigencia = models.DateField(
+		null=True,
+		blank=True,
+		help_text="Primeira data em que o agendamento gera treinos; também é a referência das regras a cada N semanas.",
+	)
+	janela_sorteio = models.DurationField(
+		null=True,
+		blank=True,
+		help_text="Se definida, cada ocorrência gerada abre uma janela de sorteio com esta duração.",
+	)
 	criado_em = models.DateTimeField(auto_now_add=True)
 	atualizado_em = models.DateTimeField(auto_now=True)
+	# Controle da geração incremental (marca d'água da janela já materializada)
+	materializado_ate = models.DateField(null=True, blank=True, editable=False)
+	materializado_em = models.DateTimeField(null=True, blank=True, editable=False)
+	horarios_assinatura = models.CharField(max_length=40, blank=True, editable=False)
 
 	class Meta:
 		ordering = ["-criado_em"]
@@ -223,6 +357,11 @@ class HorarioRecorrente(models.Model):
 	dia_semana = models.IntegerField(choices=AgendamentoTreino.DiaSemana.choices)
 	hora_inicio = models.TimeField()
 	hora_fim = models.TimeField()
+	intervalo_semanas = models.PositiveSmallIntegerField(
+		default=1,
+		validators=[MinValueValidator(1)],
+		help_text="1 = toda semana, 2 = semana sim, semana não, ...",
+	)
 
 	class Meta:
 		ordering = ["dia_semana", "hora_inicio"]
@@ -236,11 +375,133 @@ class HorarioRecorrente(models.Model):
 		return f"{self.get_dia_semana_display()} {self.hora_inicio}-{self.hora_fim}"
 
 
+class ExcecaoAgendamento(models.Model):
+	"""Exceção pontual de um agendamento: cancela ou remarca a ocorrência de uma data."""
+
+	class Tipo(models.TextChoices):
+		CANCELADA = "CANCELADA", "Cancelada"
+		REMARCADA = "REMARCADA", "Remarcada"
+
+	agendamento = models.ForeignKey(
+		AgendamentoTreino,
+		on_delete=models.CASCADE,
+		related_name="excecoes",
+	)
+	data = models.DateField()
+	horario = models.ForeignKey(
+		HorarioRecorrente,
+		on_delete=models.CASCADE,
+		related_name="excecoes",
+		null=True,
+		blank=True,
+		help_text="Horário afetado; vazio aplica a todos os horários da data.",
+	)
+	tipo = models.CharField(max_length=20, choices=Tipo.choices, default=Tipo.CANCELADA)
+	nova_hora_inicio = models.TimeField(null=True, blank=True)
+	nova_hora_fim = models.TimeField(null=True, blank=True)
+	motivo = models.CharField(max_length=150, blank=True)
+
+	class Meta:
+		ordering = ["data"]
+		constraints = [
+			models.UniqueConstraint(
+				fields=["agendamento", "data", "horario"],
+				name="excecao_agendamento_horario_unica",
+			),
+			# NULL não colide em UNIQUE: exceções da data inteira precisam de um índice próprio
+			models.UniqueConstraint(
+				fields=["agendamento", "data"],
+				condition=models.Q(horario__isnull=True),
+				name="excecao_agendamento_data_unica",
+			),
+		]
+		verbose_name = "Exceção de agendamento"
+		verbose_name_plural = "Exceções de agendamento"
+
+	def clean(self):
+		if self.tipo == self.Tipo.REMARCADA:
+			if not self.nova_hora_inicio or not self.nova_hora_fim:
+				raise ValidationError("Informe o novo horário da ocorrência remarcada.")
+			if self.nova_hora_fim <= self.nova_hora_inicio:
+				raise ValidationError({"nova_hora_fim": "Hora fim deve ser após a hora início."})
+
+	def __str__(self) -> str:  # pragma: no cover
+		return f"{self.get_tipo_display()} {self.data} ({self.agendamento_id})"
+
+
+class BloqueioCT(models.Model):
+	"""Data em que o CT não funciona (feriado, manutenção...); nenhuma ocorrência é gerada."""
+
+	ct = models.ForeignKey(
+		CentroTreinamento,
+		on_delete=models.CASCADE,
+		related_name="bloqueios",
+	)
+	data = models.DateField()
+	motivo = models.CharField(max_length=150, blank=True)
+
+	class Meta:
+		ordering = ["data"]
+		unique_together = ("ct", "data")
+		verbose_name = "Bloqueio do CT"
+		verbose_name_plural = "Bloqueios do CT"
+
+	def __str__(self) -> str:  # pragma: no cover
+		return f"{self.ct} fechado em {self.data}"
+
+
+class TarefaRegeneracao(models.Model):
+	"""Pedido de regeneração das ocorrências de um agendamento, executado pelo worker.
+
+	Existe no máximo uma tarefa PENDENTE por agendamento: edições em sequência são
+	agrupadas numa única regeneração.
+	"""
+
+	class Status(models.TextChoices):
+		PENDENTE = "PENDENTE", "Pendente"
+		EXECUTANDO = "EXECUTANDO", "Executando"
+		CONCLUIDA = "CONCLUIDA", "Concluída"
+		FALHOU = "FALHOU", "Falhou"
+
+	agendamento = models.ForeignKey(
+		AgendamentoTreino,
+		on_delete=models.CASCADE,
+		related_name="tarefas_regeneracao",
+	)
+	status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDENTE)
+	tentativas = models.PositiveIntegerField(default=0)
+	max_tentativas = models.PositiveIntegerField(default=3)
+	executar_apos = models.DateTimeField(default=timezone.now)
+	erro = models.TextField(blank=True)
+	criadas = models.PositiveIntegerField(default=0)
+	atualizadas = models.PositiveIntegerField(default=0)
+	removidas = models.PositiveIntegerField(default=0)
+	criado_em = models.DateTimeField(auto_now_add=True)
+	atualizado_em = models.DateTimeField(auto_now=True)
+	iniciado_em = models.DateTimeField(null=True, blank=True)
+	concluido_em = models.DateTimeField(null=True, blank=True)
+
+	class Meta:
+		ordering = ["-criado_em"]
+		indexes = [models.Index(fields=["status", "executar_apos"])]
+		constraints = [
+			models.UniqueConstraint(
+				fields=["agendamento"],
+				condition=models.Q(status="PENDENTE"),
+				name="tarefa_regeneracao_pendente_unica",
+			),
+		]
+
+	def __str__(self) -> str:  # pragma: no cover
+		return f"Regeneração {self.agendamento_id} [{self.get_status_display()}]"
+
+
 class Inscricao(models.Model):
 	class Status(models.TextChoices):
 		PENDENTE = "PENDENTE", "Pendente"
 		CONFIRMADA = "CONFIRMADA", "Confirmada"
 		CANCELADA = "CANCELADA", "Cancelada"
+		ESPERA = "ESPERA", "Lista de espera"
 
 	treino = models.ForeignKey(
 		Treino,
@@ -258,12 +519,117 @@ class Inscricao(models.Model):
 		choices=Status.choices,
 		default=Status.CONFIRMADA,
 	)
+	# Posição na lista de espera (FIFO): momento em que entrou na fila; None fora dela
+	fila_desde = models.DateTimeField(null=True, blank=True, editable=False)
 	criado_em = models.DateTimeField(auto_now_add=True)
+	atualizado_em = models.DateTimeField(auto_now=True)
 
 	class Meta:
 		unique_together = ("treino", "aluno")
 		ordering = ["-criado_em"]
+		indexes = [
+			# Paginação keyset da API: geral e "minhas inscrições".
+			models.Index(fields=["-criado_em", "-id"], name="inscricao_keyset_idx"),
+			models.Index(fields=["aluno", "-criado_em", "-id"], name="inscricao_aluno_keyset_idx"),
+			# Primeiro da lista de espera de um treino (promoção ao liberar vaga).
+			models.Index(
+				fields=["treino", "fila_desde", "id"],
+				condition=models.Q(status="ESPERA"),
+				name="inscricao_fila_idx",
+			),
+		]
 
 	def __str__(self) -> str:  # pragma: no cover
 		return f"{self.aluno} -> {self.treino} [{self.get_status_display()}]"
 
+	def _estado_salvo(self):
+		# Lê (e trava) a linha atual: duas gravações concorrentes não contam a mesma transição
+		return (
+			Inscricao.objects.select_for_update()
+			.filter(pk=self.pk)
+			.values_list("treino_id", "status")
+			.first()
+		)
+
+	def save(self, *args, **kwargs):
+		"""Grava e atualiza os contadores de `Treino` na mesma transação.
+
+		Exclusões/updates via queryset (e cascatas) não passam por aqui; ver `reconciliar_inscritos`.
+		"""
+		with transaction.atomic(using=kwargs.get("using")):
+			anterior = None if self._state.adding else self._estado_salvo()
+			super().save(*args, **kwargs)
+			atual = (self.treino_id, self.status)
+			update_fields = kwargs.get("update_fields")
+			if anterior is not None and update_fields is not None:
+				campos = set(update_fields)
+				atual = (
+					self.treino_id if campos & {"treino", "treino_id"} else anterior[0],
+					self.status if "status" in campos else anterior[1],
+				)
+			_mover_inscricao(anterior, atual)
+
+	def delete(self, *args, **kwargs):
+		with transaction.atomic(using=kwargs.get("using")):
+			anterior = self._estado_salvo()
+			resultado = super().delete(*args, **kwargs)
+			_mover_inscricao(anterior, None)
+		return resultado
+
+
+class IntencaoInscricao(models.Model):
+	"""Pedido de inscrição feito durante a janela de sorteio de um treino.
+
+	Só recebe INSERTs (sem leitura nem lock do treino); `sortear_inscricoes` transforma as
+	intenções em `Inscricao` quando a janela fecha e as apaga.
+	"""
+
+	treino = models.ForeignKey(
+		Treino,
+		on_delete=models.CASCADE,
+		related_name="intencoes",
+	)
+	aluno = models.ForeignKey(
+		settings.AUTH_USER_MODEL,
+		on_delete=models.CASCADE,
+		related_name="intencoes_inscricao",
+	)
+	prioridade = models.SmallIntegerField(
+		default=0,
+		help_text="Maior prioridade é sorteada primeiro; empates são decididos ao acaso.",
+	)
+	criado_em = models.DateTimeField(auto_now_add=True)
+
+	class Meta:
+		constraints = [
+			models.UniqueConstraint(fields=["treino", "aluno"], name="intencao_inscricao_unica"),
+		]
+		verbose_name = "Intenção de inscrição"
+		verbose_name_plural = "Intenções de inscrição"
+
+	def __str__(self) -> str:  # pragma: no cover
+		return f"{self.aluno} -> {self.treino} (sorteio)"
+
+
+# Status contados -> contador correspondente em `Treino`
+INSCRITOS_POR_STATUS = {
+	Inscricao.Status.CONFIRMADA: "inscritos_confirmados",
+	Inscricao.Status.PENDENTE: "inscritos_pendentes",
+	Inscricao.Status.ESPERA: "inscritos_espera",
+}
+# Status que ocupam uma das `vagas` do treino
+STATUS_OCUPAM_VAGA = (Inscricao.Status.CONFIRMADA, Inscricao.Status.PENDENTE)
+# Campos de `Treino` escritos só por UPDATEs condicionais; `Treino.save()` não os regrava
+CAMPOS_ATOMICOS_TREINO = frozenset((*INSCRITOS_POR_STATUS.values(), "sorteado_em"))
+
+
+def _mover_inscricao(anterior, atual):
+	"""Aplica a transição `(treino_id, status)` anterior -> atual (None: não existe) aos contadores."""
+	deltas = defaultdict(Counter)
+	if anterior is not None:
+		deltas[anterior[0]][anterior[1]] -= 1
+	if atual is not None:
+		deltas[atual[0]][atual[1]] += 1
+	for treino_id, por_status in deltas.items():
+		Treino.objects.filter(pk=treino_id).ajustar_inscritos(por_status)
+
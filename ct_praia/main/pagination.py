@@ -0,0 +1,144 @@
+import base64
+import json
+from functools import reduce
+
+from django.db.models import Q, QuerySet
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Paginação por cursor (keyset) sobre a ordenação natural da view + `id`.
+
+    Ativada quando o cliente envia `cursor` ou `limit`; sem eles a resposta continua
+    paginada por número de página (compatível com os clientes atuais). Cada página é
+    um `WHERE (ordem) > (última linha) ... LIMIT n`, sem `COUNT(*)` nem `OFFSET`, então
+    a página N custa o mesmo que a primeira (índices compostos sobre a mesma ordem).
+
+    A view informa a ordem em `keyset_ordering`; o último campo deve ser único (`id`).
+    """
+
+    cursor_query_param = 'cursor'
+    limit_query_param = 'limit'
+    default_limit = 50
+    max_limit = 200
+    invalid_cursor_message = 'Cursor inválido.'
+    ordering_conflict_message = 'A paginação por cursor usa ordem fixa; não combine `ordering` com `cursor`/`limit`.'
+
+    def __init__(self):
+        self.fallback = PageNumberPagination()
+        self.keyset = False
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        requested = self.cursor_query_param in params or self.limit_query_param in params
+        if requested and params.get(api_settings.ORDERING_PARAM):
+            # A ordem do keyset é a da view; aplicar outra geraria cursores inconsistentes.
+            raise ValidationError({api_settings.ORDERING_PARAM: self.ordering_conflict_message})
+        self.keyset = requested and isinstance(queryset, QuerySet)
+        if not self.keyset:
+            return self.fallback.paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.ordering = tuple(getattr(view, 'keyset_ordering', ('id',)))
+        self.width = len(self.ordering)
+        self.limit = self.get_limit(request)
+        queryset = queryset.order_by(*self.ordering)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            queryset = queryset.filter(self._after(queryset.model, self.decode_cursor(cursor)))
+
+        rows = list(queryset[:self.limit + 1])
+        self.has_next = len(rows) > self.limit
+        rows = rows[:self.limit]
+        self.next_position = self._position(rows[-1]) if self.has_next else None
+        return rows
+
+    def paginate_rows(self, fetch, position, width, request, view=None):
+        """Keyset sobre linhas que a view monta de mais de uma fonte (ex.: treinos reais +
+        ocorrências virtuais), sempre por cursor.
+
+        `fetch(after, n)` devolve as `n` primeiras linhas depois da posição `after` (valores
+        do cursor, ainda em texto, ou None) e levanta `ValueError` se ela for inválida;
+        `position(row)` devolve os `width` valores que identificam a linha na ordem.
+        """
+        if request.query_params.get(api_settings.ORDERING_PARAM):
+            raise ValidationError({api_settings.ORDERING_PARAM: self.ordering_conflict_message})
+        self.keyset = True
+        self.request = request
+        self.width = width
+        self.limit = self.get_limit(request)
+        cursor = request.query_params.get(self.cursor_query_param)
+        try:
+            rows = fetch(self.decode_cursor(cursor) if cursor else None, self.limit + 1)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        self.has_next = len(rows) > self.limit
+        rows = rows[:self.limit]
+        self.next_position = position(rows[-1]) if self.has_next else None
+        return rows
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return self.fallback.get_paginated_response(data)
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return self.fallback.get_paginated_response_schema(schema)
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params[self.limit_query_param])
+        except (KeyError, ValueError):
+            return self.default_limit
+        return max(1, min(limit, self.max_limit))
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, 'page')
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def encode_cursor(self, position):
+        raw = json.dumps([None if value is None else str(value) for value in position])
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != self.width:
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def _position(self, row):
+        names = [name.lstrip('-') for name in self.ordering]
+        if isinstance(row, dict):
+            return [row[name] for name in names]
+        return [getattr(row, name) for name in names]
+
+    def _after(self, model, values):
+        """Q da comparação lexicográfica `(ordem) > (cursor)` respeitando a direção de cada campo."""
+        bounds = []
+        for name, value in zip(self.ordering, values):
+            field_name = name.lstrip('-')
+            field = model._meta.get_field('id' if field_name == 'pk' else field_name)
+            try:
+                bounds.append((field_name, name.startswith('-'), field.to_python(value)))
+            except Exception:
+                raise NotFound(self.invalid_cursor_message)
+
+        clauses = []
+        for index, (field_name, descending, value) in enumerate(bounds):
+            lookup = 'lt' if descending else 'gt'
+            equal = {name: bound for name, _, bound in bounds[:index]}
+            clauses.append(Q(**equal, **{f'{field_name}__{lookup}': value}))
+        return reduce(lambda left, right: left | right, clauses)
@@ -0,0 +1,127 @@
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import cached_property
+from types import MappingProxyType
+from typing import Mapping
+
+from .authentication import TokenUsuario
+from .models import ProfessorCentroTreinamento, Usuario
+
+
+@dataclass(frozen=True)
+class VinculoCT:
+    pode_criar_treino: bool
+    pode_cancelar_treino: bool
+
+
+@dataclass(frozen=True)
+class PermissionContext:
+    """Perfil e vínculos de um usuário, carregados uma vez por requisição.
+
+    Decorators, mixins, serializers e viewsets consultam este objeto em vez de
+    `user.usuario` e `ProfessorCentroTreinamento`; é imutável durante a requisição.
+    Quando montado só com as claims do JWT, os vínculos do professor são lidos do banco
+    no primeiro acesso (uma consulta por requisição).
+    """
+
+    user_id: int | None
+    is_superuser: bool = False
+    tipo: str | None = None  # None: sem perfil `Usuario`
+    # None: ainda não carregados (contexto montado pelas claims)
+    vinculos_carregados: Mapping[int, VinculoCT] | None = field(default_factory=lambda: MappingProxyType({}))
+
+    @cached_property
+    def vinculos(self) -> Mapping[int, VinculoCT]:
+        if self.vinculos_carregados is not None:
+            return self.vinculos_carregados
+        if not self.is_professor:
+            return MappingProxyType({})
+        return _vinculos_do_professor(self.user_id)
+
+    @property
+    def tem_perfil(self) -> bool:
+        return self.tipo is not None
+
+    @property
+    def is_aluno(self) -> bool:
+        return self.tipo == Usuario.Tipo.ALUNO
+
+    @property
+    def is_professor(self) -> bool:
+        return self.tipo == Usuario.Tipo.PROFESSOR
+
+    @property
+    def is_gerente(self) -> bool:
+        return self.tipo == Usuario.Tipo.GERENTE
+
+    def vinculo(self, ct_id: int | None) -> VinculoCT | None:
+        """Vínculo do próprio usuário (professor) com o CT, se existir."""
+        return self.vinculos.get(ct_id)
+
+    def gerencia(self, ct) -> bool:
+        return self.is_superuser or (self.is_gerente and ct.gerente_id == self.user_id)
+
+
+_contextos: ContextVar[dict | None] = ContextVar("permission_contexts", default=None)
+
+
+class PermissionContextMiddleware:
+    """Delimita o cache de `permission_context` à requisição corrente.
+
+    Vale também para a autenticação JWT do DRF, que só identifica o usuário dentro da view.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _contextos.set({})
+        try:
+            return self.get_response(request)
+        finally:
+            _contextos.reset(token)
+
+
+def _vinculos_do_professor(user_id) -> Mapping[int, VinculoCT]:
+    return MappingProxyType({
+        ct_id: VinculoCT(pode_criar, pode_cancelar)
+        for ct_id, pode_criar, pode_cancelar in ProfessorCentroTreinamento.objects.filter(
+            professor_id=user_id
+        ).values_list("ct_id", "pode_criar_treino", "pode_cancelar_treino")
+    })
+
+
+def _carregar(user) -> PermissionContext:
+    if not user.is_authenticated:
+        return PermissionContext(user_id=None)
+    if isinstance(user, TokenUsuario):
+        # Leitura autenticada por JWT: papel vem das claims, sem consultas; vínculos sob demanda
+        return PermissionContext(
+            user_id=user.pk, is_superuser=user.is_superuser, tipo=user.tipo, vinculos_carregados=None
+        )
+    usuario = getattr(user, "usuario", None)
+    tipo = usuario.tipo if usuario is not None else None
+    return PermissionContext(
+        user_id=user.pk,
+        is_superuser=user.is_superuser,
+        tipo=tipo,
+        vinculos_carregados=_vinculos_do_professor(user.pk) if tipo == Usuario.Tipo.PROFESSOR else None,
+    )
+
+
+def permission_context(user) -> PermissionContext:
+    """Contexto de permissões de `user`; dentro de uma requisição é carregado uma única vez."""
+    cache = _contextos.get()
+    if cache is None:
+        return _carregar(user)
+    chave = user.pk if user.is_authenticated else None
+    if chave not in cache:
+        cache[chave] = _carregar(user)
+    return cache[chave]
+
+
+def professor_associado(ct, professor, perfil: PermissionContext | None = None) -> bool:
+    """`professor` está vinculado a `ct`? Sem consulta quando ele é o próprio usuário do contexto."""
+    if perfil is not None and perfil.is_professor and perfil.user_id == professor.pk:
+        return perfil.vinculo(ct.pk) is not None
+    return ct.professores.filter(pk=professor.pk).exists()
@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import hashlib
+from dataclasses import dataclass
+from datetime import date, time, timedelta
+from typing import Iterable, Mapping, Tuple
+
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from .models import AgendamentoTreino, BloqueioCT, ExcecaoAgendamento, HorarioRecorrente
+
+
+OcorrenciaKey = Tuple[date, time, time]
+
+
+@dataclass(frozen=True)
+class CompiledSlot:
+    """A `HorarioRecorrente` reduced to what the expansion needs."""
+
+    horario_id: int | None
+    weekday: int
+    hora_inicio: time
+    hora_fim: time
+    intervalo_semanas: int
+
+
+@dataclass(frozen=True)
+class CompiledException:
+    tipo: str
+    nova_hora_inicio: time | None = None
+    nova_hora_fim: time | None = None
+
+
+class CompiledRecurrence:
+    """Regra de recorrência pré-compilada de um agendamento.
+
+    Os horários ficam indexados por dia da semana e as exceções/bloqueios por data, de
+    modo que expandir uma janela custa O(ocorrências) em vez de O(dias x horários).
+    """
+
+    def __init__(
+        self,
+        slots: Iterable[CompiledSlot],
+        exceptions: Mapping[date, Mapping[int | None, CompiledException]] | None = None,
+        blackout: Iterable[date] = (),
+        anchor: date | None = None,
+        inicio: date | None = None,
+    ):
+        self.slots = tuple(sorted(slots, key=lambda slot: (slot.weekday, slot.hora_inicio, slot.hora_fim)))
+        self.exceptions = {day: dict(by_horario) for day, by_horario in (exceptions or {}).items()}
+        self.blackout = frozenset(blackout)
+        self.inicio = inicio
+        anchor = anchor or inicio or timezone.localdate()
+        # Semanas são contadas a partir da segunda-feira da data de referência
+        self.anchor_monday = anchor - timedelta(days=anchor.weekday())
+
+    @classmethod
+    def compile(
+        cls,
+        horarios: Iterable[HorarioRecorrente],
+        excecoes: Iterable[ExcecaoAgendamento] = (),
+        bloqueios: Iterable[BloqueioCT | date] = (),
+        anchor: date | None = None,
+        inicio: date | None = None,
+    ) -> "CompiledRecurrence":
+        slots = [
+            CompiledSlot(
+                horario_id=horario.pk,
+                weekday=horario.dia_semana,
+                hora_inicio=horario.hora_inicio,
+                hora_fim=horario.hora_fim,
+                intervalo_semanas=max(1, getattr(horario, "intervalo_semanas", 1) or 1),
+            )
+            for horario in horarios
+        ]
+        exceptions: dict[date, dict[int | None, CompiledException]] = {}
+        for excecao in excecoes:
+            exceptions.setdefault(excecao.data, {})[excecao.horario_id] = CompiledException(
+                tipo=excecao.tipo,
+                nova_hora_inicio=excecao.nova_hora_inicio,
+                nova_hora_fim=excecao.nova_hora_fim,
+            )
+        blackout = [bloqueio if isinstance(bloqueio, date) else bloqueio.data for bloqueio in bloqueios]
+        return cls(slots, exceptions, blackout, anchor=anchor, inicio=inicio)
+
+    @classmethod
+    def for_agendamento(cls, agendamento: AgendamentoTreino) -> "CompiledRecurrence":
+        """Compile the rule of a saved agendamento (use `prefetch_recurrence` to avoid queries)."""
+        anchor = agendamento.inicio_vigencia
+        if anchor is None and agendamento.criado_em:
+            anchor = timezone.localdate(agendamento.criado_em)
+        return cls.compile(
+            agendamento.horarios.all(),
+            agendamento.excecoes.all(),
+            agendamento.ct.bloqueios.all(),
+            anchor=anchor,
+            inicio=agendamento.inicio_vigencia,
+        )
+
+    def __bool__(self) -> bool:
+        return bool(self.slots)
+
+    def expand(self, start: date, end: date) -> list[OcorrenciaKey]:
+        """Return the sorted (data, hora_inicio, hora_fim) occurrences inside [start, end]."""
+        if self.inicio and self.inicio > start:
+            start = self.inicio
+        if end < start:
+            return []
+        keys: set[OcorrenciaKey] = set()
+        for slot in self.slots:
+            current = start + timedelta(days=(slot.weekday - start.weekday()) % 7)
+            step = 7 * slot.intervalo_semanas
+            if slot.intervalo_semanas > 1:
+                weeks = (current - self.anchor_monday).days // 7
+                current += timedelta(days=7 * (-weeks % slot.intervalo_semanas))
+            while current <= end:
+                key = self._apply_exceptions(current, slot)
+                if key is not None:
+                    keys.add(key)
+                current += timedelta(days=step)
+        return sorted(keys)
+
+    def _apply_exceptions(self, day: date, slot: CompiledSlot) -> OcorrenciaKey | None:
+        if day in self.blackout:
+            return None
+        by_horario = self.exceptions.get(day)
+        if by_horario:
+            excecao = by_horario.get(slot.horario_id) or by_horario.get(None)
+            if excecao is not None:
+                if excecao.tipo == ExcecaoAgendamento.Tipo.CANCELADA:
+                    return None
+                return (day, excecao.nova_hora_inicio, excecao.nova_hora_fim)
+        return (day, slot.hora_inicio, slot.hora_fim)
+
+    def fingerprint(self) -> str:
+        """Stable hash of the rule, used to detect changes between generation runs."""
+        payload = (
+            [(s.weekday, s.hora_inicio.isoformat(), s.hora_fim.isoformat(), s.intervalo_semanas) for s in self.slots],
+            sorted(
+                (day.isoformat(), str(horario_id), exc.tipo, str(exc.nova_hora_inicio), str(exc.nova_hora_fim))
+                for day, by_horario in self.exceptions.items()
+                for horario_id, exc in by_horario.items()
+            ),
+            sorted(day.isoformat() for day in self.blackout),
+            self.anchor_monday.isoformat(),
+            self.inicio.isoformat() if self.inicio else "",
+        )
+        return hashlib.sha1(repr(payload).encode()).hexdigest()
+
+
+def prefetch_recurrence(queryset):
+    """Load everything `CompiledRecurrence.for_agendamento` reads in a constant number of queries."""
+    return queryset.select_related("ct").prefetch_related(
+        "horarios",
+        "excecoes",
+        Prefetch("ct__bloqueios", queryset=BloqueioCT.objects.only("id", "ct_id", "data")),
+    )
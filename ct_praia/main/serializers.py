@@ -6,16 +6,90 @@ from rest_framework.validators import UniqueValidator
 from .models import (
     AgendamentoTreino,
     CentroTreinamento,
+    ExcecaoAgendamento,
     HorarioRecorrente,
     ProfessorCentroTreinamento,
     Inscricao,
+    TarefaRegeneracao,
     Treino,
     Usuario,
 )
+from .permissions import permission_context, professor_associado
+from .services import (
+    InscricaoDuplicada,
+    OcorrenciaInvalida,
+    TreinoLotado,
+    ocorrencia_chave,
+    reservar_vaga,
+    resolve_ocorrencia,
+    semana_de,
+)
 
 User = get_user_model()
 
 
+def query_param_set(request, name):
+    """Valores de `?name=a,b` como conjunto; None quando o parâmetro não foi enviado."""
+    if request is None or name not in request.query_params:
+        return None
+    return {item.strip() for item in request.query_params[name].split(',') if item.strip()}
+
+
+def sparse_params(request):
+    """(`fields`, `expand`) da requisição; ambos None significa resposta completa (legado)."""
+    return query_param_set(request, 'fields'), query_param_set(request, 'expand')
+
+
+class SparseFieldsMixin:
+    """`?fields=a,b` limita os campos; `?expand=x,x.y` inclui relações aninhadas.
+
+    Sem nenhum dos dois parâmetros a resposta é a completa de sempre (campos em
+    `default_expanded` incluídos). Com eles, os campos de `expandable_fields` só
+    aparecem quando o caminho correspondente é pedido em `expand`. Apenas o
+    serializer raiz lê a requisição; os aninhados recebem o restante do caminho.
+    """
+
+    # campo -> caminho de expansão (ex.: {'treino_detalhes': 'treino'})
+    expandable_fields = {}
+    default_expanded = ()
+
+    def __init__(self, *args, **kwargs):
+        self.expand = kwargs.pop('expand', None)
+        super().__init__(*args, **kwargs)
+
+    def _is_root(self):
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        return parent is None
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self._is_root():
+            only, expand = sparse_params(self.context.get('request'))
+        else:
+            only, expand = None, self.expand
+        if only is None and expand is None:
+            for name in self.expandable_fields:
+                if name not in self.default_expanded:
+                    fields.pop(name, None)
+            return fields
+
+        expand = expand or set()
+        expanded = set()
+        for name, path in self.expandable_fields.items():
+            if path not in expand:
+                fields.pop(name, None)
+                continue
+            expanded.add(name)
+            nested = fields.get(name)
+            if isinstance(nested, SparseFieldsMixin):
+                nested.expand = {item[len(path) + 1:] for item in expand if item.startswith(path + '.')}
+        if only is not None:
+            fields = {name: field for name, field in fields.items() if name in only or name in expanded}
+        return fields
+
+
 class LoginSerializer(serializers.Serializer):
     """Serializer para login de usuários"""
     username = serializers.CharField(required=True, help_text="Nome de usuário")
@@ -146,7 +220,16 @@ class SignupSerializer(serializers.ModelSerializer):
         return user
 
 
-class CentroTreinamentoSerializer(serializers.ModelSerializer):
+class CentroTreinamentoResumoSerializer(serializers.ModelSerializer):
+    """CT aninhado em `?expand=ct` / `?expand=treino.ct`"""
+
+    class Meta:
+        model = CentroTreinamento
+        fields = ['id', 'nome', 'endereco', 'contato', 'latitude', 'longitude']
+        read_only_fields = fields
+
+
+class CentroTreinamentoSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Serializer para Centro de Treinamento"""
     gerente_nome = serializers.CharField(
         source='gerente.get_full_name',
@@ -182,14 +265,16 @@ class ProfessorCentroTreinamentoSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'criado_em', 'atualizado_em']
 
 
-class TreinoSerializer(serializers.ModelSerializer):
+class TreinoSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Serializer para Treino"""
     ct_nome = serializers.CharField(source='ct.nome', read_only=True)
+    ct_detalhes = CentroTreinamentoResumoSerializer(source='ct', read_only=True)
     professor_nome = serializers.CharField(
         source='professor.get_full_name',
         read_only=True
     )
     vagas_disponiveis = serializers.SerializerMethodField()
+    ocorrencia = serializers.SerializerMethodField()
     
     class Meta:
         model = Treino
@@ -197,16 +282,23 @@ class TreinoSerializer(serializers.ModelSerializer):
             'id', 'ct', 'ct_nome', 'professor', 'professor_nome',
             'modalidade', 'data', 'hora_inicio', 'hora_fim',
             'vagas', 'vagas_disponiveis', 'nivel', 'observacoes',
-            'agendado', 'agendamento'
+            'agendado', 'agendamento', 'ocorrencia', 'sorteio_encerra_em', 'ct_detalhes'
         ]
         read_only_fields = ['id', 'agendado', 'agendamento']
+    expandable_fields = {'ct_detalhes': 'ct'}
     
+    def get_ocorrencia(self, obj):
+        # Identificador da ocorrência recorrente (também presente nas virtuais, sem id)
+        if not obj.agendamento_id:
+            return None
+        return ocorrencia_chave(obj.agendamento_id, obj.data, obj.hora_inicio, obj.hora_fim)
+
     def get_vagas_disponiveis(self, obj):
-        # Contar inscrições confirmadas e pendentes (excluir canceladas)
-        inscricoes_ativas = obj.inscricoes.filter(
-            status__in=[Inscricao.Status.CONFIRMADA, Inscricao.Status.PENDENTE]
-        ).count()
-        return max(0, obj.vagas - inscricoes_ativas)
+        if obj.pk is None:
+            # Ocorrência virtual: ainda não existe inscrição
+            return obj.vagas
+        # Confirmadas + pendentes: contadores mantidos no próprio treino
+        return max(0, obj.vagas - obj.inscritos_confirmados - obj.inscritos_pendentes)
     
     def validate(self, attrs):
         # Validar horários
@@ -218,27 +310,28 @@ class TreinoSerializer(serializers.ModelSerializer):
         
         ct = attrs.get('ct') or getattr(self.instance, 'ct', None)
         professor = attrs.get('professor') or getattr(self.instance, 'professor', None)
+        request = self.context.get('request')
+        perfil = permission_context(request.user) if request else None
 
         # Professor deve pertencer ao CT
-        if ct and professor and not ct.professores.filter(pk=professor.pk).exists():
+        if ct and professor and not professor_associado(ct, professor, perfil):
             raise serializers.ValidationError({
                 "professor": "Professor não está associado a este CT."
             })
 
-        request = self.context.get('request')
         if request and ct:
             user = request.user
             if not user.is_superuser:
-                if not hasattr(user, 'usuario'):
+                if not perfil.tem_perfil:
                     raise serializers.ValidationError({"ct": "Usuário sem perfil associado."})
-                if user.usuario.tipo == Usuario.Tipo.GERENTE:
+                if perfil.is_gerente:
                     if ct.gerente_id != user.id:
                         raise serializers.ValidationError({"ct": "Apenas o gerente do CT pode criar ou editar treinos aqui."})
-                elif user.usuario.tipo == Usuario.Tipo.PROFESSOR:
+                elif perfil.is_professor:
                     # Professores só manipulam treinos nos quais são o professor
                     if professor and professor.id != user.id:
                         raise serializers.ValidationError({"professor": "Professores só podem manipular seus próprios treinos."})
-                    if not ct.professores.filter(pk=user.pk).exists():
+                    if perfil.vinculo(ct.pk) is None:
                         raise serializers.ValidationError({"ct": "Você não está associado a este Centro de Treinamento."})
                 else:
                     raise serializers.ValidationError({"ct": "Somente gerente ou professor podem manipular treinos."})
@@ -246,12 +339,66 @@ class TreinoSerializer(serializers.ModelSerializer):
         return attrs
 
 
+# Colunas de `treino_values` (`inscricoes_ativas` é anotada por ela).
+TREINO_VALUES_FIELDS = (
+    'id', 'ct_id', 'ct__nome', 'professor_id', 'professor__first_name', 'professor__last_name',
+    'modalidade', 'data', 'hora_inicio', 'hora_fim', 'vagas', 'inscricoes_ativas',
+    'nivel', 'observacoes', 'agendado', 'agendamento_id', 'sorteio_encerra_em',
+)
+
+
+def treino_values(queryset):
+    """Projeção `values()` com tudo o que `TreinoSerializer` expõe."""
+    return queryset.com_inscricoes_ativas().values(*TREINO_VALUES_FIELDS)
+
+
+def serialize_treino_rows(rows):
+    """Mesma saída de `TreinoSerializer(many=True).data` a partir de `treino_values`.
+
+    Caminho rápido das leituras: não instancia `Treino`/`CentroTreinamento`/`User` nem
+    percorre os campos do serializer linha a linha. Datas e horários usam os próprios
+    campos do `TreinoSerializer`, respeitando `DATE_FORMAT`/`TIME_FORMAT`.
+    """
+    fields = TreinoSerializer().fields
+    data_repr = fields['data'].to_representation
+    inicio_repr = fields['hora_inicio'].to_representation
+    fim_repr = fields['hora_fim'].to_representation
+    sorteio_repr = fields['sorteio_encerra_em'].to_representation
+    result = []
+    for row in rows:
+        agendamento_id = row['agendamento_id']
+        result.append({
+            'id': row['id'],
+            'ct': row['ct_id'],
+            'ct_nome': row['ct__nome'],
+            'professor': row['professor_id'],
+            # Mesma regra de User.get_full_name()
+            'professor_nome': f"{row['professor__first_name']} {row['professor__last_name']}".strip(),
+            'modalidade': row['modalidade'],
+            'data': data_repr(row['data']),
+            'hora_inicio': inicio_repr(row['hora_inicio']),
+            'hora_fim': fim_repr(row['hora_fim']),
+            'vagas': row['vagas'],
+            'vagas_disponiveis': max(0, row['vagas'] - row['inscricoes_ativas']),
+            'nivel': row['nivel'],
+            'observacoes': row['observacoes'],
+            'agendado': row['agendado'],
+            'agendamento': agendamento_id,
+            'ocorrencia': (
+                ocorrencia_chave(agendamento_id, row['data'], row['hora_inicio'], row['hora_fim'])
+                if agendamento_id else None
+            ),
+            'sorteio_encerra_em': row['sorteio_encerra_em'] and sorteio_repr(row['sorteio_encerra_em']),
+        })
+    return result
+
+
 class HorarioRecorrenteSerializer(serializers.ModelSerializer):
     dia_semana_label = serializers.CharField(source='get_dia_semana_display', read_only=True)
 
     class Meta:
         model = HorarioRecorrente
-        fields = ['id', 'dia_semana', 'dia_semana_label', 'hora_inicio', 'hora_fim']
+        fields = ['id', 'dia_semana', 'dia_semana_label', 'hora_inicio', 'hora_fim', 'intervalo_semanas']
         read_only_fields = ['id', 'dia_semana_label']
 
     def validate(self, attrs):
@@ -260,8 +407,27 @@ class HorarioRecorrenteSerializer(serializers.ModelSerializer):
         return attrs
 
 
-class AgendamentoTreinoSerializer(serializers.ModelSerializer):
+class ExcecaoAgendamentoSerializer(serializers.ModelSerializer):
+    """Exceção de uma data inteira do agendamento (cancelamento ou remarcação)"""
+
+    class Meta:
+        model = ExcecaoAgendamento
+        fields = ['id', 'data', 'tipo', 'nova_hora_inicio', 'nova_hora_fim', 'motivo']
+        read_only_fields = ['id']
+
+    def validate(self, attrs):
+        if attrs.get('tipo') == ExcecaoAgendamento.Tipo.REMARCADA:
+            inicio, fim = attrs.get('nova_hora_inicio'), attrs.get('nova_hora_fim')
+            if not inicio or not fim:
+                raise serializers.ValidationError('Informe o novo horário da ocorrência remarcada.')
+            if fim <= inicio:
+                raise serializers.ValidationError({'nova_hora_fim': 'Hora fim deve ser após a hora início.'})
+        return attrs
+
+
+class AgendamentoTreinoSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     horarios = HorarioRecorrenteSerializer(many=True)
+    excecoes = ExcecaoAgendamentoSerializer(many=True, required=False)
     ct_nome = serializers.CharField(source='ct.nome', read_only=True)
     professor_nome = serializers.CharField(source='professor.get_full_name', read_only=True)
 
@@ -269,8 +435,8 @@ class AgendamentoTreinoSerializer(serializers.ModelSerializer):
         model = AgendamentoTreino
         fields = [
             'id', 'ct', 'ct_nome', 'professor', 'professor_nome',
-            'modalidade', 'vagas', 'nivel', 'observacoes',
-            'horarios', 'criado_em', 'atualizado_em'
+            'modalidade', 'vagas', 'nivel', 'observacoes', 'inicio_vigencia', 'janela_sorteio',
+            'horarios', 'excecoes', 'criado_em', 'atualizado_em'
         ]
         read_only_fields = ['id', 'professor_nome', 'criado_em', 'atualizado_em']
 
@@ -279,6 +445,12 @@ class AgendamentoTreinoSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError('Informe ao menos um dia/horário para o agendamento.')
         return value
 
+    def validate_excecoes(self, value):
+        datas = [excecao['data'] for excecao in value]
+        if len(datas) != len(set(datas)):
+            raise serializers.ValidationError('Informe no máximo uma exceção por data.')
+        return value
+
     def validate(self, attrs):
         horarios = self.initial_data.get('horarios')
         if not horarios:
@@ -287,41 +459,49 @@ class AgendamentoTreinoSerializer(serializers.ModelSerializer):
         ct = attrs.get('ct') or getattr(self.instance, 'ct', None)
         professor = attrs.get('professor') or getattr(self.instance, 'professor', None)
 
+        perfil = permission_context(request.user) if request else None
+
         if request and ct and not request.user.is_superuser:
             user = request.user
-            if not hasattr(user, 'usuario'):
+            if not perfil.tem_perfil:
                 raise serializers.ValidationError({'ct': 'Usuário sem perfil associado.'})
 
-            if user.usuario.tipo == Usuario.Tipo.GERENTE:
+            if perfil.is_gerente:
                 if ct.gerente_id != user.id:
                     raise serializers.ValidationError({'ct': 'Apenas o gerente do CT pode gerenciar agendamentos deste CT.'})
-            elif user.usuario.tipo == Usuario.Tipo.PROFESSOR:
+            elif perfil.is_professor:
                 if professor and professor.id != user.id:
                     raise serializers.ValidationError({'professor': 'Professores só podem criar/editar agendamentos em que são responsáveis.'})
-                if not ct.professores.filter(pk=user.pk).exists():
+                if perfil.vinculo(ct.pk) is None:
                     raise serializers.ValidationError({'ct': 'Você não está associado a este CT.'})
             else:
                 raise serializers.ValidationError({'ct': 'Somente gerente ou professor podem gerenciar agendamentos.'})
 
-        if ct and professor and not ct.professores.filter(pk=professor.pk).exists():
+        if ct and professor and not professor_associado(ct, professor, perfil):
             raise serializers.ValidationError({'professor': 'Professor não está associado a este CT.'})
 
         return super().validate(attrs)
 
     def create(self, validated_data):
         horarios_data = validated_data.pop('horarios', [])
+        excecoes_data = validated_data.pop('excecoes', [])
         agendamento = AgendamentoTreino.objects.create(**validated_data)
         self._recreate_horarios(agendamento, horarios_data)
+        self._recreate_excecoes(agendamento, excecoes_data)
         return agendamento
 
     def update(self, instance, validated_data):
         horarios_data = validated_data.pop('horarios', None)
+        excecoes_data = validated_data.pop('excecoes', None)
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
         instance.save()
         if horarios_data is not None:
-            instance.horarios.all().delete()
-            self._recreate_horarios(instance, horarios_data)
+            self._sync_horarios(instance, horarios_data)
+        if excecoes_data is not None:
+            # A API só escreve exceções da data inteira; as por horário (admin) ficam
+            instance.excecoes.filter(horario__isnull=True).delete()
+            self._recreate_excecoes(instance, excecoes_data)
         return instance
 
     def _recreate_horarios(self, agendamento, horarios_data):
@@ -331,31 +511,111 @@ class AgendamentoTreinoSerializer(serializers.ModelSerializer):
                 dia_semana=horario['dia_semana'],
                 hora_inicio=horario['hora_inicio'],
                 hora_fim=horario['hora_fim'],
+                intervalo_semanas=horario.get('intervalo_semanas', 1),
             )
 
+    def _sync_horarios(self, agendamento, horarios_data):
+        """Atualiza os horários no lugar (casando dia e horário) em vez de recriá-los.
+
+        As exceções por horário apontam para o `HorarioRecorrente` (CASCADE): recriar
+        todos apagaria as exceções dos horários que continuam no agendamento.
+        """
+        existentes = {
+            (horario.dia_semana, horario.hora_inicio, horario.hora_fim): horario
+            for horario in agendamento.horarios.all()
+        }
+        novos = []
+        for dados in horarios_data:
+            horario = existentes.pop((dados['dia_semana'], dados['hora_inicio'], dados['hora_fim']), None)
+            if horario is None:
+                novos.append(dados)
+                continue
+            intervalo = dados.get('intervalo_semanas', 1)
+            if horario.intervalo_semanas != intervalo:
+                horario.intervalo_semanas = intervalo
+                horario.save(update_fields=['intervalo_semanas'])
+        if existentes:
+            HorarioRecorrente.objects.filter(pk__in=[horario.pk for horario in existentes.values()]).delete()
+        self._recreate_horarios(agendamento, novos)
+
+    def _recreate_excecoes(self, agendamento, excecoes_data):
+        ExcecaoAgendamento.objects.bulk_create(
+            ExcecaoAgendamento(agendamento=agendamento, **excecao) for excecao in excecoes_data
+        )
+
+
+class TarefaRegeneracaoSerializer(serializers.ModelSerializer):
+    """Situação da regeneração assíncrona de um agendamento"""
+
+    class Meta:
+        model = TarefaRegeneracao
+        fields = [
+            'id', 'agendamento', 'status', 'tentativas', 'max_tentativas',
+            'erro', 'criadas', 'atualizadas', 'removidas',
+            'criado_em', 'iniciado_em', 'concluido_em',
+        ]
+        read_only_fields = fields
+
 
-class InscricaoSerializer(serializers.ModelSerializer):
+class InscricaoSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Serializer para Inscrição"""
     treino_detalhes = TreinoSerializer(source='treino', read_only=True)
     aluno_nome = serializers.CharField(
         source='aluno.get_full_name',
         read_only=True
     )
+    ocorrencia = serializers.CharField(
+        write_only=True,
+        required=False,
+        help_text="Identificador de ocorrência recorrente ainda não materializada (alternativa a `treino`)"
+    )
+    fila = serializers.BooleanField(
+        write_only=True,
+        required=False,
+        default=False,
+        help_text="Se o treino estiver lotado, entrar na lista de espera (status ESPERA) em vez de recusar",
+    )
     
     class Meta:
         model = Inscricao
         fields = [
             'id', 'treino', 'treino_detalhes', 'aluno', 'aluno_nome',
-            'status', 'criado_em'
+            'status', 'criado_em', 'ocorrencia', 'fila'
         ]
         read_only_fields = ['id', 'aluno', 'criado_em']
+        extra_kwargs = {'treino': {'required': False}}
+    expandable_fields = {'treino_detalhes': 'treino'}
+    default_expanded = ('treino_detalhes',)
     
     def validate(self, attrs):
+        # Ocorrência virtual: aqui só é validada (Treino não salvo); a view a materializa
+        # depois que a inscrição passar por todas as verificações
+        chave = attrs.pop('ocorrencia', None)
+        if chave and not attrs.get('treino'):
+            try:
+                attrs['treino'] = resolve_ocorrencia(chave)
+            except OcorrenciaInvalida as exc:
+                raise serializers.ValidationError({"ocorrencia": str(exc)})
+        if not attrs.get('treino') and not self.instance:
+            raise serializers.ValidationError({"treino": "Informe o treino ou a ocorrência."})
+        if self.instance is not None:
+            # Mudanças de status/treino passam pelos serviços, que reservam a vaga atomicamente
+            # (`confirmar`, `cancelar`, nova inscrição); pelo PATCH elas furariam o limite de vagas.
+            for campo, atual in (('status', self.instance.status), ('treino', self.instance.treino)):
+                if campo in attrs and attrs[campo] != atual:
+                    raise serializers.ValidationError({
+                        campo: "Não pode ser alterado por aqui; use as ações confirmar/cancelar ou uma nova inscrição."
+                    })
+        elif attrs.get('status') == Inscricao.Status.ESPERA:
+            raise serializers.ValidationError({
+                "status": "A lista de espera é controlada pelo servidor; envie `fila` para entrar nela."
+            })
+
         # Verificar se o aluno já está inscrito neste treino
         treino = attrs.get('treino')
         request = self.context.get('request')
         
-        if treino and request:
+        if treino and treino.pk is not None and request:
             # Verificar se já existe uma inscrição
             inscricao_existente = Inscricao.objects.filter(
                 treino=treino,
@@ -367,14 +627,74 @@ class InscricaoSerializer(serializers.ModelSerializer):
                     "treino": "Você já está inscrito neste treino."
                 })
         
-        # Verificar se ainda há vagas (contar apenas confirmadas e pendentes)
-        if treino:
-            inscricoes_ativas = treino.inscricoes.filter(
-                status__in=[Inscricao.Status.CONFIRMADA, Inscricao.Status.PENDENTE]
-            ).count()
-            if inscricoes_ativas >= treino.vagas:
+        # Verificar se ainda há vagas (contar apenas confirmadas e pendentes); a reserva
+        # definitiva é feita em `create` por `reservar_vaga`
+        if treino and not attrs.get('fila'):
+            if treino.inscritos_confirmados + treino.inscritos_pendentes >= treino.vagas:
                 raise serializers.ValidationError({
                     "treino": "Não há vagas disponíveis para este treino."
                 })
         
         return attrs
+
+    def create(self, validated_data):
+        try:
+            return reservar_vaga(
+                validated_data['treino'].pk,
+                validated_data['aluno'],
+                validated_data.get('status', Inscricao.Status.CONFIRMADA),
+                fila=validated_data.get('fila', False),
+            )
+        except (TreinoLotado, InscricaoDuplicada) as exc:
+            raise serializers.ValidationError({"treino": str(exc)})
+
+    def update(self, instance, validated_data):
+        validated_data.pop('fila', None)
+        return super().update(instance, validated_data)
+
+
+class InscricaoLoteSerializer(serializers.Serializer):
+    """Entrada de `POST /api/inscricoes/batch/`."""
+    treinos = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=200,
+        help_text="IDs dos treinos em que o aluno será inscrito",
+    )
+
+
+class TreinoLoteItemSerializer(serializers.ModelSerializer):
+    """Treino de `POST /api/treinos/bulk/`.
+
+    CT e professor chegam como ids e são resolvidos/autorizados uma vez por par na view,
+    em vez das consultas por item de `TreinoSerializer`.
+    """
+    ct = serializers.IntegerField(min_value=1)
+    professor = serializers.IntegerField(min_value=1, required=False)
+
+    class Meta:
+        model = Treino
+        fields = ['ct', 'professor', 'modalidade', 'data', 'hora_inicio', 'hora_fim', 'vagas', 'nivel', 'observacoes']
+
+    def validate(self, attrs):
+        if attrs['hora_fim'] <= attrs['hora_inicio']:
+            raise serializers.ValidationError({"hora_fim": "Hora fim deve ser após a hora início."})
+        return attrs
+
+
+class TreinoLoteSerializer(serializers.Serializer):
+    treinos = TreinoLoteItemSerializer(many=True, allow_empty=False, max_length=200)
+
+
+class ClonarSemanaSerializer(serializers.Serializer):
+    ct = serializers.PrimaryKeyRelatedField(queryset=CentroTreinamento.objects.all())
+    professor = serializers.IntegerField(
+        min_value=1, required=False, help_text="Copiar apenas os treinos deste professor"
+    )
+    origem = serializers.DateField(help_text="Qualquer dia da semana copiada")
+    destino = serializers.DateField(help_text="Qualquer dia da semana de destino")
+
+    def validate(self, attrs):
+        if semana_de(attrs['origem']) == semana_de(attrs['destino']):
+            raise serializers.ValidationError({"destino": "Escolha uma semana diferente da semana de origem."})
+        return attrs
@@ -1,16 +1,62 @@
 from __future__ import annotations
 
+import random
+from collections import defaultdict
 from dataclasses import dataclass
-from datetime import date, timedelta
-from typing import Iterable, Tuple
+from datetime import date, time, timedelta
+from time import perf_counter, sleep
+from typing import Iterable, Sequence, Tuple
 
-from django.db import transaction
+from django.conf import settings
+from django.db import IntegrityError, OperationalError, models, transaction
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, pre_delete
 from django.utils import timezone
 
-from .models import AgendamentoTreino, HorarioRecorrente, Treino
+from .models import (
+    STATUS_OCUPAM_VAGA,
+    AgendamentoTreino,
+    CentroTreinamento,
+    ExcecaoAgendamento,
+    HorarioRecorrente,
+    Inscricao,
+    IntencaoInscricao,
+    Treino,
+)
+from .metrics import invalidate_metrics
+from .recurrence import CompiledRecurrence, OcorrenciaKey, prefetch_recurrence
 
 
 DEFAULT_WINDOW_DAYS = 30
+DEFAULT_CHUNK_SIZE = 200
+DEFAULT_PURGE_BATCH_SIZE = 500
+LOCK_RETRY_ATTEMPTS = 7
+LOCK_RETRY_DELAY = 0.05
+
+
+class OcorrenciaInvalida(ValueError):
+    """Raised when an occurrence key does not match a slot of its agendamento."""
+
+
+class TreinoLotado(ValueError):
+    """Raised by `reservar_vaga` when the treino has no seat left."""
+
+
+class InscricaoDuplicada(ValueError):
+    """Raised by `reservar_vaga` when the aluno already holds an active inscricao."""
+
+
+class ConfirmacaoInvalida(ValueError):
+    """Raised by `confirmar_inscricao` when the inscricao is not PENDENTE."""
+
+
+def lazy_materialization_enabled() -> bool:
+    """Return True when recurring occurrences are virtual until first enrollment."""
+    return getattr(settings, "RECURRING_MATERIALIZATION_MODE", "eager") == "lazy"
+
+
+def virtual_horizon_days() -> int:
+    return getattr(settings, "RECURRING_VIRTUAL_HORIZON_DAYS", DEFAULT_WINDOW_DAYS)
 
 
 @dataclass(frozen=True)
@@ -29,52 +75,1190 @@ def compute_generation_window(start_date: date | None = None, days_ahead: int =
     return GenerationWindow(start=start_date, end=end_date)
 
 
+@dataclass(frozen=True)
+class RegenerationResult:
+    """Counts of rows touched while reconciling the occurrences of an agendamento."""
+
+    created: int = 0
+    updated: int = 0
+    deleted: int = 0
+    conflicts: int = 0  # ocorrências não geradas por sobreposição na agenda do professor
+
+    def __add__(self, other: "RegenerationResult") -> "RegenerationResult":
+        return RegenerationResult(
+            created=self.created + other.created,
+            updated=self.updated + other.updated,
+            deleted=self.deleted + other.deleted,
+            conflicts=self.conflicts + other.conflicts,
+        )
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.created or self.updated or self.deleted)
+
+
+@dataclass(frozen=True)
+class Conflito:
+    """Existing `Treino` overlapping a candidate occurrence."""
+
+    data: date
+    hora_inicio: time
+    hora_fim: time
+    treino_id: int | None  # None: outro treino do mesmo lote
+    ct_id: int
+    professor_id: int
+    treino_inicio: time
+    treino_fim: time
+    motivo: str  # "professor", "ct" ou "lote"
+
+
+def find_conflicts(
+    candidates: Iterable[OcorrenciaKey],
+    professor_id: int,
+    ct_id: int | None = None,
+    exclude_agendamento_id: int | None = None,
+    exclude_treino_ids: Iterable[int] = (),
+) -> list[Conflito]:
+    """Return the existing treinos overlapping any of the candidate intervals.
+
+    Os candidatos são verificados contra a agenda inteira do professor (em todos os
+    CTs) e, se `ct_id` for informado, também contra os treinos do CT. Uma única
+    consulta (índices por professor/CT e data) traz a agenda do intervalo de datas;
+    a sobreposição é resolvida em memória com uma varredura ordenada por início.
+    """
+    by_date: dict[date, list[tuple[time, time]]] = defaultdict(list)
+    for data, hora_inicio, hora_fim in candidates:
+        by_date[data].append((hora_inicio, hora_fim))
+    if not by_date:
+        return []
+
+    scope = models.Q(professor_id=professor_id)
+    if ct_id is not None:
+        scope |= models.Q(ct_id=ct_id)
+    existing = Treino.objects.filter(scope, data__range=(min(by_date), max(by_date)))
+    if exclude_agendamento_id is not None:
+        existing = existing.exclude(agendamento_id=exclude_agendamento_id)
+    exclude_treino_ids = [pk for pk in exclude_treino_ids if pk is not None]
+    if exclude_treino_ids:
+        existing = existing.exclude(pk__in=exclude_treino_ids)
+
+    agenda: dict[date, list[tuple]] = defaultdict(list)
+    for row in existing.order_by("data", "hora_inicio").values_list(
+        "id", "ct_id", "professor_id", "data", "hora_inicio", "hora_fim"
+    ):
+        agenda[row[3]].append(row)
+
+    conflitos: list[Conflito] = []
+    for data, slots in sorted(by_date.items()):
+        treinos = agenda.get(data)
+        if not treinos:
+            continue
+        # Varredura: candidatos e treinos ordenados por início; `active` guarda os
+        # treinos já iniciados que ainda podem sobrepor o candidato corrente.
+        active: list[tuple] = []
+        next_treino = 0
+        for hora_inicio, hora_fim in sorted(slots):
+            while next_treino < len(treinos) and treinos[next_treino][4] < hora_fim:
+                active.append(treinos[next_treino])
+                next_treino += 1
+            active = [treino for treino in active if treino[5] > hora_inicio]
+            for treino_id, treino_ct, treino_professor, _, treino_inicio, treino_fim in active:
+                if treino_inicio >= hora_fim:
+                    continue
+                conflitos.append(
+                    Conflito(
+                        data=data,
+                        hora_inicio=hora_inicio,
+                        hora_fim=hora_fim,
+                        treino_id=treino_id,
+                        ct_id=treino_ct,
+                        professor_id=treino_professor,
+                        treino_inicio=treino_inicio,
+                        treino_fim=treino_fim,
+                        motivo="professor" if treino_professor == professor_id else "ct",
+                    )
+                )
+    return conflitos
+
+
+def _without_conflicts(agendamento: AgendamentoTreino, keys: list[OcorrenciaKey]) -> tuple[list[OcorrenciaKey], int]:
+    """Drop the occurrences that would overlap another treino of the professor."""
+    if not keys:
+        return keys, 0
+    conflitos = find_conflicts(keys, agendamento.professor_id, exclude_agendamento_id=agendamento.pk)
+    if not conflitos:
+        return keys, 0
+    blocked = {(c.data, c.hora_inicio, c.hora_fim) for c in conflitos}
+    return [key for key in keys if key not in blocked], len(blocked)
+
+
+# Campos copiados do agendamento para cada ocorrência gerada.
+SYNCED_FIELDS = ("ct", "professor", "modalidade", "vagas", "nivel", "observacoes")
+
+
+def _new_ocorrencia(agendamento: AgendamentoTreino, data: date, hora_inicio: time, hora_fim: time) -> Treino:
+    return Treino(
+        ct_id=agendamento.ct_id,
+        professor_id=agendamento.professor_id,
+        modalidade=agendamento.modalidade,
+        data=data,
+        hora_inicio=hora_inicio,
+        hora_fim=hora_fim,
+        vagas=agendamento.vagas,
+        nivel=agendamento.nivel,
+        observacoes=agendamento.observacoes,
+        agendado=True,
+        agendamento=agendamento,
+        sorteio_encerra_em=_fim_do_sorteio(agendamento),
+    )
+
+
+def _fim_do_sorteio(agendamento: AgendamentoTreino):
+    # A janela de sorteio de uma ocorrência começa quando ela passa a existir
+    if agendamento.janela_sorteio is None:
+        return None
+    return timezone.now() + agendamento.janela_sorteio
+
+
+def _sync_from_agendamento(treino: Treino, agendamento: AgendamentoTreino) -> bool:
+    """Copy the agendamento attributes into `treino`; return True when something changed."""
+    changed = False
+    for field in SYNCED_FIELDS:
+        attname = Treino._meta.get_field(field).attname
+        value = getattr(agendamento, attname)
+        if getattr(treino, attname) != value:
+            setattr(treino, attname, value)
+            changed = True
+    return changed
+
+
+def _mark_materialized(agendamento: AgendamentoTreino, until: date, rule: CompiledRecurrence) -> None:
+    # update() em vez de save(): não deve alterar `atualizado_em`
+    agendamento.materializado_ate = until
+    agendamento.materializado_em = timezone.now()
+    agendamento.horarios_assinatura = rule.fingerprint()
+    AgendamentoTreino.objects.filter(pk=agendamento.pk).update(
+        materializado_ate=agendamento.materializado_ate,
+        materializado_em=agendamento.materializado_em,
+        horarios_assinatura=agendamento.horarios_assinatura,
+    )
+
+
+def needs_full_regeneration(agendamento: AgendamentoTreino, rule: CompiledRecurrence) -> bool:
+    """True when the agendamento (horários, exceções ou bloqueios) changed since the last materialization."""
+    if agendamento.materializado_ate is None or agendamento.materializado_em is None:
+        return True
+    if agendamento.atualizado_em and agendamento.atualizado_em > agendamento.materializado_em:
+        return True
+    return agendamento.horarios_assinatura != rule.fingerprint()
+
+
+def sync_agendamento_ocorrencias(
+    agendamento: AgendamentoTreino,
+    start_date: date | None = None,
+    days_ahead: int = DEFAULT_WINDOW_DAYS,
+) -> RegenerationResult:
+    """Incremental counterpart of `regenerate_agendamento_ocorrencias`.
+
+    Se o agendamento não mudou desde a última execução, apenas as datas entre a marca
+    d'água (`materializado_ate`) e o fim da nova janela são acrescentadas; caso
+    contrário, a janela inteira é reconciliada.
+    """
+    rule = CompiledRecurrence.for_agendamento(agendamento)
+    if not rule:
+        return RegenerationResult()
+    if needs_full_regeneration(agendamento, rule):
+        return regenerate_agendamento_ocorrencias(agendamento, start_date=start_date, days_ahead=days_ahead)
+
+    window = compute_generation_window(start_date=start_date, days_ahead=days_ahead)
+    append_start = max(window.start, agendamento.materializado_ate + timedelta(days=1))
+    if append_start > window.end or lazy_materialization_enabled():
+        return RegenerationResult()
+
+    keys, conflicts = _without_conflicts(agendamento, rule.expand(append_start, window.end))
+    to_create = [_new_ocorrencia(agendamento, *key) for key in keys]
+    appended = Treino.objects.filter(agendamento=agendamento, data__range=(append_start, window.end))
+    created = 0
+    with transaction.atomic():
+        if to_create:
+            # A restrição treino_ocorrencia_unica descarta o que já existir; com
+            # ignore_conflicts o bulk_create não diz quantas linhas entraram, então conta-se
+            antes = appended.count()
+            Treino.objects.bulk_create(to_create, ignore_conflicts=True)
+            created = appended.count() - antes
+        _mark_materialized(agendamento, window.end, rule)
+    if created:
+        invalidate_metrics()
+    return RegenerationResult(created=created, conflicts=conflicts)
+
+
 def regenerate_agendamento_ocorrencias(
     agendamento: AgendamentoTreino,
     start_date: date | None = None,
     days_ahead: int = DEFAULT_WINDOW_DAYS,
-) -> int:
-    """Recreate every future `Treino` generated from `agendamento` inside the window.
+    materialize_missing: bool | None = None,
+) -> RegenerationResult:
+    """Reconcile the future `Treino` rows of `agendamento` with its recurrence rule.
 
-    Passado é mantido; apenas treinos a partir de `start_date` são recriados. Retorna
-    quantas ocorrências foram criadas.
+    Passado é mantido. A partir de `start_date`, calcula o conjunto desejado de
+    (data, hora_inicio, hora_fim), compara com as ocorrências existentes e executa
+    apenas `bulk_create` do que falta, `bulk_update` do que mudou e `delete` do que
+    ficou obsoleto. Ocorrências inalteradas (e suas inscrições) não são tocadas; uma
+    ocorrência remarcada na mesma data reaproveita a linha antiga (e as inscrições).
+    Ocorrências novas que sobreporiam outro treino do professor não são geradas e
+    ficam contadas em `conflicts`.
+
+    No modo lazy (`materialize_missing=False`, padrão quando
+    `RECURRING_MATERIALIZATION_MODE = "lazy"`) nada é criado: apenas as ocorrências já
+    materializadas são atualizadas ou removidas. Nesse modo a janela vai até o horizonte
+    virtual, onde a inscrição pode materializar ocorrências. Treinos além do fim da
+    janela nunca são tocados (a limpeza deles é `purge_future_treinos_beyond_window`).
     """
+    if materialize_missing is None:
+        materialize_missing = not lazy_materialization_enabled()
+    if lazy_materialization_enabled():
+        days_ahead = max(days_ahead, virtual_horizon_days())
 
     window = compute_generation_window(start_date=start_date, days_ahead=days_ahead)
-    horarios: Iterable[HorarioRecorrente] = list(agendamento.horarios.all())
-    if not horarios:
-        return 0
+    rule = CompiledRecurrence.for_agendamento(agendamento)
+    if not rule:
+        return RegenerationResult()
+
+    desired = rule.expand(window.start, window.end)
+    desired_set = set(desired)
 
     with transaction.atomic():
-        Treino.objects.filter(agendamento=agendamento, data__gte=window.start).delete()
-
-        created = 0
-        total_days = (window.end - window.start).days + 1
-        for offset in range(total_days):
-            current_date = window.start + timedelta(days=offset)
-            weekday = current_date.weekday()
-            for horario in horarios:
-                if horario.dia_semana != weekday:
-                    continue
-                Treino.objects.create(
-                    ct=agendamento.ct,
-                    professor=agendamento.professor,
-                    modalidade=agendamento.modalidade,
-                    data=current_date,
-                    hora_inicio=horario.hora_inicio,
-                    hora_fim=horario.hora_fim,
-                    vagas=agendamento.vagas,
-                    nivel=agendamento.nivel,
-                    observacoes=agendamento.observacoes,
-                    agendado=True,
-                    agendamento=agendamento,
+        existing = (
+            Treino.objects
+            .filter(agendamento=agendamento, data__range=(window.start, window.end))
+            .only("id", "data", "hora_inicio", "hora_fim", "atualizado_em", *SYNCED_FIELDS)
+            .order_by("pk")
+        )
+        kept: dict[OcorrenciaKey, Treino] = {}
+        obsolete: dict[date, list[Treino]] = defaultdict(list)
+        to_update: list[Treino] = []
+        for treino in existing:
+            key = (treino.data, treino.hora_inicio, treino.hora_fim)
+            if key not in desired_set or key in kept:
+                obsolete[treino.data].append(treino)
+                continue
+            kept[key] = treino
+            if _sync_from_agendamento(treino, agendamento):
+                to_update.append(treino)
+
+        missing = [key for key in desired if key not in kept and (materialize_missing or obsolete.get(key[0]))]
+        missing, conflicts = _without_conflicts(agendamento, missing)
+        to_create: list[Treino] = []
+        for key in missing:
+            reusable = obsolete.get(key[0])
+            if reusable:
+                treino = reusable.pop(0)
+                treino.hora_inicio, treino.hora_fim = key[1], key[2]
+                _sync_from_agendamento(treino, agendamento)
+                to_update.append(treino)
+            elif materialize_missing:
+                to_create.append(_new_ocorrencia(agendamento, *key))
+        obsolete_ids = [treino.pk for treinos in obsolete.values() for treino in treinos]
+
+        if obsolete_ids:
+            Treino.objects.filter(pk__in=obsolete_ids).delete()
+        if to_update:
+            # bulk_update não aplica auto_now; os ETags das listagens dependem dele
+            now = timezone.now()
+            for treino in to_update:
+                treino.atualizado_em = now
+            Treino.objects.bulk_update(to_update, (*SYNCED_FIELDS, "hora_inicio", "hora_fim", "atualizado_em"))
+        if to_create:
+            Treino.objects.bulk_create(to_create)
+        _mark_materialized(agendamento, window.end, rule)
+
+    if to_create or obsolete_ids:
+        invalidate_metrics()
+    return RegenerationResult(
+        created=len(to_create),
+        updated=len(to_update),
+        deleted=len(obsolete_ids),
+        conflicts=conflicts,
+    )
+
+
+def ocorrencia_chave(agendamento_id: int, data: date, hora_inicio: time, hora_fim: time) -> str:
+    """Stable identifier of a recurring slot, valid before and after materialization."""
+    return f"{agendamento_id}-{data:%Y%m%d}-{hora_inicio:%H%M}-{hora_fim:%H%M}"
+
+
+def parse_ocorrencia_chave(chave: str) -> Tuple[int, date, time, time]:
+    try:
+        agendamento_id, raw_data, raw_inicio, raw_fim = chave.split("-")
+        return (
+            int(agendamento_id),
+            date(int(raw_data[:4]), int(raw_data[4:6]), int(raw_data[6:8])),
+            time(int(raw_inicio[:2]), int(raw_inicio[2:])),
+            time(int(raw_fim[:2]), int(raw_fim[2:])),
+        )
+    except (AttributeError, ValueError) as exc:
+        raise OcorrenciaInvalida("Identificador de ocorrência inválido.") from exc
+
+
+def build_virtual_ocorrencias(
+    agendamentos: Iterable[AgendamentoTreino],
+    start_date: date,
+    end_date: date,
+) -> list[Treino]:
+    """Return unsaved `Treino` instances for slots of `agendamentos` not yet materialized.
+
+    Os agendamentos devem vir com `professor` e `prefetch_recurrence` aplicados. Cada
+    instância recebe `ocorrencia_chave` para que o cliente possa se inscrever nela.
+    """
+    agendamentos = list(agendamentos)
+    if not agendamentos or end_date < start_date:
+        return []
+    materialized = set(
+        Treino.objects
+        .filter(agendamento__in=agendamentos, data__range=(start_date, end_date))
+        .values_list("agendamento_id", "data", "hora_inicio", "hora_fim")
+    )
+
+    virtuais: list[Treino] = []
+    for agendamento in agendamentos:
+        for data, hora_inicio, hora_fim in CompiledRecurrence.for_agendamento(agendamento).expand(start_date, end_date):
+            if (agendamento.pk, data, hora_inicio, hora_fim) in materialized:
+                continue
+            treino = Treino(
+                ct=agendamento.ct,
+                professor=agendamento.professor,
+                modalidade=agendamento.modalidade,
+                data=data,
+                hora_inicio=hora_inicio,
+                hora_fim=hora_fim,
+                vagas=agendamento.vagas,
+                nivel=agendamento.nivel,
+                observacoes=agendamento.observacoes,
+                agendado=True,
+                agendamento=agendamento,
+            )
+            treino.ocorrencia_chave = ocorrencia_chave(agendamento.pk, data, hora_inicio, hora_fim)
+            virtuais.append(treino)
+    return virtuais
+
+
+def merge_ocorrencias(treinos: Iterable[Treino], virtuais: Iterable[Treino], newest_first: bool = True) -> list[Treino]:
+    """Merge real and virtual treinos; `newest_first` mirrors `Treino.Meta.ordering`."""
+    merged = sorted([*treinos, *virtuais], key=lambda treino: treino.hora_inicio)
+    merged.sort(key=lambda treino: treino.data, reverse=newest_first)
+    return merged
+
+
+def posicao_ocorrencia(treino: Treino) -> tuple:
+    """Position of a real or virtual treino in the lazy listing order.
+
+    Mesma ordem de `merge_ocorrencias` (data desc, hora_inicio asc); no mesmo horário
+    os treinos reais vêm antes (por id) e as ocorrências virtuais depois (pela chave).
+    """
+    if treino.pk is not None:
+        return (treino.data, treino.hora_inicio, treino.pk, None)
+    return (treino.data, treino.hora_inicio, None, treino.ocorrencia_chave)
+
+
+def _ordem_ocorrencia(posicao: tuple) -> tuple:
+    data, hora_inicio, pk, chave = posicao
+    return (-data.toordinal(), hora_inicio, pk is None, pk or 0, chave or "")
+
+
+def pagina_ocorrencias(
+    treinos: models.QuerySet,
+    agendamentos: Iterable[AgendamentoTreino],
+    start_date: date,
+    end_date: date,
+    limit: int,
+    after: tuple | None = None,
+    first_chunk_days: int = 7,
+) -> list[Treino]:
+    """Return the first `limit` real and virtual treinos after `after`, in listing order.
+
+    Lê no máximo `limit` treinos reais pelo keyset e expande as ocorrências virtuais
+    só no intervalo de datas que a página pode alcançar, em blocos crescentes a partir
+    da data mais nova: o custo da página não depende do tamanho da agenda.
+    """
+    treinos = treinos.order_by("-data", "hora_inicio", "id")
+    if after is not None:
+        data, hora_inicio, pk, _ = after
+        mesma_data = models.Q(data=data, hora_inicio__gt=hora_inicio)
+        if pk is not None:
+            mesma_data |= models.Q(data=data, hora_inicio=hora_inicio, pk__gt=pk)
+        treinos = treinos.filter(models.Q(data__lt=data) | mesma_data)
+        end_date = min(end_date, data)
+    reais = list(treinos[:limit])
+    # Só ocorrências a partir da data do último real lido podem entrar na página
+    limite_inferior = max(start_date, reais[-1].data) if len(reais) == limit else start_date
+
+    agendamentos = list(agendamentos)
+    virtuais: list[Treino] = []
+    fim, dias = end_date, first_chunk_days
+    while agendamentos and fim >= limite_inferior:
+        inicio = max(limite_inferior, fim - timedelta(days=dias - 1))
+        bloco = build_virtual_ocorrencias(agendamentos, inicio, fim)
+        if after is not None:
+            chave_after = _ordem_ocorrencia(after)
+            bloco = [treino for treino in bloco if _ordem_ocorrencia(posicao_ocorrencia(treino)) > chave_after]
+        virtuais.extend(bloco)
+        # Tudo o que é mais antigo que `inicio` vem depois das linhas já conhecidas
+        if len(virtuais) + sum(1 for treino in reais if treino.data >= inicio) >= limit:
+            break
+        fim, dias = inicio - timedelta(days=1), dias * 2
+
+    merged = sorted([*reais, *virtuais], key=lambda treino: _ordem_ocorrencia(posicao_ocorrencia(treino)))
+    return merged[:limit]
+
+
+def resolve_ocorrencia(chave: str) -> Treino:
+    """Validate an occurrence key without writing anything.
+
+    Devolve o `Treino` já materializado ou, se ainda não existir, uma instância não salva
+    (com `ocorrencia_chave`) com os dados que a materialização usaria.
+    """
+    agendamento_id, data, hora_inicio, hora_fim = parse_ocorrencia_chave(chave)
+    agendamento = prefetch_recurrence(AgendamentoTreino.objects.filter(pk=agendamento_id)).first()
+    if agendamento is None:
+        raise OcorrenciaInvalida("Agendamento não encontrado.")
+    window = compute_generation_window(days_ahead=virtual_horizon_days())
+    slot = (data, hora_inicio, hora_fim)
+    if not window.start <= data <= window.end or slot not in CompiledRecurrence.for_agendamento(agendamento).expand(data, data):
+        raise OcorrenciaInvalida("Ocorrência não pertence à agenda deste agendamento.")
+
+    lookup = {"agendamento": agendamento, "data": data, "hora_inicio": hora_inicio, "hora_fim": hora_fim}
+    treino = Treino.objects.filter(**lookup).first()
+    if treino is not None:
+        return treino
+    if find_conflicts([slot], agendamento.professor_id, exclude_agendamento_id=agendamento.pk):
+        raise OcorrenciaInvalida("Ocorrência conflita com outro treino do professor.")
+    treino = Treino(
+        ct_id=agendamento.ct_id,
+        professor_id=agendamento.professor_id,
+        modalidade=agendamento.modalidade,
+        vagas=agendamento.vagas,
+        nivel=agendamento.nivel,
+        observacoes=agendamento.observacoes,
+        agendado=True,
+        sorteio_encerra_em=_fim_do_sorteio(agendamento),
+        **lookup,
+    )
+    treino.ocorrencia_chave = chave
+    return treino
+
+
+def materialize_ocorrencia(chave: str) -> Treino:
+    """Return the `Treino` row of a recurring slot, creating it on first use."""
+    treino = resolve_ocorrencia(chave)
+    if treino.pk is not None:
+        return treino
+    lookup = {
+        "agendamento": treino.agendamento,
+        "data": treino.data,
+        "hora_inicio": treino.hora_inicio,
+        "hora_fim": treino.hora_fim,
+    }
+    try:
+        with transaction.atomic():
+            treino.save()
+    except IntegrityError:
+        # Outra requisição materializou a mesma ocorrência ao mesmo tempo.
+        treino = Treino.objects.get(**lookup)
+    return treino
+
+
+@dataclass(frozen=True)
+class AgendamentoPreview:
+    window: GenerationWindow
+    ocorrencias: list[OcorrenciaKey]
+    conflitos: list[Conflito]
+
+
+def preview_agendamento(
+    ct: CentroTreinamento,
+    professor_id: int,
+    horarios: Iterable[dict],
+    excecoes: Iterable[dict] = (),
+    inicio_vigencia: date | None = None,
+    days_ahead: int = DEFAULT_WINDOW_DAYS,
+    agendamento: AgendamentoTreino | None = None,
+) -> AgendamentoPreview:
+    """Expand an unsaved agendamento in memory and list the treinos it would collide with.
+
+    Nada é gravado: os horários/exceções (dados validados do serializer) viram
+    instâncias não salvas e a regra é compilada como em `regenerate_agendamento_ocorrencias`.
+    Ao editar, as ocorrências do próprio `agendamento` são ignoradas, pois seriam substituídas.
+    """
+    anchor = inicio_vigencia
+    if anchor is None and agendamento is not None and agendamento.criado_em:
+        anchor = timezone.localdate(agendamento.criado_em)
+    rule = CompiledRecurrence.compile(
+        [HorarioRecorrente(**horario) for horario in horarios],
+        [ExcecaoAgendamento(**excecao) for excecao in excecoes],
+        ct.bloqueios.values_list("data", flat=True),
+        anchor=anchor,
+        inicio=inicio_vigencia,
+    )
+    window = compute_generation_window(days_ahead=days_ahead)
+    ocorrencias = rule.expand(window.start, window.end)
+    conflitos = find_conflicts(
+        ocorrencias,
+        professor_id=professor_id,
+        ct_id=ct.pk,
+        exclude_agendamento_id=agendamento.pk if agendamento is not None else None,
+    )
+    return AgendamentoPreview(window=window, ocorrencias=ocorrencias, conflitos=conflitos)
+
+
+@dataclass(frozen=True)
+class ResultadoInscricao:
+    treino: int
+    status: str
+    inscricao: int | None = None
+    detalhe: str = ""
+
+
+class StatusLote:
+    INSCRITO = "inscrito"
+    JA_INSCRITO = "ja_inscrito"
+    SEM_VAGAS = "sem_vagas"
+    INEXISTENTE = "inexistente"
+    SORTEIO = "sorteio"
+
+
+def reservar_vaga(
+    treino_id: int, aluno, status: str = Inscricao.Status.CONFIRMADA, fila: bool = False
+) -> Inscricao:
+    """Take a seat in ``treino_id`` and create (or reactivate) the aluno's inscricao.
+
+    A vaga é reservada por uma UPDATE condicional no contador do treino (`com_vaga()`)
+    antes do INSERT: checar e reservar são a mesma instrução, então requisições
+    concorrentes nunca passam de `vagas`. Como a transação já começa escrevendo, o SQLite
+    não precisa promover uma leitura a escrita; bloqueios restantes são repetidos.
+
+    Treino lotado levanta `TreinoLotado`, ou, com ``fila=True``, põe o aluno no fim da
+    lista de espera (status ESPERA), de onde `promover_da_fila` o tira.
+    """
+    return _retry_on_lock(_reservar_vaga, treino_id, aluno, status, fila)
+
+
+def _reservar_vaga(treino_id, aluno, status, fila):
+    treinos = Treino.objects.filter(pk=treino_id)
+    ocupa_vaga = status in STATUS_OCUPAM_VAGA
+    # Treino já lotado: decide com uma leitura, sem disputar o lock de escrita à toa
+    tem_vaga = ocupa_vaga and treinos.com_vaga().exists()
+    if ocupa_vaga and not tem_vaga and not fila:
+        treinos.get()  # DoesNotExist se o treino não existe
+        raise TreinoLotado("Não há vagas disponíveis para este treino.")
+    with transaction.atomic():
+        if ocupa_vaga and not (tem_vaga and treinos.com_vaga().ajustar_inscritos({status: 1})):
+            if not fila:
+                treinos.get()
+                raise TreinoLotado("Não há vagas disponíveis para este treino.")
+            status = Inscricao.Status.ESPERA
+        if status == Inscricao.Status.ESPERA and not treinos.ajustar_inscritos({status: 1}):
+            treinos.get()
+        fila_desde = timezone.now() if status == Inscricao.Status.ESPERA else None
+        inscricao = Inscricao.objects.filter(treino_id=treino_id, aluno=aluno).first()
+        if inscricao is None:
+            # O contador já foi ajustado acima: grava sem passar por Inscricao.save()
+            try:
+                (inscricao,) = Inscricao.objects.bulk_create(
+                    [Inscricao(treino_id=treino_id, aluno=aluno, status=status, fila_desde=fila_desde)]
+                )
+            except IntegrityError:
+                # Outra requisição do mesmo aluno inseriu primeiro; a reserva é desfeita
+                raise InscricaoDuplicada("Você já está inscrito neste treino.")
+        elif inscricao.status == Inscricao.Status.CANCELADA:
+            inscricao.status = status
+            inscricao.fila_desde = fila_desde
+            inscricao.atualizado_em = timezone.now()
+            Inscricao.objects.filter(pk=inscricao.pk).update(
+                status=status, fila_desde=fila_desde, atualizado_em=inscricao.atualizado_em
+            )
+        else:
+            raise InscricaoDuplicada("Você já está inscrito neste treino.")
+    return inscricao
+
+
+def promover_da_fila(treino_id: int) -> Inscricao | None:
+    """Move the head of the treino's waitlist into a free seat, if there is one.
+
+    Custo fixo, qualquer que seja o tamanho da fila: uma UPDATE condicional nos contadores
+    (há vaga e `inscritos_espera` > 0), que também serializa promoções concorrentes do mesmo
+    treino, e só então a leitura do primeiro da fila pelo índice `inscricao_fila_idx`.
+    Deve rodar na transação que liberou a vaga.
+    """
+    movida = (
+        Treino.objects.filter(pk=treino_id, inscritos_espera__gt=0)
+        .com_vaga()
+        .ajustar_inscritos({Inscricao.Status.ESPERA: -1, Inscricao.Status.CONFIRMADA: 1})
+    )
+    if not movida:
+        return None
+    primeira = (
+        Inscricao.objects.filter(treino_id=treino_id, status=Inscricao.Status.ESPERA)
+        .order_by("fila_desde", "id")
+        .first()
+    )
+    if primeira is None:
+        # Contador divergente (ver `reconciliar_inscritos`): desfaz a movimentação
+        Treino.objects.filter(pk=treino_id).ajustar_inscritos(
+            {Inscricao.Status.ESPERA: 1, Inscricao.Status.CONFIRMADA: -1}
+        )
+        return None
+    primeira.status = Inscricao.Status.CONFIRMADA
+    primeira.fila_desde = None
+    primeira.atualizado_em = timezone.now()
+    Inscricao.objects.filter(pk=primeira.pk).update(
+        status=primeira.status, fila_desde=None, atualizado_em=primeira.atualizado_em
+    )
+    return primeira
+
+
+def cancelar_inscricao(inscricao: Inscricao, excluir: bool = False) -> Inscricao | None:
+    """Cancel (or delete, with ``excluir``) an inscricao and promote the waitlist into its seat.
+
+    Returns the promoted inscricao, if any.
+    """
+    with transaction.atomic():
+        if excluir:
+            inscricao.delete()
+        else:
+            inscricao.status = Inscricao.Status.CANCELADA
+            inscricao.fila_desde = None
+            inscricao.save(update_fields=["status", "fila_desde", "atualizado_em"])
+        return promover_da_fila(inscricao.treino_id)
+
+
+def confirmar_inscricao(inscricao: Inscricao) -> Inscricao:
+    """Move a PENDENTE inscricao to CONFIRMADA without ever taking a seat that is not free.
+
+    A pendente já ocupa uma das vagas, então a UPDATE condicional nos contadores usa
+    `com_vaga(0)`: só recusa treinos já acima da capacidade (ex.: vagas reduzidas depois).
+    Inscrições na lista de espera só saem dela por `promover_da_fila`; canceladas, por
+    uma nova inscrição (`reservar_vaga`).
+    """
+    if inscricao.status == Inscricao.Status.CONFIRMADA:
+        return inscricao
+    if inscricao.status == Inscricao.Status.ESPERA:
+        raise ConfirmacaoInvalida("Inscrição na lista de espera: ela é confirmada automaticamente quando abrir uma vaga.")
+    if inscricao.status != Inscricao.Status.PENDENTE:
+        raise ConfirmacaoInvalida("Inscrição cancelada: inscreva-se novamente.")
+    return _retry_on_lock(_confirmar_inscricao, inscricao)
+
+
+def _confirmar_inscricao(inscricao):
+    agora = timezone.now()
+    with transaction.atomic():
+        if not (
+            Treino.objects.filter(pk=inscricao.treino_id)
+            .com_vaga(0)
+            .ajustar_inscritos({Inscricao.Status.PENDENTE: -1, Inscricao.Status.CONFIRMADA: 1})
+        ):
+            raise TreinoLotado("Não há vagas disponíveis para este treino.")
+        if not Inscricao.objects.filter(pk=inscricao.pk, status=Inscricao.Status.PENDENTE).update(
+            status=Inscricao.Status.CONFIRMADA, atualizado_em=agora
+        ):
+            # Mudou de status desde a leitura: a exceção desfaz o ajuste dos contadores
+            raise ConfirmacaoInvalida("A inscrição mudou de status; recarregue e tente novamente.")
+    inscricao.status = Inscricao.Status.CONFIRMADA
+    inscricao.atualizado_em = agora
+    return inscricao
+
+
+def registrar_intencao(treino_id: int, aluno, prioridade: int = 0) -> None:
+    """Record the aluno's request to enter the lottery of ``treino_id``.
+
+    Um único INSERT OR IGNORE (repetir o pedido não dá uma segunda chance), sem ler nem
+    travar o treino: os pedidos da janela não disputam o lock das vagas.
+    """
+    IntencaoInscricao.objects.bulk_create(
+        [IntencaoInscricao(treino_id=treino_id, aluno=aluno, prioridade=prioridade)],
+        ignore_conflicts=True,
+    )
+
+
+@dataclass(frozen=True)
+class ResultadoSorteio:
+    treino: int
+    inscritos: int
+    espera: int
+
+
+def sortear_inscricoes(agora=None, seed: int | None = None) -> list[ResultadoSorteio]:
+    """Run the lottery of every treino whose window has closed.
+
+    Cada treino é reservado com uma UPDATE condicional em `sorteado_em` (dois workers não
+    sorteiam o mesmo treino). As intenções são ordenadas por prioridade e, nos empates,
+    ao acaso; as primeiras ocupam as vagas livres e as demais entram na lista de espera
+    na ordem sorteada. As `Inscricao` novas saem de um único `bulk_create`; as canceladas
+    do mesmo aluno são reativadas, como em `reservar_vaga`.
+    """
+    agora = agora or timezone.now()
+    rng = random.Random(seed)
+    _processar_intencoes_tardias()
+    candidatos = list(
+        Treino.objects.filter(sorteio_encerra_em__lte=agora, sorteado_em__isnull=True)
+        .com_inscricoes_ativas()
+        .values_list("pk", "vagas", "inscricoes_ativas")
+    )
+    if not candidatos:
+        return []
+    with transaction.atomic():
+        livres = {
+            treino_id: max(0, vagas - ocupadas)
+            for treino_id, vagas, ocupadas in candidatos
+            if Treino.objects.filter(pk=treino_id, sorteado_em__isnull=True).update(sorteado_em=agora)
+        }
+        # Inscrição cancelada não impede o sorteio: como em `reservar_vaga`, ela é reativada
+        ja_inscritos, canceladas = set(), {}
+        for pk, treino_id, aluno_id, status in Inscricao.objects.filter(treino_id__in=livres).values_list(
+            "pk", "treino_id", "aluno_id", "status"
+        ):
+            if status == Inscricao.Status.CANCELADA:
+                canceladas[treino_id, aluno_id] = pk
+            else:
+                ja_inscritos.add((treino_id, aluno_id))
+        intencoes = defaultdict(list)
+        for treino_id, aluno_id, prioridade in IntencaoInscricao.objects.filter(
+            treino_id__in=livres
+        ).order_by("pk").values_list("treino_id", "aluno_id", "prioridade"):
+            if (treino_id, aluno_id) not in ja_inscritos:
+                intencoes[treino_id].append((aluno_id, prioridade))
+
+        def inscrever(treino_id, aluno_id, status, fila_desde=None):
+            cancelada = canceladas.get((treino_id, aluno_id))
+            if cancelada is None:
+                novas.append(Inscricao(treino_id=treino_id, aluno_id=aluno_id, status=status, fila_desde=fila_desde))
+                return True
+            return bool(
+                Inscricao.objects.filter(pk=cancelada, status=Inscricao.Status.CANCELADA).update(
+                    status=status, fila_desde=fila_desde, atualizado_em=agora
                 )
-                created += 1
-    return created
+            )
+
+        novas, resultados = [], []
+        for treino_id, vagas in livres.items():
+            sorteio = intencoes[treino_id]
+            rng.shuffle(sorteio)
+            sorteio.sort(key=lambda intencao: -intencao[1])  # estável: mantém a ordem sorteada nos empates
+            ganhadores = sum(
+                inscrever(treino_id, aluno_id, Inscricao.Status.CONFIRMADA) for aluno_id, _ in sorteio[:vagas]
+            )
+            # `fila_desde` crescente na ordem sorteada: linhas reativadas mantêm o id antigo,
+            # então a ordem da fila não pode depender dele
+            fila = sum(
+                inscrever(treino_id, aluno_id, Inscricao.Status.ESPERA, agora + timedelta(microseconds=posicao))
+                for posicao, (aluno_id, _) in enumerate(sorteio[vagas:])
+            )
+            Treino.objects.filter(pk=treino_id).ajustar_inscritos(
+                {Inscricao.Status.CONFIRMADA: ganhadores, Inscricao.Status.ESPERA: fila}
+            )
+            resultados.append(ResultadoSorteio(treino_id, ganhadores, fila))
+        Inscricao.objects.bulk_create(novas)
+        IntencaoInscricao.objects.filter(treino_id__in=livres).delete()
+    return resultados
+
+
+def _processar_intencoes_tardias():
+    # Intenções gravadas enquanto o treino era sorteado: seguem o fluxo normal (vaga ou fila)
+    tardias = IntencaoInscricao.objects.filter(treino__sorteado_em__isnull=False).select_related("aluno")
+    for intencao in tardias:
+        try:
+            reservar_vaga(intencao.treino_id, intencao.aluno, fila=True)
+        except InscricaoDuplicada:
+            pass
+        intencao.delete()
+
+
+def inscrever_em_lote(aluno, treino_ids: Sequence[int]) -> list[ResultadoInscricao]:
+    """Enroll ``aluno`` in several treinos with one lookup, one seat UPDATE per treino and one INSERT.
+
+    Mesmas regras de `reservar_vaga` (inscrição repetida, cancelada reativada, vagas contando
+    confirmadas + pendentes). A leitura única só classifica os treinos; cada vaga é reservada
+    por uma UPDATE condicional (`com_vaga()`) no próprio treino e só os treinos cuja UPDATE
+    casou uma linha recebem inscrição, então lotes concorrentes nunca passam de `vagas`.
+    Cada item tem seu resultado; os que falham não impedem os demais.
+    """
+    ids = list(dict.fromkeys(treino_ids))
+    try:
+        return _retry_on_lock(_inscrever_em_lote, aluno, ids)
+    except IntegrityError:
+        # Outra requisição do mesmo aluno inseriu primeiro; a nova leitura a vê como inscrita
+        return _retry_on_lock(_inscrever_em_lote, aluno, ids)
+
+
+def _inscrever_em_lote(aluno, ids):
+    treinos = {
+        row["id"]: row
+        for row in Treino.objects.filter(pk__in=ids)
+        .order_by()
+        .com_inscricoes_ativas()
+        .annotate(
+            ja_inscrito=models.Exists(
+                Inscricao.objects.filter(treino=models.OuterRef("pk"), aluno=aluno).exclude(
+                    status=Inscricao.Status.CANCELADA
+                )
+            ),
+            # Como em `reservar_vaga`, uma inscrição cancelada é reativada em vez de duplicada
+            cancelada=models.Subquery(
+                Inscricao.objects.filter(
+                    treino=models.OuterRef("pk"), aluno=aluno, status=Inscricao.Status.CANCELADA
+                ).values("pk")[:1]
+            ),
+        )
+        .values("id", "vagas", "inscricoes_ativas", "ja_inscrito", "cancelada", "sorteio_encerra_em", "sorteado_em")
+    }
+    resultados: dict[int, ResultadoInscricao] = {}
+    candidatos, intencoes = [], []
+    for treino_id in ids:
+        row = treinos.get(treino_id)
+        if row is None:
+            resultados[treino_id] = ResultadoInscricao(treino_id, StatusLote.INEXISTENTE, detalhe="Treino não encontrado.")
+        elif row["ja_inscrito"]:
+            resultados[treino_id] = _ja_inscrito(treino_id)
+        elif row["sorteio_encerra_em"] is not None and row["sorteado_em"] is None:
+            intencoes.append(IntencaoInscricao(treino_id=treino_id, aluno=aluno))
+            resultados[treino_id] = ResultadoInscricao(
+                treino_id, StatusLote.SORTEIO, detalhe="Inscrição por sorteio: pedido registrado."
+            )
+        elif row["inscricoes_ativas"] >= row["vagas"]:
+            # Já lotado na leitura: nem disputa o lock de escrita
+            resultados[treino_id] = _sem_vagas(treino_id)
+        else:
+            candidatos.append(treino_id)
+    if not (candidatos or intencoes):
+        return [resultados[treino_id] for treino_id in ids]
+
+    with transaction.atomic():
+        IntencaoInscricao.objects.bulk_create(intencoes, ignore_conflicts=True)
+        novas, reativadas = [], {}
+        for treino_id in candidatos:
+            # Checar e reservar numa só instrução; bulk_create/update() não passam por Inscricao.save()
+            if not Treino.objects.filter(pk=treino_id).com_vaga().ajustar_inscritos({Inscricao.Status.CONFIRMADA: 1}):
+                resultados[treino_id] = _sem_vagas(treino_id)
+            elif treinos[treino_id]["cancelada"] is not None:
+                reativadas[treino_id] = treinos[treino_id]["cancelada"]
+            else:
+                novas.append(Inscricao(treino_id=treino_id, aluno=aluno))
+
+        for inscricao in Inscricao.objects.bulk_create(novas):
+            resultados[inscricao.treino_id] = ResultadoInscricao(
+                inscricao.treino_id, StatusLote.INSCRITO, inscricao=inscricao.pk
+            )
+        for treino_id, inscricao_id in reativadas.items():
+            if Inscricao.objects.filter(pk=inscricao_id, status=Inscricao.Status.CANCELADA).update(
+                status=Inscricao.Status.CONFIRMADA, fila_desde=None, atualizado_em=timezone.now()
+            ):
+                resultados[treino_id] = ResultadoInscricao(treino_id, StatusLote.INSCRITO, inscricao=inscricao_id)
+            else:
+                # Reativada por outra requisição depois da leitura: devolve a vaga reservada
+                Treino.objects.filter(pk=treino_id).ajustar_inscritos({Inscricao.Status.CONFIRMADA: -1})
+                resultados[treino_id] = _ja_inscrito(treino_id)
+    return [resultados[treino_id] for treino_id in ids]
+
+
+def _ja_inscrito(treino_id: int) -> ResultadoInscricao:
+    return ResultadoInscricao(treino_id, StatusLote.JA_INSCRITO, detalhe="Você já está inscrito neste treino.")
+
+
+def _sem_vagas(treino_id: int) -> ResultadoInscricao:
+    return ResultadoInscricao(treino_id, StatusLote.SEM_VAGAS, detalhe="Não há vagas disponíveis para este treino.")
+
 
+def _conflitos_no_lote(treinos: Sequence[Treino]) -> list[tuple[Treino, Conflito]]:
+    """Overlaps between the unsaved treinos themselves (same professor, same day)."""
+    conflitos = []
+    ultimo: dict[tuple[int, date], Treino] = {}
+    for treino in sorted(treinos, key=lambda t: (t.professor_id, t.data, t.hora_inicio, t.hora_fim)):
+        anterior = ultimo.get((treino.professor_id, treino.data))
+        if anterior is not None and anterior.hora_fim > treino.hora_inicio:
+            conflito = Conflito(
+                data=treino.data,
+                hora_inicio=treino.hora_inicio,
+                hora_fim=treino.hora_fim,
+                treino_id=None,
+                ct_id=anterior.ct_id,
+                professor_id=anterior.professor_id,
+                treino_inicio=anterior.hora_inicio,
+                treino_fim=anterior.hora_fim,
+                motivo="lote",
+            )
+            conflitos.append((treino, conflito))
+            continue
+        ultimo[(treino.professor_id, treino.data)] = treino
+    return conflitos
 
-def purge_future_treinos_beyond_window(days_ahead: int = DEFAULT_WINDOW_DAYS) -> int:
-    """Remove recurring treinos that are beyond the allowed window."""
+
+def criar_treinos_em_lote(treinos: Sequence[Treino], parcial: bool = False) -> tuple[list[Treino], list[Conflito]]:
+    """Insert unsaved manual treinos with one conflict query per professor and one INSERT.
+
+    Os conflitos são os mesmos da criação unitária (agenda do professor em qualquer CT)
+    mais as sobreposições dentro do próprio lote. Sem `parcial`, qualquer conflito
+    cancela o lote inteiro; com `parcial`, só os treinos em conflito ficam de fora.
+    """
+    no_lote = _conflitos_no_lote(treinos)
+    bloqueados = {id(treino) for treino, _ in no_lote}
+    conflitos = [conflito for _, conflito in no_lote]
+
+    por_professor: dict[int, list[Treino]] = defaultdict(list)
+    for treino in treinos:
+        por_professor[treino.professor_id].append(treino)
+    for professor_id, lote in por_professor.items():
+        encontrados = find_conflicts([(t.data, t.hora_inicio, t.hora_fim) for t in lote], professor_id)
+        ocupados = {(c.data, c.hora_inicio, c.hora_fim) for c in encontrados}
+        bloqueados |= {id(t) for t in lote if (t.data, t.hora_inicio, t.hora_fim) in ocupados}
+        conflitos += encontrados
+    if conflitos and not parcial:
+        return [], conflitos
+
+    with transaction.atomic():
+        criados = Treino.objects.bulk_create([t for t in treinos if id(t) not in bloqueados])
+    if criados:
+        invalidate_metrics()
+    return criados, conflitos
+
+
+def semana_de(dia: date) -> tuple[date, date]:
+    """Monday and Sunday of the week containing ``dia``."""
+    inicio = dia - timedelta(days=dia.weekday())
+    return inicio, inicio + timedelta(days=6)
+
+
+def copias_da_semana(ct_id: int, origem: date, destino: date, professor_id: int | None = None) -> list[Treino]:
+    """Unsaved copies of the manual treinos of a CT week, moved to the week of ``destino``.
+
+    Ocorrências de agendamentos ficam de fora: a regra recorrente já gera a outra semana.
+    """
+    inicio, fim = semana_de(origem)
+    deslocamento = semana_de(destino)[0] - inicio
+    treinos = Treino.objects.filter(ct_id=ct_id, agendamento__isnull=True, data__range=(inicio, fim))
+    if professor_id is not None:
+        treinos = treinos.filter(professor_id=professor_id)
+    return [
+        Treino(
+            ct_id=treino.ct_id,
+            professor_id=treino.professor_id,
+            modalidade=treino.modalidade,
+            data=treino.data + deslocamento,
+            hora_inicio=treino.hora_inicio,
+            hora_fim=treino.hora_fim,
+            vagas=treino.vagas,
+            nivel=treino.nivel,
+            observacoes=treino.observacoes,
+        )
+        for treino in treinos.order_by("data", "hora_inicio")
+    ]
+
+
+@dataclass(frozen=True)
+class ShardResult:
+    """Aggregated outcome of regenerating one shard of agendamentos."""
+
+    shard: int
+    agendamentos: int
+    result: RegenerationResult
+    elapsed: float
+
+
+def shard_agendamentos(rows: Iterable[Tuple[int, int]], shards: int) -> list[list[int]]:
+    """Split `(agendamento_id, ct_id)` pairs into at most `shards` buckets.
+
+    Todos os agendamentos de um mesmo CT ficam no mesmo shard; os CTs são
+    distribuídos do maior para o menor no shard menos carregado.
+    """
+    if shards < 1:
+        raise ValueError("shards deve ser maior que zero")
+    by_ct: dict[int, list[int]] = defaultdict(list)
+    for agendamento_id, ct_id in rows:
+        by_ct[ct_id].append(agendamento_id)
+
+    buckets: list[list[int]] = [[] for _ in range(shards)]
+    for ct_id in sorted(by_ct, key=lambda key: (-len(by_ct[key]), key)):
+        min(buckets, key=len).extend(by_ct[ct_id])
+    return [bucket for bucket in buckets if bucket]
+
+
+def _regenerate_with_retry(
+    agendamento: AgendamentoTreino,
+    start_date: date | None,
+    days_ahead: int,
+    incremental: bool = False,
+) -> RegenerationResult:
+    regenerate = sync_agendamento_ocorrencias if incremental else regenerate_agendamento_ocorrencias
+    return _retry_on_lock(regenerate, agendamento, start_date=start_date, days_ahead=days_ahead)
+
+
+def _retry_on_lock(func, *args, **kwargs):
+    # Com vários processos escrevendo no SQLite, a promoção de leitura para escrita
+    # pode falhar com "database is locked"; a transação inteira é repetida.
+    for attempt in range(LOCK_RETRY_ATTEMPTS):
+        try:
+            return func(*args, **kwargs)
+        except OperationalError as exc:
+            if "locked" not in str(exc) or attempt == LOCK_RETRY_ATTEMPTS - 1:
+                raise
+            # Jitter: transações que colidiram não tentam de novo todas ao mesmo tempo
+            sleep(LOCK_RETRY_DELAY * (2 ** attempt) * random.uniform(0.5, 1.5))
+    raise AssertionError("unreachable")
+
+
+def regenerate_shard(
+    shard: int,
+    agendamento_ids: Sequence[int],
+    start_date: date | None = None,
+    days_ahead: int = DEFAULT_WINDOW_DAYS,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    incremental: bool = False,
+) -> ShardResult:
+    """Regenerate every agendamento in `agendamento_ids`, loading them `chunk_size` at a time.
+
+    Com `incremental=True` usa `sync_agendamento_ocorrencias` (apenas acrescenta as
+    datas novas de agendamentos inalterados).
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size deve ser maior que zero")
+    started = perf_counter()
+    total = RegenerationResult()
+    for offset in range(0, len(agendamento_ids), chunk_size):
+        chunk = agendamento_ids[offset:offset + chunk_size]
+        agendamentos = prefetch_recurrence(AgendamentoTreino.objects.filter(pk__in=chunk).order_by("pk"))
+        for agendamento in agendamentos:
+            total += _regenerate_with_retry(agendamento, start_date, days_ahead, incremental)
+    return ShardResult(
+        shard=shard,
+        agendamentos=len(agendamento_ids),
+        result=total,
+        elapsed=perf_counter() - started,
+    )
+
+
+@dataclass(frozen=True)
+class PurgeResult:
+    """Outcome of `purge_future_treinos_beyond_window` (contagens previstas quando `dry_run`)."""
+
+    treinos: int = 0
+    inscricoes: int = 0
+    batches: int = 0
+    dry_run: bool = False
+
+    def __bool__(self) -> bool:
+        return bool(self.treinos)
+
+
+def _raw_purge_relations():
+    """Relations to delete by hand on the raw fast path, or None when it is not safe.
+
+    O caminho rápido só é usado quando todas as relações com `Treino` são CASCADE de um
+    único nível (ex.: `Inscricao`) e nenhum sinal de delete está conectado a elas nem a
+    `Treino` (as métricas não escutam o `post_delete` de `Treino`; a limpeza as invalida).
+    """
+    relations = []
+    for rel in Treino._meta.related_objects:
+        if rel.many_to_many or rel.on_delete is not models.CASCADE:
+            return None
+        if rel.related_model._meta.related_objects:
+            return None
+        relations.append(rel)
+    if pre_delete.has_listeners(Treino) or post_delete.has_listeners(Treino):
+        return None
+    for rel in relations:
+        if pre_delete.has_listeners(rel.related_model) or post_delete.has_listeners(rel.related_model):
+            return None
+    return relations
+
+
+def purge_future_treinos_beyond_window(
+    days_ahead: int = DEFAULT_WINDOW_DAYS,
+    batch_size: int = DEFAULT_PURGE_BATCH_SIZE,
+    dry_run: bool = False,
+    raw: bool = True,
+) -> PurgeResult:
+    """Remove recurring treinos that are beyond the allowed window.
+
+    A remoção é feita em lotes de `batch_size` chaves primárias, cada um na sua própria
+    transação curta, para não segurar o lock de escrita do SQLite. Com `raw=True` (e as
+    condições de `_raw_purge_relations`), cada lote vira dois DELETEs diretos, sem
+    carregar objetos, e as métricas são invalidadas explicitamente no fim.
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size deve ser maior que zero")
     window = compute_generation_window(days_ahead=days_ahead)
-    deleted, _ = Treino.objects.filter(agendado=True, data__gt=window.end).delete()
-    return deleted
\ No newline at end of file
+    beyond = Treino.objects.filter(agendado=True, data__gt=window.end)
+
+    if dry_run:
+        return PurgeResult(
+            treinos=beyond.count(),
+            inscricoes=Inscricao.objects.filter(treino__in=beyond).count(),
+            dry_run=True,
+        )
+
+    relations = _raw_purge_relations() if raw else None
+    treinos = inscricoes = batches = 0
+    while True:
+        with transaction.atomic():
+            ids = list(beyond.order_by("pk").values_list("pk", flat=True)[:batch_size])
+            if not ids:
+                break
+            if relations is not None:
+                for rel in relations:
+                    deleted = rel.related_model._base_manager.filter(
+                        **{f"{rel.field.name}__in": ids}
+                    )._raw_delete(Treino.objects.db)
+                    if rel.related_model is Inscricao:
+                        inscricoes += deleted
+                treinos += Treino._base_manager.filter(pk__in=ids)._raw_delete(Treino.objects.db)
+            else:
+                _, per_model = Treino.objects.filter(pk__in=ids).delete()
+                treinos += per_model.get(Treino._meta.label, 0)
+                inscricoes += per_model.get(Inscricao._meta.label, 0)
+        batches += 1
+    if treinos and relations is not None:
+        invalidate_metrics()  # os DELETEs diretos não disparam post_delete
+    return PurgeResult(treinos=treinos, inscricoes=inscricoes, batches=batches)
+
+
+def _inscritos_reais(status):
+    return Coalesce(
+        models.Subquery(
+            Inscricao.objects.filter(treino=models.OuterRef("pk"), status=status)
+            .order_by()
+            .values("treino")
+            .annotate(total=models.Count("pk"))
+            .values("total")
+        ),
+        0,
+    )
+
+
+def reconciliar_inscritos(dry_run: bool = False, batch_size: int = DEFAULT_PURGE_BATCH_SIZE) -> int:
+    """Recalcula os contadores `inscritos_*` dos treinos onde divergem das inscrições.
+
+    Corrige o que escapa de `Inscricao.save()/delete()` (updates em massa, exclusão de alunos
+    em cascata...). Retorna quantos treinos estavam divergentes.
+    """
+    confirmados = _inscritos_reais(Inscricao.Status.CONFIRMADA)
+    pendentes = _inscritos_reais(Inscricao.Status.PENDENTE)
+    espera = _inscritos_reais(Inscricao.Status.ESPERA)
+    divergentes = list(
+        Treino.objects.annotate(reais_confirmados=confirmados, reais_pendentes=pendentes, reais_espera=espera)
+        .exclude(
+            inscritos_confirmados=models.F("reais_confirmados"),
+            inscritos_pendentes=models.F("reais_pendentes"),
+            inscritos_espera=models.F("reais_espera"),
+        )
+        .order_by("pk")
+        .values_list("pk", flat=True)
+    )
+    if dry_run:
+        return len(divergentes)
+    for inicio in range(0, len(divergentes), batch_size):
+        with transaction.atomic():
+            Treino.objects.filter(pk__in=divergentes[inicio:inicio + batch_size]).update(
+                inscritos_confirmados=confirmados,
+                inscritos_pendentes=pendentes,
+                inscritos_espera=espera,
+                atualizado_em=timezone.now(),
+            )
+    return len(divergentes)
@@ -0,0 +1,64 @@
+"""Receivers that keep denormalized change markers and derived rows in sync."""
+
+from django.contrib.auth import get_user_model
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.utils import timezone
+
+from .jobs import schedule_regeneration
+from .models import AgendamentoTreino, BloqueioCT, CentroTreinamento, ProfessorCentroTreinamento, Usuario
+from .recurrence import prefetch_recurrence
+
+
+def touch_cts(q):
+    """Advance `CentroTreinamento.atualizado_em` of the CTs matching `q`.
+
+    A listagem de CTs exibe nomes de gerente e professores vindos de outras tabelas;
+    mexer no CT a cada mudança deles deixa o ETag num único agregado sobre os CTs.
+    """
+    CentroTreinamento.objects.filter(q).update(atualizado_em=timezone.now())
+
+
+def touch_profile(sender, instance, update_fields=None, **kwargs):
+    """Advance the markers of what displays the User's name when the User row changes."""
+    if update_fields is not None and set(update_fields) <= {"last_login"}:
+        return  # login não muda nada exibido
+    Usuario.objects.filter(user_id=instance.pk).update(atualizado_em=timezone.now())
+    touch_cts(Q(gerente_id=instance.pk) | Q(professores_vinculos__professor_id=instance.pk))
+
+
+def touch_ct_of_vinculo(sender, instance, **kwargs):
+    touch_cts(Q(pk=instance.ct_id))
+
+
+def touch_cts_of_professores(sender, instance, action, reverse, pk_set, **kwargs):
+    # `ct.professores.add()/remove()` gravam o vínculo sem post_save/post_delete
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            touch_cts(Q(pk=instance.pk))
+    elif action in ("post_add", "post_remove") and pk_set:
+        touch_cts(Q(pk__in=pk_set))
+    elif action == "pre_clear":
+        # lado do professor: depois do clear não se sabe mais de quais CTs ele saiu
+        touch_cts(Q(professores_vinculos__professor_id=instance.pk))
+
+
+def regenerate_agendamentos_of_ct(sender, instance, origin=None, **kwargs):
+    """A new or removed blackout date changes the occurrences of every agendamento of the CT."""
+    if origin is not None and not isinstance(origin, BloqueioCT) and getattr(origin, "model", None) is not BloqueioCT:
+        return  # apagado em cascata junto com o CT
+    for agendamento in prefetch_recurrence(AgendamentoTreino.objects.filter(ct_id=instance.ct_id)):
+        schedule_regeneration(agendamento)
+
+
+def connect_signals():
+    post_save.connect(touch_profile, sender=get_user_model(), dispatch_uid="touch_profile_user")
+    post_save.connect(touch_ct_of_vinculo, sender=ProfessorCentroTreinamento, dispatch_uid="touch_ct_vinculo_save")
+    post_delete.connect(touch_ct_of_vinculo, sender=ProfessorCentroTreinamento, dispatch_uid="touch_ct_vinculo_delete")
+    m2m_changed.connect(
+        touch_cts_of_professores,
+        sender=CentroTreinamento.professores.through,
+        dispatch_uid="touch_ct_professores",
+    )
+    post_save.connect(regenerate_agendamentos_of_ct, sender=BloqueioCT, dispatch_uid="regenerate_bloqueio_save")
+    post_delete.connect(regenerate_agendamentos_of_ct, sender=BloqueioCT, dispatch_uid="regenerate_bloqueio_delete")
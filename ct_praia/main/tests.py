@@ -1,20 +1,60 @@
+import csv
+import json
+import os
+import tempfile
+import threading
 from datetime import date, time, timedelta
+from io import StringIO
+from unittest import mock
 
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.models import F
+from django.db.models.signals import post_delete
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
 
 from .models import (
 	AgendamentoTreino,
+	BloqueioCT,
 	CentroTreinamento,
+	ExcecaoAgendamento,
 	HorarioRecorrente,
 	Inscricao,
+	IntencaoInscricao,
 	ProfessorCentroTreinamento,
+	TarefaRegeneracao,
 	Treino,
+	TreinoQuerySet,
 	Usuario,
 )
-from .services import regenerate_agendamento_ocorrencias
+from .authentication import TokenUsuario, tokens_para
+from .jobs import claim_next_job, process_jobs
+from .metrics import get_metrics
+from .permissions import permission_context
+from .recurrence import CompiledRecurrence, prefetch_recurrence
+from .services import (
+	TreinoLotado,
+	cancelar_inscricao,
+	criar_treinos_em_lote,
+	find_conflicts,
+	inscrever_em_lote,
+	purge_future_treinos_beyond_window,
+	regenerate_agendamento_ocorrencias,
+	registrar_intencao,
+	reservar_vaga,
+	shard_agendamentos,
+	sortear_inscricoes,
+	sync_agendamento_ocorrencias,
+)
+from .views import _treinos_do_aluno
 
 
 User = get_user_model()
@@ -75,6 +115,288 @@ class AgendamentoServiceTests(TestCase):
 		self.assertIn(past_date, all_dates)
 		self.assertIn(start, all_dates)
 
+	def test_regenerate_keeps_unchanged_occurrences_and_enrollments(self):
+		start = date(2024, 1, 1)
+		regenerate_agendamento_ocorrencias(self.agendamento, start_date=start, days_ahead=13)
+		treino = Treino.objects.get(agendamento=self.agendamento, data=start)
+		aluno = User.objects.create_user("aluno_regen", "aluno_regen@example.com", "pass1234")
+		Usuario.objects.create(user=aluno, tipo=Usuario.Tipo.ALUNO)
+		Inscricao.objects.create(treino=treino, aluno=aluno)
+
+		self.agendamento.vagas = 12
+		self.agendamento.save()
+		result = regenerate_agendamento_ocorrencias(self.agendamento, start_date=start, days_ahead=13)
+
+		self.assertEqual((result.created, result.updated, result.deleted), (0, 2, 0))
+		treino.refresh_from_db()
+		self.assertEqual(treino.vagas, 12)
+		self.assertTrue(Inscricao.objects.filter(treino=treino, aluno=aluno).exists())
+
+	def test_regenerate_only_touches_changed_slots(self):
+		start = date(2024, 1, 1)
+		regenerate_agendamento_ocorrencias(self.agendamento, start_date=start, days_ahead=6)
+		self.agendamento.horarios.all().delete()
+		HorarioRecorrente.objects.create(
+			agendamento=self.agendamento,
+			dia_semana=AgendamentoTreino.DiaSemana.TERCA,
+			hora_inicio=time(6, 0),
+			hora_fim=time(7, 0),
+		)
+		result = regenerate_agendamento_ocorrencias(self.agendamento, start_date=start, days_ahead=6)
+		self.assertEqual((result.created, result.updated, result.deleted), (1, 0, 1))
+		datas = list(Treino.objects.filter(agendamento=self.agendamento).values_list("data", flat=True))
+		self.assertEqual(datas, [date(2024, 1, 2)])
+
+		unchanged = regenerate_agendamento_ocorrencias(self.agendamento, start_date=start, days_ahead=6)
+		self.assertFalse(unchanged.changed)
+
+	def test_incremental_sync_only_appends_new_dates(self):
+		start = date(2024, 1, 1)
+		regenerate_agendamento_ocorrencias(self.agendamento, start_date=start, days_ahead=6)
+		self.agendamento.refresh_from_db()
+		self.assertEqual(self.agendamento.materializado_ate, date(2024, 1, 7))
+
+		agendamento = prefetch_recurrence(AgendamentoTreino.objects).get(pk=self.agendamento.pk)
+		# agenda do professor (conflitos), savepoint, contagem, insert, contagem, marca d'água, release
+		with self.assertNumQueries(7):
+			result = sync_agendamento_ocorrencias(agendamento, start_date=date(2024, 1, 2), days_ahead=6)
+		self.assertEqual(result.created, 1)
+		self.assertEqual(
+			list(Treino.objects.filter(agendamento=self.agendamento).order_by("data").values_list("data", flat=True)),
+			[date(2024, 1, 1), date(2024, 1, 8)],
+		)
+
+		# Ocorrência que já existe é descartada pelo INSERT e não conta como criada
+		AgendamentoTreino.objects.filter(pk=self.agendamento.pk).update(materializado_ate=date(2024, 1, 7))
+		agendamento = prefetch_recurrence(AgendamentoTreino.objects).get(pk=self.agendamento.pk)
+		result = sync_agendamento_ocorrencias(agendamento, start_date=date(2024, 1, 2), days_ahead=6)
+		self.assertEqual(result.created, 0)
+		self.assertEqual(Treino.objects.filter(agendamento=self.agendamento).count(), 2)
+
+	def test_incremental_sync_regenerates_when_horarios_change(self):
+		start = date(2024, 1, 1)
+		regenerate_agendamento_ocorrencias(self.agendamento, start_date=start, days_ahead=6)
+		self.agendamento.refresh_from_db()
+		self.agendamento.horarios.update(hora_inicio=time(5, 0))
+		agendamento = prefetch_recurrence(AgendamentoTreino.objects).get(pk=self.agendamento.pk)
+		result = sync_agendamento_ocorrencias(agendamento, start_date=start, days_ahead=6)
+		# Mesma data em outro horário: a linha existente é reaproveitada
+		self.assertEqual((result.created, result.updated, result.deleted), (0, 1, 0))
+		self.assertEqual(Treino.objects.get(agendamento=self.agendamento).hora_inicio, time(5, 0))
+
+	def test_recurrence_every_other_week_from_inicio_vigencia(self):
+		self.agendamento.inicio_vigencia = date(2024, 1, 1)
+		self.agendamento.save()
+		self.agendamento.horarios.update(intervalo_semanas=2)
+		rule = CompiledRecurrence.for_agendamento(prefetch_recurrence(AgendamentoTreino.objects).get(pk=self.agendamento.pk))
+		datas = [data for data, _, _ in rule.expand(date(2023, 12, 1), date(2024, 1, 31))]
+		self.assertEqual(datas, [date(2024, 1, 1), date(2024, 1, 15), date(2024, 1, 29)])
+
+	def test_regenerate_applies_exceptions_and_ct_blackout(self):
+		start = date(2024, 1, 1)
+		ExcecaoAgendamento.objects.create(
+			agendamento=self.agendamento, data=date(2024, 1, 8), tipo=ExcecaoAgendamento.Tipo.CANCELADA
+		)
+		BloqueioCT.objects.create(ct=self.ct, data=date(2024, 1, 15), motivo="Feriado")
+		regenerate_agendamento_ocorrencias(self.agendamento, start_date=start, days_ahead=27)
+		# O bloqueio também agenda a regeneração da janela corrente; aqui só importa a de 2024
+		datas = list(
+			Treino.objects.filter(agendamento=self.agendamento, data__year=2024).order_by("data").values_list("data", flat=True)
+		)
+		self.assertEqual(datas, [date(2024, 1, 1), date(2024, 1, 22)])
+
+	def test_remarcada_keeps_occurrence_and_enrollments(self):
+		start = date(2024, 1, 1)
+		regenerate_agendamento_ocorrencias(self.agendamento, start_date=start, days_ahead=6)
+		treino = Treino.objects.get(agendamento=self.agendamento, data=start)
+		aluno = User.objects.create_user("aluno_remarca", "aluno_remarca@example.com", "pass1234")
+		Usuario.objects.create(user=aluno, tipo=Usuario.Tipo.ALUNO)
+		Inscricao.objects.create(treino=treino, aluno=aluno)
+
+		ExcecaoAgendamento.objects.create(
+			agendamento=self.agendamento,
+			data=start,
+			tipo=ExcecaoAgendamento.Tipo.REMARCADA,
+			nova_hora_inicio=time(8, 0),
+			nova_hora_fim=time(9, 0),
+		)
+		result = regenerate_agendamento_ocorrencias(self.agendamento, start_date=start, days_ahead=6)
+		self.assertEqual((result.created, result.updated, result.deleted), (0, 1, 0))
+		treino.refresh_from_db()
+		self.assertEqual((treino.hora_inicio, treino.hora_fim), (time(8, 0), time(9, 0)))
+		self.assertTrue(Inscricao.objects.filter(treino=treino, aluno=aluno).exists())
+
+	def test_find_conflicts_checks_professor_agenda_across_cts(self):
+		outro_ct = CentroTreinamento.objects.create(
+			nome="CT Outro", endereco="Rua 3", contato="(11) 97777-7777", modalidades="Surf", cnpj="11.111.111/0001-11"
+		)
+		outro_ct.professores.add(self.professor)
+		existente = Treino.objects.create(
+			ct=outro_ct,
+			professor=self.professor,
+			modalidade="Surf",
+			data=date(2024, 1, 1),
+			hora_inicio=time(6, 30),
+			hora_fim=time(8, 0),
+			vagas=10,
+			nivel="Iniciante",
+		)
+		candidatos = [
+			(date(2024, 1, 1), time(5, 0), time(6, 30)),  # encosta, não sobrepõe
+			(date(2024, 1, 1), time(7, 0), time(7, 30)),
+			(date(2024, 1, 2), time(7, 0), time(7, 30)),
+		]
+		with self.assertNumQueries(1):
+			conflitos = find_conflicts(candidatos, self.professor.pk)
+		self.assertEqual([(c.hora_inicio, c.treino_id) for c in conflitos], [(time(7, 0), existente.pk)])
+		self.assertEqual(find_conflicts(candidatos, self.professor.pk, exclude_treino_ids=[existente.pk]), [])
+
+	def test_regenerate_skips_occurrences_overlapping_professor_agenda(self):
+		Treino.objects.create(
+			ct=self.ct,
+			professor=self.professor,
+			modalidade="Surf",
+			data=date(2024, 1, 8),
+			hora_inicio=time(6, 0),
+			hora_fim=time(6, 45),
+			vagas=4,
+			nivel="Iniciante",
+		)
+		result = regenerate_agendamento_ocorrencias(self.agendamento, start_date=date(2024, 1, 1), days_ahead=13)
+		self.assertEqual((result.created, result.conflicts), (1, 1))
+		self.assertEqual(
+			list(Treino.objects.filter(agendamento=self.agendamento).values_list("data", flat=True)),
+			[date(2024, 1, 1)],
+		)
+
+	def _create_far_future_treinos(self, total):
+		aluno = User.objects.create_user("aluno_purge", "aluno_purge@example.com", "pass1234")
+		Usuario.objects.create(user=aluno, tipo=Usuario.Tipo.ALUNO)
+		far = date.today() + timedelta(days=90)
+		for offset in range(total):
+			treino = Treino.objects.create(
+				ct=self.ct,
+				professor=self.professor,
+				modalidade="Surf",
+				data=far + timedelta(days=offset),
+				hora_inicio=time(6, 0),
+				hora_fim=time(7, 0),
+				vagas=10,
+				nivel="Iniciante",
+				agendado=True,
+				agendamento=self.agendamento,
+			)
+			Inscricao.objects.create(treino=treino, aluno=aluno)
+
+	def test_purge_dry_run_only_counts(self):
+		self._create_far_future_treinos(3)
+		result = purge_future_treinos_beyond_window(days_ahead=30, dry_run=True)
+		self.assertEqual((result.treinos, result.inscricoes, result.batches), (3, 3, 0))
+		self.assertEqual(Treino.objects.count(), 3)
+
+	def test_purge_deletes_in_batches_with_raw_fast_path(self):
+		self._create_far_future_treinos(5)
+		get_metrics()
+		with CaptureQueriesContext(connection) as ctx:
+			result = purge_future_treinos_beyond_window(days_ahead=30, batch_size=2)
+		self.assertEqual((result.treinos, result.inscricoes, result.batches), (5, 5, 3))
+		self.assertFalse(Inscricao.objects.exists())
+		# As métricas não escutam post_delete de Treino: caminho rápido, nenhum treino é carregado
+		self.assertFalse(any('"main_treino"."modalidade"' in q["sql"] for q in ctx.captured_queries))
+		with self.assertNumQueries(1):  # o DELETE direto invalidou o cache
+			get_metrics()
+
+	def test_purge_uses_orm_when_another_treino_receiver_is_connected(self):
+		self._create_far_future_treinos(2)
+		apagados = []
+
+		def auditar(sender, instance, **kwargs):
+			apagados.append(instance.pk)
+
+		post_delete.connect(auditar, sender=Treino)
+		try:
+			result = purge_future_treinos_beyond_window(days_ahead=30)
+		finally:
+			post_delete.disconnect(auditar, sender=Treino)
+		self.assertEqual(result.treinos, 2)
+		self.assertEqual(len(apagados), 2)
+
+	def test_purge_deletes_in_batches_through_orm(self):
+		self._create_far_future_treinos(5)
+		result = purge_future_treinos_beyond_window(days_ahead=30, batch_size=2, raw=False)
+		self.assertEqual((result.treinos, result.inscricoes, result.batches), (5, 5, 3))
+		self.assertFalse(Treino.objects.exists())
+
+	def test_shard_agendamentos_keeps_ct_together(self):
+		rows = [(1, 10), (2, 10), (3, 10), (4, 20), (5, 30), (6, 20)]
+		shards = shard_agendamentos(rows, 2)
+		self.assertEqual(len(shards), 2)
+		self.assertEqual(sorted(sum(shards, [])), [1, 2, 3, 4, 5, 6])
+		for ct_ids in ({1, 2, 3}, {4, 6}):
+			self.assertEqual(sum(1 for shard in shards if ct_ids & set(shard)), 1)
+
+	def test_command_reports_shard_summary(self):
+		out = StringIO()
+		call_command("gerar_treinos_recorrentes", days=6, chunk_size=1, stdout=out)
+		self.assertIn("Shard 0: 1 agendamentos, 1 criadas", out.getvalue())
+		self.assertEqual(Treino.objects.filter(agendamento=self.agendamento).count(), 1)
+
+
+class GerarTreinosParaleloTests(TransactionTestCase):
+	"""`--workers 2`: pool com fork, shards por CT e `_retry_on_lock` num banco em arquivo."""
+
+	def setUp(self):
+		# O banco de teste em memória não é visível nos processos filhos: durante o teste a
+		# conexão aponta para um arquivo (a conexão em memória fica guardada, senão ele some)
+		self.tmpdir = tempfile.TemporaryDirectory()
+		self.memoria = (connection.settings_dict["NAME"], connection.connection)
+		connection.connection = None
+		connection.settings_dict["NAME"] = os.path.join(self.tmpdir.name, "db.sqlite3")
+		call_command("migrate", verbosity=0)
+
+	def tearDown(self):
+		connections.close_all()
+		connection.settings_dict["NAME"], connection.connection = self.memoria
+		self.tmpdir.cleanup()
+
+	def test_command_with_two_workers_generates_every_shard(self):
+		hoje = timezone.localdate()
+		agendamentos = []
+		for indice in range(2):
+			professor = User.objects.create_user(f"prof_par{indice}", f"prof_par{indice}@example.com", "pass1234")
+			Usuario.objects.create(user=professor, tipo=Usuario.Tipo.PROFESSOR)
+			ct = CentroTreinamento.objects.create(nome=f"CT Paralelo {indice}", endereco="Rua P", cnpj=f"00.000.000/000{indice}-00")
+			ct.professores.add(professor)
+			for hora in (6, 8, 10):
+				agendamento = AgendamentoTreino.objects.create(
+					ct=ct, professor=professor, modalidade="Surf", vagas=5, nivel="Iniciante"
+				)
+				for dias in (0, 3):
+					HorarioRecorrente.objects.create(
+						agendamento=agendamento,
+						dia_semana=(hoje + timedelta(days=dias)).weekday(),
+						hora_inicio=time(hora, 0),
+						hora_fim=time(hora + 1, 0),
+					)
+				agendamentos.append(agendamento)
+
+		out = StringIO()
+		call_command("gerar_treinos_recorrentes", days=13, workers=2, chunk_size=2, stdout=out)
+
+		self.assertIn("Shard 0: 3 agendamentos, 12 criadas", out.getvalue())
+		self.assertIn("Shard 1: 3 agendamentos, 12 criadas", out.getvalue())
+		for agendamento in agendamentos:
+			datas = sorted(Treino.objects.filter(agendamento=agendamento).values_list("data", flat=True))
+			self.assertEqual(datas, sorted(hoje + timedelta(days=dias) for dias in (0, 3, 7, 10)))
+			agendamento.refresh_from_db()
+			self.assertEqual(agendamento.materializado_ate, hoje + timedelta(days=13))
+
+		# Segunda execução paralela não duplica nada
+		out = StringIO()
+		call_command("gerar_treinos_recorrentes", days=13, workers=2, stdout=out)
+		self.assertIn("Nenhuma alteração necessária.", out.getvalue())
+		self.assertEqual(Treino.objects.count(), 24)
+
 
 class PermissionsAPITests(TestCase):
 	def setUp(self):
@@ -131,6 +453,11 @@ class PermissionsAPITests(TestCase):
 		resp = self.client.post(reverse("treino-list"), payload, format="json")
 		self.assertEqual(resp.status_code, 201)
 
+		payload["hora_inicio"], payload["hora_fim"] = "06:30:00", "07:30:00"
+		conflito = self.client.post(reverse("treino-list"), payload, format="json")
+		self.assertEqual(conflito.status_code, 400)
+		self.assertEqual(Treino.objects.count(), 1)
+
 	def test_gerente_can_grant_professor_create_and_professor_can_create(self):
 		self.client.force_authenticate(user=self.gerente)
 		vinculo = ProfessorCentroTreinamento.objects.get(ct=self.ct, professor=self.professor)
@@ -191,6 +518,145 @@ class PermissionsAPITests(TestCase):
 		resp3 = self.client.delete(reverse("agendamento-detail", args=[agendamento_id]))
 		self.assertEqual(resp3.status_code, 204)
 
+	@override_settings(AGENDAMENTO_REGENERACAO_ASSINCRONA=True)
+	def test_agendamento_edits_are_queued_and_collapsed(self):
+		self.client.force_authenticate(user=self.gerente)
+		payload = {
+			"ct": self.ct.id,
+			"professor": self.professor.id,
+			"modalidade": "Beach Tennis",
+			"vagas": 10,
+			"nivel": "Iniciante",
+			"observacoes": "",
+			"horarios": [{"dia_semana": 0, "hora_inicio": "06:00:00", "hora_fim": "07:00:00"}],
+		}
+		resp = self.client.post(reverse("agendamento-list"), payload, format="json")
+		self.assertEqual(resp.status_code, 201)
+		agendamento_id = resp.data["id"]
+		self.assertFalse(Treino.objects.filter(agendamento_id=agendamento_id).exists())
+
+		for vagas in (11, 12):
+			payload["vagas"] = vagas
+			self.client.put(reverse("agendamento-detail", args=[agendamento_id]), payload, format="json")
+		self.assertEqual(TarefaRegeneracao.objects.filter(agendamento_id=agendamento_id).count(), 1)
+
+		status_resp = self.client.get(reverse("agendamento-regeneracao-status", args=[agendamento_id]))
+		self.assertEqual(status_resp.data["status"], TarefaRegeneracao.Status.PENDENTE)
+
+		processed = process_jobs()
+		self.assertEqual(len(processed), 1)
+		status_resp = self.client.get(reverse("agendamento-regeneracao-status", args=[agendamento_id]))
+		self.assertEqual(status_resp.data["status"], TarefaRegeneracao.Status.CONCLUIDA)
+		self.assertEqual(status_resp.data["tentativas"], 1)
+		self.assertTrue(Treino.objects.filter(agendamento_id=agendamento_id, vagas=12).exists())
+
+	@override_settings(AGENDAMENTO_REGENERACAO_ASSINCRONA=True)
+	def test_horarios_update_keeps_exceptions_and_blackouts_queue_regeneration(self):
+		self.client.force_authenticate(user=self.gerente)
+		payload = {
+			"ct": self.ct.id,
+			"professor": self.professor.id,
+			"modalidade": "Beach Tennis",
+			"vagas": 10,
+			"nivel": "Iniciante",
+			"observacoes": "",
+			"horarios": [
+				{"dia_semana": 0, "hora_inicio": "06:00:00", "hora_fim": "07:00:00"},
+				{"dia_semana": 2, "hora_inicio": "06:00:00", "hora_fim": "07:00:00"},
+			],
+		}
+		resp = self.client.post(reverse("agendamento-list"), payload, format="json")
+		self.assertEqual(resp.status_code, 201)
+		agendamento = AgendamentoTreino.objects.get(pk=resp.data["id"])
+		segunda = agendamento.horarios.get(dia_semana=0)
+		excecao = ExcecaoAgendamento.objects.create(agendamento=agendamento, data=date(2030, 1, 7), horario=segunda)
+
+		payload["horarios"] = [
+			{"dia_semana": 0, "hora_inicio": "06:00:00", "hora_fim": "07:00:00", "intervalo_semanas": 2},
+			{"dia_semana": 4, "hora_inicio": "06:00:00", "hora_fim": "07:00:00"},
+		]
+		payload["excecoes"] = [{"data": "2030-01-09", "tipo": "CANCELADA"}]
+		for _ in range(2):
+			resp = self.client.put(reverse("agendamento-detail", args=[agendamento.id]), payload, format="json")
+			self.assertEqual(resp.status_code, 200)
+		segunda.refresh_from_db()
+		self.assertEqual(segunda.intervalo_semanas, 2)
+		self.assertTrue(ExcecaoAgendamento.objects.filter(pk=excecao.pk, horario=segunda).exists())
+		self.assertEqual(agendamento.excecoes.filter(horario__isnull=True).count(), 1)
+		duplicada = dict(payload, excecoes=payload["excecoes"] * 2)
+		resp = self.client.put(reverse("agendamento-detail", args=[agendamento.id]), duplicada, format="json")
+		self.assertEqual(resp.status_code, 400)
+		self.assertEqual(sorted(agendamento.horarios.values_list("dia_semana", flat=True)), [0, 4])
+
+		process_jobs()
+		bloqueio = BloqueioCT.objects.create(ct=self.ct, data=date(2030, 1, 9), motivo="Feriado")
+		pendentes = TarefaRegeneracao.objects.filter(agendamento=agendamento, status=TarefaRegeneracao.Status.PENDENTE)
+		self.assertEqual(pendentes.count(), 1)
+		process_jobs()
+		bloqueio.delete()
+		self.assertEqual(pendentes.count(), 1)
+
+	@override_settings(AGENDAMENTO_REGENERACAO_ASSINCRONA=True, REGENERACAO_LEASE_SEGUNDOS=60)
+	def test_abandoned_running_job_is_reclaimed_after_lease(self):
+		agendamento = AgendamentoTreino.objects.create(
+			ct=self.ct,
+			professor=self.professor,
+			modalidade="Beach Tennis",
+			vagas=10,
+			nivel="Iniciante",
+		)
+		tarefa = TarefaRegeneracao.objects.create(agendamento=agendamento)
+		self.assertEqual(claim_next_job().pk, tarefa.pk)
+		# o worker morreu: dentro do lease a tarefa continua dele
+		self.assertIsNone(claim_next_job())
+
+		TarefaRegeneracao.objects.filter(pk=tarefa.pk).update(
+			iniciado_em=timezone.now() - timedelta(seconds=61)
+		)
+		retomada = claim_next_job()
+		self.assertEqual(retomada.pk, tarefa.pk)
+		self.assertEqual(retomada.tentativas, 2)
+
+		TarefaRegeneracao.objects.filter(pk=tarefa.pk).update(
+			tentativas=F("max_tentativas"),
+			iniciado_em=timezone.now() - timedelta(seconds=61),
+		)
+		self.assertIsNone(claim_next_job())
+		tarefa.refresh_from_db()
+		self.assertEqual(tarefa.status, TarefaRegeneracao.Status.FALHOU)
+
+	def test_agendamento_preview_lists_occurrences_and_conflicts_without_writing(self):
+		hoje = date.today()
+		proxima_segunda = hoje + timedelta(days=(7 - hoje.weekday()) % 7)
+		existente = Treino.objects.create(
+			ct=self.ct,
+			professor=self.professor,
+			modalidade="Beach Tennis",
+			data=proxima_segunda,
+			hora_inicio=time(6, 30),
+			hora_fim=time(7, 30),
+			vagas=5,
+			nivel="Iniciante",
+		)
+		self.client.force_authenticate(user=self.gerente)
+		payload = {
+			"ct": self.ct.id,
+			"professor": self.professor.id,
+			"modalidade": "Beach Tennis",
+			"vagas": 10,
+			"nivel": "Iniciante",
+			"observacoes": "",
+			"horarios": [{"dia_semana": 0, "hora_inicio": "06:00:00", "hora_fim": "07:00:00"}],
+		}
+		with self.assertNumQueries(5):  # ct, professor, vínculo, bloqueios e uma única consulta de agenda
+			resp = self.client.post(reverse("agendamento-preview") + "?days=13", payload, format="json")
+		self.assertEqual(resp.status_code, 200)
+		self.assertEqual(len(resp.data["ocorrencias"]), 2)
+		self.assertEqual([c["treino_id"] for c in resp.data["conflitos"]], [existente.pk])
+		self.assertEqual(resp.data["conflitos"][0]["motivo"], "professor")
+		self.assertFalse(AgendamentoTreino.objects.exists())
+		self.assertEqual(Treino.objects.count(), 1)
+
 	def test_inscricao_cancel_only_by_owner(self):
 		# gerente cria um treino futuro
 		self.client.force_authenticate(user=self.gerente)
@@ -221,4 +687,951 @@ class PermissionsAPITests(TestCase):
 		# gerente tenta cancelar inscrição (não deve)
 		self.client.force_authenticate(user=self.gerente)
 		resp2 = self.client.post(reverse("inscricao-cancelar", args=[inscricao_id]))
-		self.assertEqual(resp2.status_code, 403)
\ No newline at end of file
+		self.assertEqual(resp2.status_code, 403)
+
+
+class BaseListagemTestCase(TestCase):
+	"""CT com gerente, professor e aluno, e as fábricas de treinos dos testes de API abaixo."""
+
+	def setUp(self):
+		self.client = APIClient()
+		self.gerente = User.objects.create_user("ger_q", "ger_q@example.com", "pass1234")
+		Usuario.objects.create(user=self.gerente, tipo=Usuario.Tipo.GERENTE)
+		self.professor = User.objects.create_user("prof_q", "prof_q@example.com", "pass1234")
+		Usuario.objects.create(user=self.professor, tipo=Usuario.Tipo.PROFESSOR)
+		self.aluno = User.objects.create_user("aluno_q", "aluno_q@example.com", "pass1234")
+		Usuario.objects.create(user=self.aluno, tipo=Usuario.Tipo.ALUNO)
+		self.ct = CentroTreinamento.objects.create(
+			nome="CT Query",
+			endereco="Rua 4",
+			contato="(11) 96666-6666",
+			modalidades="Vôlei",
+			cnpj="22.222.222/0001-22",
+			gerente=self.gerente,
+		)
+		self.ct.professores.add(self.professor)
+
+	def _create_treinos(self, total):
+		inicio = date.today() + timedelta(days=1 + Treino.objects.count())
+		for offset in range(total):
+			treino = Treino.objects.create(
+				ct=self.ct,
+				professor=self.professor,
+				modalidade="Vôlei",
+				data=inicio + timedelta(days=offset),
+				hora_inicio=time(6, 0),
+				hora_fim=time(7, 0),
+				vagas=3,
+				nivel="Iniciante",
+			)
+			Inscricao.objects.create(treino=treino, aluno=self.aluno)
+
+	def _lote(self, inicio, total, hora=6):
+		return [
+			{
+				"ct": self.ct.pk,
+				"professor": self.professor.pk,
+				"modalidade": "Vôlei",
+				"data": (inicio + timedelta(days=offset)).isoformat(),
+				"hora_inicio": f"{hora:02d}:00",
+				"hora_fim": f"{hora + 1:02d}:00",
+				"vagas": 4,
+				"nivel": "Iniciante",
+			}
+			for offset in range(total)
+		]
+
+
+class ListagemQueryCountTests(BaseListagemTestCase):
+	"""Listagens devem usar um número fixo de consultas, independente da quantidade de linhas."""
+
+	def _assert_constant_queries(self, url, user, expected):
+		self.client.force_authenticate(user=user)
+		for total in (2, 8):
+			self._create_treinos(total)
+			with self.assertNumQueries(expected):
+				resp = self.client.get(url)
+			self.assertEqual(resp.status_code, 200)
+		return resp
+
+	def test_treino_list_query_count_is_constant(self):
+		resp = self._assert_constant_queries(reverse("treino-list"), self.aluno, 2)
+		self.assertEqual(resp.data["count"], 10)
+		self.assertEqual({row["vagas_disponiveis"] for row in resp.data["results"]}, {2})
+
+	def test_ct_treinos_query_count_is_constant(self):
+		resp = self._assert_constant_queries(reverse("ct-treinos", args=[self.ct.pk]), self.aluno, 3)
+		self.assertEqual(len(resp.data), 10)
+
+	def test_inscricao_list_query_count_is_constant(self):
+		resp = self._assert_constant_queries(reverse("inscricao-list"), self.aluno, 3)
+		self.assertEqual({row["treino_detalhes"]["vagas_disponiveis"] for row in resp.data["results"]}, {2})
+
+	def test_public_ct_list_query_count_is_constant(self):
+		self.client.force_authenticate(user=None)
+		for total in (2, 8):
+			for _ in range(total):
+				indice = CentroTreinamento.objects.count()
+				ct = CentroTreinamento.objects.create(
+					nome=f"CT {indice}",
+					endereco="Rua 5",
+					contato="(11) 95555-5555",
+					modalidades="Vôlei",
+					cnpj=f"33.333.333/{indice:04d}-33",
+					gerente=self.gerente,
+				)
+				ct.professores.add(self.professor)
+			# ETag (agregado), count, CTs + gerente, professores
+			with self.assertNumQueries(4):
+				resp = self.client.get(reverse("ct-list"))
+			self.assertEqual(resp.status_code, 200)
+		self.assertEqual(resp.data["results"][0]["professores_nomes"], ["prof_q"])
+
+	def test_treino_fast_path_is_byte_identical_to_serializer(self):
+		self.professor.first_name, self.professor.last_name = "Ana", "Souza"
+		self.professor.save()
+		self._create_treinos(3)
+		agendamento = AgendamentoTreino.objects.create(
+			ct=self.ct, professor=self.professor, modalidade="Vôlei", vagas=3, nivel="Iniciante"
+		)
+		Treino.objects.filter(pk=Treino.objects.order_by("pk").first().pk).update(agendado=True, agendamento=agendamento)
+		treino_id = Treino.objects.order_by("pk").last().pk
+		self.client.force_authenticate(user=self.aluno)
+
+		urls = [reverse("treino-list"), reverse("treino-list") + "?ordering=-vagas", reverse("treino-detail", args=[treino_id])]
+		with override_settings(TREINO_LEITURA_RAPIDA=False):
+			esperado = [self.client.get(url).content for url in urls]
+		with override_settings(TREINO_LEITURA_RAPIDA=True):
+			with self.assertNumQueries(2):
+				self.client.get(urls[0])
+			obtido = [self.client.get(url).content for url in urls]
+			self.assertEqual(self.client.get(reverse("treino-detail", args=["abc"])).status_code, 404)
+		self.assertEqual(obtido, esperado)
+		self.assertIn(b'"ocorrencia":"', esperado[0])
+
+	def test_sparse_fields_and_expand_on_inscricoes(self):
+		self._create_treinos(3)
+		self.client.force_authenticate(user=self.aluno)
+
+		with self.assertNumQueries(2) as ctx:  # count + inscrições, sem joins nem prefetch de treino
+			resp = self.client.get(reverse("inscricao-list") + "?fields=id,status")
+		self.assertNotIn("JOIN", ctx.captured_queries[-1]["sql"])
+		self.assertEqual({tuple(sorted(row)) for row in resp.data["results"]}, {("id", "status")})
+
+		resp = self.client.get(reverse("inscricao-list") + "?fields=id&expand=treino,treino.ct")
+		row = resp.data["results"][0]
+		self.assertEqual(sorted(row), ["id", "treino_detalhes"])
+		self.assertEqual(row["treino_detalhes"]["ct_detalhes"]["nome"], "CT Query")
+
+		legado = self.client.get(reverse("inscricao-list")).data["results"][0]
+		self.assertIn("treino_detalhes", legado)
+		self.assertNotIn("ct_detalhes", legado["treino_detalhes"])
+
+	def test_sparse_fields_on_treinos_skip_joins_and_annotation(self):
+		self._create_treinos(2)
+		self.client.force_authenticate(user=self.aluno)
+		with self.assertNumQueries(2) as ctx:
+			resp = self.client.get(reverse("treino-list") + "?fields=id,data,vagas")
+		sql = ctx.captured_queries[-1]["sql"]
+		self.assertNotIn("JOIN", sql)
+		self.assertNotIn("COUNT", sql)
+		self.assertEqual(sorted(resp.data["results"][0]), ["data", "id", "vagas"])
+
+
+class PaginacaoKeysetTests(BaseListagemTestCase):
+	"""Paginação por cursor: mesma ordem da listagem, uma consulta por página."""
+
+	def test_keyset_pagination_walks_treinos_in_natural_order(self):
+		self._create_treinos(5)
+		primeiro = Treino.objects.order_by("data").first()
+		Treino.objects.create(  # mesmo dia, horário diferente: desempate por hora_inicio/id
+			ct=self.ct, professor=self.professor, modalidade="Vôlei", data=primeiro.data,
+			hora_inicio=time(8, 0), hora_fim=time(9, 0), vagas=3, nivel="Iniciante",
+		)
+		self.client.force_authenticate(user=self.aluno)
+		esperado = [row["id"] for row in self.client.get(reverse("treino-list")).data["results"]]
+
+		ids, url, paginas = [], reverse("treino-list") + "?limit=2", 0
+		while url:
+			with self.assertNumQueries(1):  # sem COUNT(*) nem OFFSET
+				resp = self.client.get(url)
+			self.assertNotIn("count", resp.data)
+			ids += [row["id"] for row in resp.data["results"]]
+			url, paginas = resp.data["next"], paginas + 1
+		self.assertEqual(ids, esperado)
+		self.assertEqual(paginas, 3)
+
+		resp = self.client.get(reverse("treino-list") + "?limit=100000")
+		self.assertEqual(len(resp.data["results"]), 6)
+		self.assertEqual(self.client.get(reverse("treino-list") + "?cursor=invalido").status_code, 404)
+		resp = self.client.get(reverse("treino-list") + "?limit=2&ordering=-vagas")
+		self.assertEqual(resp.status_code, 400)
+		self.assertIn("ordering", resp.data)
+
+	def test_keyset_pagination_on_inscricoes(self):
+		self._create_treinos(3)
+		self.client.force_authenticate(user=self.aluno)
+		esperado = list(Inscricao.objects.order_by("-criado_em", "-id").values_list("id", flat=True))
+		primeira = self.client.get(reverse("inscricao-list") + "?limit=2")
+		segunda = self.client.get(primeira.data["next"])
+		self.assertEqual([row["id"] for row in primeira.data["results"] + segunda.data["results"]], esperado)
+		self.assertIsNone(segunda.data["next"])
+
+
+class RespostaCondicionalTests(BaseListagemTestCase):
+	"""ETag/Last-Modified das listagens públicas."""
+
+	def test_public_listings_answer_304_when_unchanged(self):
+		self._create_treinos(2)
+		self.client.force_authenticate(user=None)
+		for url in (reverse("ct-list"), reverse("ct-detail", args=[self.ct.pk]), reverse("ct-treinos", args=[self.ct.pk])):
+			primeira = self.client.get(url)
+			self.assertEqual(primeira.status_code, 200)
+			self.assertIn("Last-Modified", primeira)
+			with self.assertNumQueries(2 if url.endswith("/treinos/") else 1):  # só o agregado (+ o CT)
+				cache = self.client.get(url, HTTP_IF_NONE_MATCH=primeira["ETag"])
+			self.assertEqual(cache.status_code, 304)
+			self.assertEqual(cache.content, b"")
+		self.assertEqual(self.client.get(reverse("ct-detail", args=["abc"])).status_code, 404)
+
+		url = reverse("ct-treinos", args=[self.ct.pk])
+		etag = self.client.get(url)["ETag"]
+		Inscricao.objects.filter(aluno=self.aluno).first().delete()  # muda vagas_disponiveis
+		self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+		# nomes de gerente/professor vêm de outra tabela, mas também invalidam o ETag
+		urls = (reverse("ct-list"), reverse("ct-detail", args=[self.ct.pk]), reverse("ct-treinos", args=[self.ct.pk]))
+		etags = [self.client.get(url)["ETag"] for url in urls]
+		self.professor.first_name = "Renomeado"
+		self.professor.save()
+		for url, etag in zip(urls, etags):
+			resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+			self.assertEqual(resp.status_code, 200)
+			self.assertIn(b"Renomeado", resp.content)
+		etag = self.client.get(urls[0])["ETag"]
+		self.gerente.last_name = "Novo"
+		self.gerente.save()
+		self.assertEqual(self.client.get(urls[0], HTTP_IF_NONE_MATCH=etag).status_code, 200)
+		etag = self.client.get(urls[0])["ETag"]
+		self.gerente.save(update_fields=["last_login"])
+		self.assertEqual(self.client.get(urls[0], HTTP_IF_NONE_MATCH=etag).status_code, 304)
+		self.ct.professores.remove(self.professor)
+		self.assertEqual(self.client.get(urls[0], HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+		metricas = self.client.get(reverse("api_metrics"))
+		self.assertEqual(self.client.get(reverse("api_metrics"), HTTP_IF_NONE_MATCH=metricas["ETag"]).status_code, 304)
+
+
+class ExportacaoTests(BaseListagemTestCase):
+	"""Exportação em streaming (CSV/NDJSON)."""
+
+	def _export(self, url, fmt):
+		resp = self.client.get(url, {"format": fmt})
+		self.assertEqual(resp.status_code, 200)
+		self.assertTrue(resp.streaming)
+		return b"".join(resp.streaming_content).decode()
+
+	def test_gerente_exports_inscricoes_as_csv(self):
+		outro_ct = CentroTreinamento.objects.create(
+			nome="CT Outro", endereco="Rua 5", contato="-", modalidades="Vôlei", cnpj="33.333.333/0001-33"
+		)
+		outro = Treino.objects.create(
+			ct=outro_ct, professor=self.professor, modalidade="Vôlei", data=date.today() + timedelta(days=1),
+			hora_inicio=time(6, 0), hora_fim=time(7, 0), vagas=3, nivel="Iniciante",
+		)
+		Inscricao.objects.create(treino=outro, aluno=self.aluno)
+		self._create_treinos(3)
+		self.client.force_authenticate(user=self.gerente)
+
+		with self.assertNumQueries(1):  # um cursor, independente do volume
+			body = self._export(reverse("inscricao-export"), "csv")
+		rows = list(csv.DictReader(StringIO(body)))
+		self.assertEqual(len(rows), 3)
+		self.assertEqual({row["ct_nome"] for row in rows}, {"CT Query"})
+		self.assertEqual(rows[0]["aluno_username"], "aluno_q")
+		self.assertEqual(rows[0]["id"], str(Inscricao.objects.filter(treino__ct=self.ct).latest("criado_em", "id").pk))
+
+	def test_treinos_export_as_ndjson(self):
+		self._create_treinos(4)
+		self.client.force_authenticate(user=self.aluno)
+		resp = self.client.get(reverse("treino-export"), {"format": "ndjson"})
+		self.assertEqual(resp["Content-Type"], "application/x-ndjson; charset=utf-8")
+		self.assertIn('filename="treinos.ndjson"', resp["Content-Disposition"])
+		rows = [json.loads(line) for line in self._export(reverse("treino-export"), "ndjson").splitlines()]
+		lista = self.client.get(reverse("treino-list")).data["results"]
+		self.assertEqual(rows, sorted(lista, key=lambda row: (-date.fromisoformat(row["data"]).toordinal(), row["hora_inicio"], row["id"])))
+		self.assertEqual(self.client.get(reverse("treino-export"), {"format": "xml"}).status_code, 404)
+
+
+class OperacoesEmLoteTests(BaseListagemTestCase):
+	"""Inscrições e treinos em lote."""
+
+	def test_batch_enrollment_validates_all_treinos_in_one_query(self):
+		self._create_treinos(1)
+		ja_inscrito = Treino.objects.get()
+		outro_aluno = User.objects.create_user("aluno_q2", "aluno_q2@example.com", "pass1234")
+		Usuario.objects.create(user=outro_aluno, tipo=Usuario.Tipo.ALUNO)
+		inicio = date.today() + timedelta(days=10)
+		livres = [
+			Treino.objects.create(
+				ct=self.ct, professor=self.professor, modalidade="Vôlei", data=inicio + timedelta(days=offset),
+				hora_inicio=time(6, 0), hora_fim=time(7, 0), vagas=1, nivel="Iniciante",
+			)
+			for offset in range(3)
+		]
+		Inscricao.objects.create(treino=livres[2], aluno=outro_aluno)
+		ids = [livres[0].pk, ja_inscrito.pk, livres[1].pk, livres[2].pk, 9999]
+
+		self.client.force_authenticate(user=self.aluno)
+		with self.assertNumQueries(6):  # treinos, savepoint, UPDATE condicional por treino livre (2), INSERT, release
+			resp = self.client.post(reverse("inscricao-batch"), {"treinos": ids}, format="json")
+		self.assertEqual(resp.status_code, 201)
+		self.assertEqual(resp.data["inscritos"], 2)
+		self.assertEqual(
+			[(item["treino"], item["status"]) for item in resp.data["resultados"]],
+			[
+				(livres[0].pk, "inscrito"),
+				(ja_inscrito.pk, "ja_inscrito"),
+				(livres[1].pk, "inscrito"),
+				(livres[2].pk, "sem_vagas"),
+				(9999, "inexistente"),
+			],
+		)
+		self.assertEqual(Inscricao.objects.filter(aluno=self.aluno).count(), 3)
+
+		# Cancelada não conta como inscrita: o lote a reativa, como `reservar_vaga`
+		cancelada = Inscricao.objects.get(aluno=self.aluno, treino=livres[0])
+		cancelar_inscricao(cancelada)
+		resp = self.client.post(reverse("inscricao-batch"), {"treinos": [livres[0].pk]}, format="json")
+		self.assertEqual(resp.data["resultados"][0]["status"], "inscrito")
+		self.assertEqual(resp.data["resultados"][0]["inscricao"], cancelada.pk)
+		cancelada.refresh_from_db()
+		self.assertEqual(cancelada.status, Inscricao.Status.CONFIRMADA)
+		self.assertEqual(Treino.objects.get(pk=livres[0].pk).inscritos_confirmados, 1)
+
+		self.client.force_authenticate(user=self.professor)
+		resp = self.client.post(reverse("inscricao-batch"), {"treinos": ids}, format="json")
+		self.assertEqual(resp.status_code, 403)
+
+	def test_bulk_treinos_use_constant_queries_and_reject_conflicts(self):
+		self.client.force_authenticate(user=self.gerente)
+		inicio = date.today() + timedelta(days=30)
+		for total in (2, 6):
+			with self.assertNumQueries(7):  # CTs, vínculos, professores, agenda, savepoint + INSERT + release
+				resp = self.client.post(reverse("treino-bulk"), {"treinos": self._lote(inicio, total)}, format="json")
+			self.assertEqual(resp.status_code, 201)
+			self.assertEqual(len(resp.data), total)
+			self.assertEqual(resp.data[0]["vagas_disponiveis"], 4)
+			inicio += timedelta(days=total)
+
+		# Sobreposição com a agenda existente ou dentro do próprio lote: nada é gravado
+		antes = Treino.objects.count()
+		lote = self._lote(inicio, 2) + self._lote(inicio, 1) + self._lote(date.today() + timedelta(days=30), 1)
+		resp = self.client.post(reverse("treino-bulk"), {"treinos": lote}, format="json")
+		self.assertEqual(resp.status_code, 400)
+		self.assertEqual(sorted(c["motivo"] for c in resp.data["conflitos"]), ["lote", "professor"])
+		self.assertEqual(Treino.objects.count(), antes)
+
+		# Professor sem permissão de criar treinos no CT
+		self.client.force_authenticate(user=self.professor)
+		resp = self.client.post(reverse("treino-bulk"), {"treinos": self._lote(inicio, 1)}, format="json")
+		self.assertEqual(resp.status_code, 403)
+
+	def test_clone_week_copies_manual_treinos_and_skips_conflicts(self):
+		self.client.force_authenticate(user=self.gerente)
+		segunda = date.today() + timedelta(days=7 - date.today().weekday())
+		self.client.post(reverse("treino-bulk"), {"treinos": self._lote(segunda, 3)}, format="json")
+		destino = segunda + timedelta(weeks=2)
+		self.client.post(reverse("treino-bulk"), {"treinos": self._lote(destino + timedelta(days=1), 1)}, format="json")
+
+		resp = self.client.post(
+			reverse("treino-clonar-semana"),
+			{"ct": self.ct.pk, "origem": (segunda + timedelta(days=3)).isoformat(), "destino": destino.isoformat()},
+			format="json",
+		)
+		self.assertEqual(resp.status_code, 201)
+		self.assertEqual([t["data"] for t in resp.data["criados"]], [destino.isoformat(), (destino + timedelta(days=2)).isoformat()])
+		self.assertEqual([c["treino_id"] is not None for c in resp.data["conflitos"]], [True])
+		self.assertEqual(Treino.objects.filter(data__range=(destino, destino + timedelta(days=6))).count(), 3)
+
+		resp = self.client.post(
+			reverse("treino-clonar-semana"),
+			{"ct": self.ct.pk, "origem": segunda.isoformat(), "destino": segunda.isoformat()},
+			format="json",
+		)
+		self.assertEqual(resp.status_code, 400)
+
+
+class AutorizacaoTests(BaseListagemTestCase):
+	"""Contexto de permissões por requisição e leituras autorizadas pelas claims do JWT."""
+
+	def test_permission_context_loads_profile_and_vinculos_once_per_request(self):
+		ProfessorCentroTreinamento.objects.filter(ct=self.ct, professor=self.professor).update(pode_criar_treino=True)
+		professor = User.objects.get(pk=self.professor.pk)  # sem perfil em cache
+		self.client.force_authenticate(user=professor)
+		payload = self._lote(date.today() + timedelta(days=40), 1)[0]
+		with CaptureQueriesContext(connection) as queries:
+			resp = self.client.post(reverse("treino-list"), payload, format="json")
+		self.assertEqual(resp.status_code, 201)
+		tabelas = [q["sql"] for q in queries.captured_queries]
+		self.assertEqual(sum('"main_professorcentrotreinamento"' in sql for sql in tabelas), 1)
+		self.assertEqual(sum('FROM "main_usuario"' in sql for sql in tabelas), 1)  # o outro join é o limit_choices_to do campo professor
+
+		perfil = permission_context(professor)
+		self.assertTrue(perfil.is_professor)
+		self.assertTrue(perfil.vinculo(self.ct.pk).pode_criar_treino)
+		with self.assertRaises(TypeError):
+			perfil.vinculos[self.ct.pk] = None
+
+	def test_claims_context_loads_professor_vinculos_on_first_access(self):
+		token = tokens_para(self.professor).access_token
+		perfil = permission_context(TokenUsuario(token))
+		self.assertTrue(perfil.is_professor)
+		with self.assertNumQueries(1):
+			self.assertIsNotNone(perfil.vinculo(self.ct.pk))
+			self.assertIsNone(perfil.vinculo(self.ct.pk + 1))
+		gerente = permission_context(TokenUsuario(tokens_para(self.gerente).access_token))
+		with self.assertNumQueries(0):
+			self.assertIsNone(gerente.vinculo(self.ct.pk))
+
+	def test_jwt_reads_authorize_from_claims_without_user_queries(self):
+		self._create_treinos(2)
+		resp = self.client.post(reverse("api_login"), {"username": "ger_q", "password": "pass1234"}, format="json")
+		self.assertEqual(resp.status_code, 200)
+		token = AccessToken(resp.data["token"])
+		self.assertEqual(token["tipo"], Usuario.Tipo.GERENTE)
+		self.assertNotIn("cts", token)
+
+		self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {resp.data['token']}")
+		with CaptureQueriesContext(connection) as queries:
+			lista = self.client.get(reverse("inscricao-list"))
+		self.assertEqual(lista.data["count"], 2)
+		tabelas = " ".join(q["sql"] for q in queries.captured_queries)
+		self.assertNotIn('FROM "auth_user"', tabelas)
+		self.assertNotIn('"main_usuario"', tabelas)
+
+		# Atributos fora das claims carregam o usuário; escritas resolvem o User no banco
+		self.assertEqual(self.client.get(reverse("usuario-me")).data["email"], "ger_q@example.com")
+		resp = self.client.post(reverse("ct-list"), {
+			"nome": "CT JWT", "endereco": "Rua 6", "contato": "-", "modalidades": "Vôlei", "cnpj": "44.444.444/0001-44",
+		}, format="json")
+		self.assertEqual(resp.status_code, 201)
+		self.assertEqual(CentroTreinamento.objects.get(nome="CT JWT").gerente, self.gerente)
+
+		# Desativado: leituras seguem valendo até o token expirar (compromisso documentado); escritas não
+		User.objects.filter(pk=self.gerente.pk).update(is_active=False)
+		self.assertEqual(self.client.get(reverse("inscricao-list")).status_code, 200)
+		resp = self.client.post(reverse("ct-list"), {
+			"nome": "CT Inativo", "endereco": "Rua 7", "contato": "-", "modalidades": "Vôlei", "cnpj": "55.555.555/0001-55",
+		}, format="json")
+		self.assertEqual(resp.status_code, 401)
+
+		# Superusuário pela claim não é confiável: a leitura carrega o User e vale o banco
+		admin = User.objects.create_superuser("admin_q", "admin_q@example.com", "pass1234")
+		token = tokens_para(admin).access_token
+		self.assertTrue(token["is_superuser"])
+		self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+		with CaptureQueriesContext(connection) as queries:
+			self.assertEqual(self.client.get(reverse("inscricao-list")).data["count"], 2)
+		self.assertIn('FROM "auth_user"', " ".join(q["sql"] for q in queries.captured_queries))
+		User.objects.filter(pk=admin.pk).update(is_superuser=False)
+		self.assertEqual(self.client.get(reverse("inscricao-list")).data["count"], 0)
+
+		# Tokens sem as claims (emitidos antes) continuam válidos pelo caminho do banco
+		self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(self.aluno).access_token}")
+		self.assertEqual(self.client.get(reverse("inscricao-list")).data["count"], 2)
+
+
+class MetricasTests(BaseListagemTestCase):
+	def test_metrics_single_query_cached_and_invalidated_by_writes(self):
+		cache.clear()
+		with CaptureQueriesContext(connection) as queries:
+			primeira = self.client.get(reverse("api_metrics")).json()
+		self.assertEqual(len(queries.captured_queries), 1)
+		sql = queries.captured_queries[0]["sql"]
+		self.assertEqual((sql.count("UNION ALL"), sql.count("COUNT(")), (3, 4))
+		self.assertNotIn("JOIN", sql)
+		with self.assertNumQueries(0):
+			self.assertEqual(self.client.get(reverse("api_metrics")).json(), primeira)
+		# A home usa o mesmo cache
+		with self.assertNumQueries(0):
+			self.assertEqual(get_metrics(), primeira)
+
+		CentroTreinamento.objects.create(nome="CT Métricas", endereco="Rua M", gerente=self.gerente)
+		self.assertEqual(self.client.get(reverse("api_metrics")).json()["metric_cts"], primeira["metric_cts"] + 1)
+
+		amanha = timezone.localdate() + timedelta(days=1)
+		criar_treinos_em_lote([
+			Treino(ct=self.ct, professor=self.professor, modalidade="Lote", data=amanha,
+				hora_inicio=time(hour, 0), hora_fim=time(hour, 45), vagas=5)
+			for hour in (6, 7)
+		])
+		self.assertEqual(self.client.get(reverse("api_metrics")).json()["metric_treinos"], primeira["metric_treinos"] + 2)
+
+		Treino.objects.filter(modalidade="Lote").first().delete()  # Treino.delete()
+		self.assertEqual(self.client.get(reverse("api_metrics")).json()["metric_treinos"], primeira["metric_treinos"] + 1)
+		Treino.objects.filter(modalidade="Lote").delete()  # TreinoQuerySet.delete()
+		self.assertEqual(self.client.get(reverse("api_metrics")).json()["metric_treinos"], primeira["metric_treinos"])
+
+		agendamento = AgendamentoTreino.objects.create(
+			ct=self.ct, professor=self.professor, modalidade="Cascata", vagas=3, nivel="Iniciante"
+		)
+		Treino.objects.create(ct=self.ct, professor=self.professor, modalidade="Cascata", data=amanha,
+			hora_inicio=time(9, 0), hora_fim=time(10, 0), vagas=3, agendamento=agendamento)
+		self.assertEqual(self.client.get(reverse("api_metrics")).json()["metric_treinos"], primeira["metric_treinos"] + 1)
+		agendamento.delete()  # treinos em cascata: post_delete do agendamento
+		self.assertEqual(self.client.get(reverse("api_metrics")).json()["metric_treinos"], primeira["metric_treinos"])
+		self.assertFalse(post_delete.has_listeners(Treino))
+
+
+class ContadoresInscritosTests(BaseListagemTestCase):
+	"""Contadores de inscritos mantidos no próprio treino."""
+
+	def test_editing_a_treino_keeps_counters_written_concurrently(self):
+		self._create_treinos(1)
+		treino = Treino.objects.get()
+		edicao = Treino.objects.get(pk=treino.pk)  # formulário/serializer carregou o treino
+		outro_aluno = User.objects.create_user("aluno_edit", "aluno_edit@example.com", "pass1234")
+		reservar_vaga(treino.pk, outro_aluno)  # inscrição enquanto a edição está aberta
+
+		edicao.vagas = 5
+		edicao.save()
+		self.client.force_authenticate(user=self.gerente)
+		resp = self.client.patch(reverse("treino-detail", args=[treino.pk]), {"nivel": "Avançado"}, format="json")
+		self.assertEqual(resp.status_code, 200)
+		treino.refresh_from_db()
+		self.assertEqual((treino.vagas, treino.nivel, treino.inscritos_confirmados), (5, "Avançado", 2))
+
+	def test_inscritos_counters_follow_status_changes_and_reconcile(self):
+		self._create_treinos(2)
+		treino, outro = Treino.objects.order_by("data")
+
+		def contadores(t):
+			t.refresh_from_db()
+			return t.inscritos_confirmados, t.inscritos_pendentes
+
+		self.assertEqual(contadores(treino), (1, 0))
+		inscricao = Inscricao.objects.get(treino=treino)
+		inscricao.status = Inscricao.Status.PENDENTE
+		inscricao.save()
+		self.assertEqual(contadores(treino), (0, 1))
+
+		self.client.login(username="aluno_q", password="pass1234")
+		self.client.post(reverse("inscricao_cancelar", args=[inscricao.pk]))
+		self.assertEqual(contadores(treino), (0, 0))
+		self.client.post(reverse("inscricao_criar", args=[treino.pk]))  # reativa
+		self.assertEqual(contadores(treino), (1, 0))
+
+		self.client.force_authenticate(user=self.aluno)
+		self.client.post(reverse("inscricao-cancelar", args=[inscricao.pk]))
+		self.assertEqual(contadores(treino), (0, 0))
+		detalhe = self.client.get(reverse("treino-detail", args=[treino.pk])).json()
+		self.assertEqual(detalhe["vagas_disponiveis"], treino.vagas)
+
+		# Updates em massa não passam por Inscricao.save(): o comando corrige a divergência
+		Inscricao.objects.filter(treino=outro).update(status=Inscricao.Status.PENDENTE)
+		self.assertEqual(contadores(outro), (1, 0))
+		out = StringIO()
+		call_command("reconciliar_inscritos", stdout=out)
+		self.assertIn("1 treino(s) corrigido(s)", out.getvalue())
+		self.assertEqual(contadores(outro), (0, 1))
+		self.assertEqual(contadores(treino), (0, 0))
+
+
+class ListaEsperaTests(BaseListagemTestCase):
+	def test_waitlisted_student_is_marked_and_repeat_click_gets_feedback(self):
+		self._create_treinos(1)
+		treino = Treino.objects.get()
+		Treino.objects.filter(pk=treino.pk).update(vagas=1)
+		aluno = User.objects.create_user("aluno_fila", "aluno_fila@example.com", "pass1234")
+		Usuario.objects.create(user=aluno, tipo=Usuario.Tipo.ALUNO)
+		self.assertEqual(reservar_vaga(treino.pk, aluno, fila=True).status, Inscricao.Status.ESPERA)
+		self.assertEqual(_treinos_do_aluno(aluno), ([treino.pk], [treino.pk]))
+
+		self.client.login(username="aluno_fila", password="pass1234")
+		resp = self.client.post(reverse("inscricao_criar", args=[treino.pk]))
+		self.assertEqual(resp.status_code, 302)
+		self.assertEqual(len(get_messages(resp.wsgi_request)), 1)
+		self.assertEqual(Inscricao.objects.filter(treino=treino, aluno=aluno).count(), 1)
+
+	def test_waitlist_promotes_head_in_constant_queries(self):
+		self._create_treinos(1)
+		treino = Treino.objects.get()
+		treino.vagas = 1
+		treino.save()
+		self.client.force_authenticate(user=self.aluno)
+		lotado = self.client.post(reverse("inscricao-list"), {"treino": treino.pk}, format="json")
+		self.assertEqual(lotado.status_code, 400)
+
+		def enfileirar(total, prefixo):
+			alunos = User.objects.bulk_create([User(username=f"{prefixo}{i}") for i in range(total)])
+			Usuario.objects.bulk_create([Usuario(user=aluno, tipo=Usuario.Tipo.ALUNO) for aluno in alunos])
+			return [reservar_vaga(treino.pk, aluno, fila=True) for aluno in alunos]
+
+		fila = enfileirar(3, "fila_a")
+		self.assertEqual({inscricao.status for inscricao in fila}, {Inscricao.Status.ESPERA})
+		treino.refresh_from_db()
+		self.assertEqual((treino.inscritos_confirmados, treino.inscritos_espera), (1, 3))
+
+		# Quem libera a vaga promove o primeiro da fila, na mesma requisição
+		ocupante = Inscricao.objects.get(treino=treino, aluno=self.aluno)
+		self.client.post(reverse("inscricao-cancelar", args=[ocupante.pk]))
+		fila[0].refresh_from_db()
+		self.assertEqual(fila[0].status, Inscricao.Status.CONFIRMADA)
+		self.assertIsNone(fila[0].fila_desde)
+		treino.refresh_from_db()
+		self.assertEqual((treino.inscritos_confirmados, treino.inscritos_espera), (1, 2))
+
+		# O custo da promoção não depende do tamanho da fila
+		with self.assertNumQueries(10):
+			self.assertEqual(cancelar_inscricao(fila[0]).pk, fila[1].pk)
+		enfileirar(40, "fila_b")
+		with self.assertNumQueries(10):
+			self.assertEqual(cancelar_inscricao(fila[1]).pk, fila[2].pk)
+		treino.refresh_from_db()
+		self.assertEqual((treino.inscritos_confirmados, treino.inscritos_espera), (1, 40))
+
+		self.client.force_authenticate(user=self.aluno)
+		resp = self.client.post(reverse("inscricao-list"), {"treino": treino.pk, "fila": True}, format="json")
+		self.assertEqual(resp.status_code, 201)
+		self.assertEqual(resp.json()["status"], Inscricao.Status.ESPERA)
+
+	def test_waitlisted_inscricao_cannot_be_confirmed_or_patched_into_a_seat(self):
+		self._create_treinos(1)
+		treino = Treino.objects.get()
+		Treino.objects.filter(pk=treino.pk).update(vagas=1)
+		na_fila = User.objects.create_user("aluno_fila", "aluno_fila@example.com", "pass1234")
+		Usuario.objects.create(user=na_fila, tipo=Usuario.Tipo.ALUNO)
+		espera = reservar_vaga(treino.pk, na_fila, fila=True)
+		self.assertEqual(espera.status, Inscricao.Status.ESPERA)
+		url = reverse("inscricao-detail", args=[espera.pk])
+
+		self.client.force_authenticate(user=na_fila)
+		resp = self.client.post(reverse("inscricao-confirmar", args=[espera.pk]))
+		self.assertEqual(resp.status_code, 409)
+		for status_novo in (Inscricao.Status.CONFIRMADA, Inscricao.Status.PENDENTE):
+			resp = self.client.patch(url, {"status": status_novo}, format="json")
+			self.assertEqual(resp.status_code, 400)
+			self.assertIn("status", resp.data)
+		espera.refresh_from_db()
+		treino.refresh_from_db()
+		self.assertEqual(espera.status, Inscricao.Status.ESPERA)
+		self.assertEqual((treino.inscritos_confirmados, treino.inscritos_espera), (1, 1))
+
+		# PENDENTE -> CONFIRMADA não muda a ocupação, mas respeita um treino já acima da capacidade
+		pendente = Inscricao.objects.get(treino=treino, aluno=self.aluno)
+		Inscricao.objects.filter(pk=pendente.pk).update(status=Inscricao.Status.PENDENTE)
+		Treino.objects.filter(pk=treino.pk).update(inscritos_confirmados=0, inscritos_pendentes=1, vagas=0)
+		self.client.force_authenticate(user=self.aluno)
+		self.assertEqual(self.client.post(reverse("inscricao-confirmar", args=[pendente.pk])).status_code, 409)
+		Treino.objects.filter(pk=treino.pk).update(vagas=1)
+		resp = self.client.post(reverse("inscricao-confirmar", args=[pendente.pk]))
+		self.assertEqual(resp.status_code, 200)
+		self.assertEqual(resp.data["status"], Inscricao.Status.CONFIRMADA)
+		treino.refresh_from_db()
+		self.assertEqual((treino.inscritos_confirmados, treino.inscritos_pendentes), (1, 0))
+
+
+class SorteioTests(BaseListagemTestCase):
+	def test_lottery_window_records_intents_and_allocates_in_one_insert(self):
+		self._create_treinos(1)
+		treino = Treino.objects.get()
+		Inscricao.objects.filter(treino=treino).delete()
+		encerra = timezone.now() + timedelta(hours=1)
+		Treino.objects.filter(pk=treino.pk).update(vagas=2, sorteio_encerra_em=encerra, inscritos_confirmados=0)
+
+		self.client.force_authenticate(user=self.aluno)
+		for _ in range(2):  # pedido repetido não vale uma segunda chance
+			resp = self.client.post(reverse("inscricao-list"), {"treino": treino.pk}, format="json")
+			self.assertEqual(resp.status_code, 202)
+		outros = User.objects.bulk_create([User(username=f"sorteio{i}") for i in range(4)])
+		for aluno in outros:
+			registrar_intencao(treino.pk, aluno, prioridade=5 if aluno == outros[3] else 0)
+		self.assertEqual(IntencaoInscricao.objects.filter(treino=treino).count(), 5)
+		self.assertFalse(Inscricao.objects.filter(treino=treino).exists())
+
+		self.assertEqual(sortear_inscricoes(), [])  # janela ainda aberta
+		with CaptureQueriesContext(connection) as queries:
+			resultados = sortear_inscricoes(agora=encerra, seed=7)
+		self.assertEqual([(r.treino, r.inscritos, r.espera) for r in resultados], [(treino.pk, 2, 3)])
+		inserts = [q for q in queries.captured_queries if q["sql"].startswith('INSERT INTO "main_inscricao"')]
+		self.assertEqual(len(inserts), 1)
+
+		confirmados = Inscricao.objects.filter(treino=treino, status=Inscricao.Status.CONFIRMADA)
+		self.assertIn(outros[3].pk, confirmados.values_list("aluno_id", flat=True))  # prioridade
+		self.assertEqual(Inscricao.objects.filter(treino=treino, status=Inscricao.Status.ESPERA).count(), 3)
+		treino.refresh_from_db()
+		self.assertEqual((treino.inscritos_confirmados, treino.inscritos_espera), (2, 3))
+		self.assertFalse(treino.sorteio_pendente)
+		self.assertFalse(IntencaoInscricao.objects.exists())
+		self.assertEqual(sortear_inscricoes(agora=encerra), [])
+
+
+	def test_lottery_reactivates_cancelled_inscricoes(self):
+		self._create_treinos(1)
+		treino = Treino.objects.get()
+		cancelada = Inscricao.objects.get(treino=treino, aluno=self.aluno)
+		cancelar_inscricao(cancelada)
+		encerra = timezone.now() + timedelta(hours=1)
+		Treino.objects.filter(pk=treino.pk).update(vagas=1, sorteio_encerra_em=encerra)
+		outros = User.objects.bulk_create([User(username=f"sorteio_c{i}") for i in range(2)])
+		registrar_intencao(treino.pk, self.aluno, prioridade=5)
+		for aluno in outros:
+			registrar_intencao(treino.pk, aluno)
+
+		resultados = sortear_inscricoes(agora=encerra, seed=3)
+		self.assertEqual([(r.inscritos, r.espera) for r in resultados], [(1, 2)])
+		cancelada.refresh_from_db()
+		self.assertEqual(cancelada.status, Inscricao.Status.CONFIRMADA)
+		self.assertEqual(Inscricao.objects.filter(treino=treino).count(), 3)
+		treino.refresh_from_db()
+		self.assertEqual((treino.inscritos_confirmados, treino.inscritos_espera), (1, 2))
+
+
+class ReservaVagaConcorrenciaTests(TransactionTestCase):
+	"""Muitas requisições simultâneas no mesmo treino não podem passar de `vagas`.
+
+	No SQLite o lock do arquivo serializa as escritas: as threads cobrem a corrida entre a
+	leitura e a UPDATE; a UPDATE condicional em si é coberta pelo teste determinístico.
+	"""
+
+	THREADS = 24
+	VAGAS = 7
+
+	def setUp(self):
+		professor = User.objects.create_user("prof_c", "prof_c@example.com", "pass1234")
+		Usuario.objects.create(user=professor, tipo=Usuario.Tipo.PROFESSOR)
+		gerente = User.objects.create_user("ger_c", "ger_c@example.com", "pass1234")
+		ct = CentroTreinamento.objects.create(nome="CT Concorrência", endereco="Rua C", gerente=gerente)
+		ct.professores.add(professor)
+		self.treino = Treino.objects.create(
+			ct=ct,
+			professor=professor,
+			modalidade="Vôlei",
+			data=date.today() + timedelta(days=1),
+			hora_inicio=time(6, 0),
+			hora_fim=time(7, 0),
+			vagas=self.VAGAS,
+			nivel="Iniciante",
+		)
+		self.alunos = User.objects.bulk_create(
+			[User(username=f"aluno_c{i}") for i in range(self.THREADS)]
+		)
+
+	def test_conditional_update_refuses_a_full_treino(self):
+		Treino.objects.filter(pk=self.treino.pk).update(inscritos_confirmados=self.VAGAS)
+		with self.assertRaises(TreinoLotado):
+			reservar_vaga(self.treino.pk, self.alunos[0])
+		# A leitura prévia viu uma vaga (corrida perdida): a UPDATE condicional é quem recusa
+		with mock.patch.object(TreinoQuerySet, "exists", return_value=True):
+			with self.assertRaises(TreinoLotado):
+				reservar_vaga(self.treino.pk, self.alunos[1])
+		self.assertFalse(Inscricao.objects.exists())
+		self.treino.refresh_from_db()
+		self.assertEqual(self.treino.inscritos_confirmados, self.VAGAS)
+
+	def test_concurrent_reservations_never_overbook(self):
+		barreira = threading.Barrier(self.THREADS)
+		resultados = []
+
+		def reservar(aluno):
+			try:
+				barreira.wait()
+				reservar_vaga(self.treino.pk, aluno)
+				resultados.append("inscrito")
+			except TreinoLotado:
+				resultados.append("lotado")
+			except Exception as exc:  # pragma: no cover - falha reportada pelo assert abaixo
+				resultados.append(repr(exc))
+			finally:
+				connection.close()
+
+		threads = [threading.Thread(target=reservar, args=(aluno,)) for aluno in self.alunos]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+
+		self.assertEqual(sorted(set(resultados)), ["inscrito", "lotado"])
+		self.assertEqual(resultados.count("inscrito"), self.VAGAS)
+		self.treino.refresh_from_db()
+		self.assertEqual(self.treino.inscritos_confirmados, self.VAGAS)
+		self.assertEqual(self.treino.inscricoes.count(), self.VAGAS)
+
+	def test_concurrent_batches_and_reservations_never_overbook(self):
+		barreira = threading.Barrier(self.THREADS)
+		resultados = []
+
+		def inscrever(indice, aluno):
+			try:
+				barreira.wait()
+				if indice % 2:
+					(item,) = inscrever_em_lote(aluno, [self.treino.pk])
+					resultados.append(item.status)
+				else:
+					reservar_vaga(self.treino.pk, aluno)
+					resultados.append("inscrito")
+			except TreinoLotado:
+				resultados.append("sem_vagas")
+			except Exception as exc:  # pragma: no cover - falha reportada pelo assert abaixo
+				resultados.append(repr(exc))
+			finally:
+				connection.close()
+
+		threads = [threading.Thread(target=inscrever, args=item) for item in enumerate(self.alunos)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+
+		self.assertEqual(sorted(set(resultados)), ["inscrito", "sem_vagas"])
+		self.assertEqual(resultados.count("inscrito"), self.VAGAS)
+		self.treino.refresh_from_db()
+		self.assertEqual(self.treino.inscritos_confirmados, self.VAGAS)
+		self.assertEqual(self.treino.inscricoes.count(), self.VAGAS)
+
+
+@override_settings(RECURRING_MATERIALIZATION_MODE="lazy", RECURRING_VIRTUAL_HORIZON_DAYS=60)
+class LazyOcorrenciasTests(TestCase):
+	def setUp(self):
+		self.client = APIClient()
+		self.professor = User.objects.create_user("prof_lazy", "prof_lazy@example.com", "pass1234")
+		Usuario.objects.create(user=self.professor, tipo=Usuario.Tipo.PROFESSOR)
+		self.aluno = User.objects.create_user("aluno_lazy", "aluno_lazy@example.com", "pass1234")
+		Usuario.objects.create(user=self.aluno, tipo=Usuario.Tipo.ALUNO)
+		self.ct = CentroTreinamento.objects.create(
+			nome="CT Lazy",
+			endereco="Rua 3",
+			contato="(21) 97777-7777",
+			modalidades="Futevôlei",
+			cnpj="11.222.333/0001-44",
+		)
+		self.ct.professores.add(self.professor)
+		self.agendamento = AgendamentoTreino.objects.create(
+			ct=self.ct,
+			professor=self.professor,
+			modalidade="Futevôlei",
+			vagas=2,
+			nivel="Iniciante",
+		)
+		self.proxima_data = date.today() + timedelta(days=1)
+		HorarioRecorrente.objects.create(
+			agendamento=self.agendamento,
+			dia_semana=self.proxima_data.weekday(),
+			hora_inicio=time(18, 0),
+			hora_fim=time(19, 0),
+		)
+
+	def test_regenerate_does_not_materialize_in_lazy_mode(self):
+		result = regenerate_agendamento_ocorrencias(self.agendamento)
+		self.assertEqual(result.created, 0)
+		self.assertFalse(Treino.objects.exists())
+
+	def test_regeneration_keeps_enrollments_materialized_beyond_the_default_window(self):
+		self.client.force_authenticate(user=self.aluno)
+		data = self.proxima_data + timedelta(weeks=5)
+		chave = f"{self.agendamento.id}-{data:%Y%m%d}-1800-1900"
+		self.assertEqual(self.client.post(reverse("inscricao-list"), {"ocorrencia": chave}, format="json").status_code, 201)
+
+		self.agendamento.nivel = "Intermediário"
+		self.agendamento.save()
+		result = regenerate_agendamento_ocorrencias(self.agendamento)
+		self.assertEqual((result.deleted, result.updated), (0, 1))
+		treino = Treino.objects.get(agendamento=self.agendamento, data=data)
+		self.assertEqual(treino.nivel, "Intermediário")
+		self.assertTrue(Inscricao.objects.filter(treino=treino, aluno=self.aluno).exists())
+
+	def test_list_merges_virtual_occurrences_and_enrollment_materializes(self):
+		self.client.force_authenticate(user=self.aluno)
+		resp = self.client.get(reverse("treino-list"))
+		self.assertEqual(resp.status_code, 200)
+		virtuais = [row for row in resp.data["results"] if row["id"] is None]
+		self.assertGreaterEqual(len(virtuais), 8)
+		self.assertTrue(all(row["vagas_disponiveis"] == 2 for row in virtuais))
+		chave = next(row["ocorrencia"] for row in virtuais if row["data"] == self.proxima_data.isoformat())
+
+		insc = self.client.post(reverse("inscricao-list"), {"ocorrencia": chave}, format="json")
+		self.assertEqual(insc.status_code, 201)
+		treino = Treino.objects.get(agendamento=self.agendamento)
+		self.assertEqual(treino.data, self.proxima_data)
+		self.assertEqual(insc.data["treino"], treino.id)
+
+		resp2 = self.client.get(reverse("treino-list"))
+		linhas = [row for row in resp2.data["results"] if row["ocorrencia"] == chave]
+		self.assertEqual(len(linhas), 1)
+		self.assertEqual(linhas[0]["id"], treino.id)
+		self.assertEqual(linhas[0]["vagas_disponiveis"], 1)
+
+	def test_cursor_walks_real_and_virtual_occurrences_in_listing_order(self):
+		for dias, hora in ((1, 18), (1, 7), (20, 10)):
+			Treino.objects.create(
+				ct=self.ct,
+				professor=self.professor,
+				modalidade="Futevôlei",
+				data=date.today() + timedelta(days=dias),
+				hora_inicio=time(hora, 0),
+				hora_fim=time(hora + 1, 0),
+				vagas=4,
+				nivel="Iniciante",
+			)
+		self.client.force_authenticate(user=self.aluno)
+		completa = self.client.get(reverse("treino-list") + "?limit=200").data
+		self.assertIsNone(completa["next"])
+		esperado = [(row["id"], row["ocorrencia"]) for row in completa["results"]]
+		self.assertGreaterEqual(len(esperado), 11)
+		datas = [row["data"] for row in completa["results"]]
+		self.assertEqual(datas, sorted(datas, reverse=True))
+
+		vistos, url = [], reverse("treino-list") + "?limit=3"
+		while url:
+			resp = self.client.get(url)
+			self.assertEqual(resp.status_code, 200)
+			self.assertLessEqual(len(resp.data["results"]), 3)
+			vistos.extend((row["id"], row["ocorrencia"]) for row in resp.data["results"])
+			url = resp.data["next"]
+		self.assertEqual(vistos, esperado)
+		self.assertEqual(self.client.get(reverse("treino-list") + "?cursor=invalido").status_code, 404)
+		self.assertEqual(self.client.get(reverse("treino-list") + "?limit=2&ordering=data").status_code, 400)
+
+	@override_settings(RECURRING_VIRTUAL_HORIZON_DAYS=730)
+	def test_ct_treinos_returns_a_bounded_page_of_occurrences(self):
+		url = reverse("ct-treinos", args=[self.ct.id])
+		resp = self.client.get(url)
+		self.assertEqual(resp.status_code, 200)
+		self.assertEqual(len(resp.data["results"]), 50)
+		self.assertIsNotNone(resp.data["next"])
+
+		vistos, url = [], url + "?limit=200"
+		while url:
+			pagina = self.client.get(url).data
+			vistos.extend(row["ocorrencia"] for row in pagina["results"])
+			url = pagina["next"]
+		self.assertEqual(len(vistos), len(set(vistos)))
+		self.assertGreaterEqual(len(vistos), 104)
+
+	def test_rejected_enrollment_does_not_materialize_the_occurrence(self):
+		self.client.force_authenticate(user=self.aluno)
+		chave = f"{self.agendamento.id}-{self.proxima_data:%Y%m%d}-1800-1900"
+		resp = self.client.post(reverse("inscricao-list"), {"ocorrencia": chave, "status": "ESPERA"}, format="json")
+		self.assertEqual(resp.status_code, 400)
+		AgendamentoTreino.objects.filter(pk=self.agendamento.pk).update(vagas=0)
+		resp = self.client.post(reverse("inscricao-list"), {"ocorrencia": chave}, format="json")
+		self.assertEqual(resp.status_code, 400)
+		self.assertFalse(Treino.objects.exists())
+
+	def test_materializar_is_for_the_agendamento_staff_only(self):
+		chave = f"{self.agendamento.id}-{self.proxima_data:%Y%m%d}-1800-1900"
+		self.client.force_authenticate(user=self.aluno)
+		self.assertEqual(self.client.post(reverse("treino-materializar"), {"ocorrencia": chave}, format="json").status_code, 403)
+		self.assertFalse(Treino.objects.exists())
+		self.client.force_authenticate(user=self.professor)
+		resp = self.client.post(reverse("treino-materializar"), {"ocorrencia": chave}, format="json")
+		self.assertEqual(resp.status_code, 200)
+		self.assertEqual(resp.data["id"], Treino.objects.get(agendamento=self.agendamento).id)
+
+	def test_invalid_occurrence_key_is_rejected(self):
+		self.client.force_authenticate(user=self.aluno)
+		chave = f"{self.agendamento.id}-{self.proxima_data:%Y%m%d}-0500-0600"
+		resp = self.client.post(reverse("inscricao-list"), {"ocorrencia": chave}, format="json")
+		self.assertEqual(resp.status_code, 400)
+		self.assertFalse(Treino.objects.exists())
@@ -15,6 +15,7 @@ urlpatterns = [
     path("gerente/cts/<int:pk>/professores/", views.gerente_ct_professores, name="gerente_ct_professores"),
     # Inscrições (Aluno)
     path("aluno/inscrever/<int:treino_id>/", views.inscricao_criar, name="inscricao_criar"),
+    path("aluno/inscrever/ocorrencia/<str:chave>/", views.inscricao_criar_ocorrencia, name="inscricao_criar_ocorrencia"),
     path("aluno/inscricao/<int:pk>/cancelar/", views.inscricao_cancelar, name="inscricao_cancelar"),
     path("ct/", views.CTListView.as_view(), name="ct_list"),
     path("ct/novo/", views.CTCreateView.as_view(), name="ct_create"),
@@ -5,25 +5,48 @@ from django.contrib import messages
 from django.contrib.auth import authenticate, login, get_user_model
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.db import transaction
-from django.db.models import Count, Q
+from django.db.models import Count, F, Q
 from django.utils import timezone
 from django.urls import reverse_lazy
 
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
-from .models import CentroTreinamento, Treino
+from .models import AgendamentoTreino, CentroTreinamento, Treino
 from .forms import CentroTreinamentoForm, TreinoForm, UsuarioProfileForm, CTProfessoresForm
 from .mixins import ProfOrManagerRequiredMixin, ProfessorRequiredMixin
 
 from .forms import SignupAlunoForm, SignupProfessorForm, SignupGerenteForm
 from .models import Usuario, Inscricao
 from .decorators import aluno_required, professor_required
+from .metrics import get_metrics
+from .permissions import permission_context
+from .recurrence import prefetch_recurrence
+from .services import (
+    InscricaoDuplicada,
+    OcorrenciaInvalida,
+    build_virtual_ocorrencias,
+    cancelar_inscricao,
+    find_conflicts,
+    lazy_materialization_enabled,
+    materialize_ocorrencia,
+    merge_ocorrencias,
+    registrar_intencao,
+    reservar_vaga,
+)
 
 AUTO_LOGIN = True  # troque para False se quiser redirecionar pro login
+CONFLITO_AGENDA = "Conflito de horário com outro treino seu."
+
+
+def _conflito_agenda(professor, data, hi, hf, exclude_pk=None) -> bool:
+    """Sobreposição com qualquer treino do professor na data (em qualquer CT)."""
+    if not (data and hi and hf):
+        return False
+    return bool(find_conflicts([(data, hi, hf)], professor.pk, exclude_treino_ids=[exclude_pk]))
 
 def home(request):
     """Landing: redireciona usuários autenticados conforme o perfil; exibe métricas se anônimo."""
-    if request.user.is_authenticated and hasattr(request.user, "usuario"):
-        tipo = request.user.usuario.tipo
+    if request.user.is_authenticated:
+        tipo = permission_context(request.user).tipo
         if tipo == Usuario.Tipo.ALUNO:
             return redirect("meus_treinos")
         if tipo == Usuario.Tipo.PROFESSOR:
@@ -32,36 +55,24 @@ def home(request):
             return redirect("meus_cts")
 
 
-    # Métricas simples para a landing
-    metric_cts = CentroTreinamento.objects.count()
-    metric_professores = Usuario.objects.filter(tipo=Usuario.Tipo.PROFESSOR).count()
-    # Treinos futuros
-    now = timezone.localdate()
-    metric_treinos = Treino.objects.filter(data__gte=now).count()
-    metric_alunos = Usuario.objects.filter(tipo=Usuario.Tipo.ALUNO).count()
-
-    context = {
-        "metric_cts": metric_cts,
-        "metric_professores": metric_professores,
-        "metric_treinos": metric_treinos,
-        "metric_alunos": metric_alunos,
-    }
+    # Métricas da landing (em cache, compartilhadas com /api/metrics/)
+    context = dict(get_metrics())
     return render(request, "home.html", context)
 
 
 def is_aluno(user):
-    return user.is_authenticated and hasattr(user, "usuario") and user.usuario.tipo == Usuario.Tipo.ALUNO
+    return user.is_authenticated and permission_context(user).is_aluno
 
 
 def is_professor(user):
-    return user.is_authenticated and hasattr(user, "usuario") and user.usuario.tipo == Usuario.Tipo.PROFESSOR
+    return user.is_authenticated and permission_context(user).is_professor
 
 def is_prof_or_manager(user):
     if not user.is_authenticated:
         return False
     if user.is_superuser:
         return True
-    return hasattr(user, "usuario") and user.usuario.tipo in (Usuario.Tipo.PROFESSOR, Usuario.Tipo.GERENTE)
+    return permission_context(user).tipo in (Usuario.Tipo.PROFESSOR, Usuario.Tipo.GERENTE)
 
 @transaction.atomic
 def signup_aluno(request):
@@ -138,12 +149,7 @@ def prof_dashboard(request):
     """Dashboard do professor: lista treinos futuros, cria/edita/exclui (modo modal) e mostra métricas."""
     base_qs = (
         request.user.treinos_ministrados.select_related("ct")
-        .annotate(
-            confirmadas=Count(
-                "inscricoes",
-                filter=Q(inscricoes__status=Inscricao.Status.CONFIRMADA),
-            )
-        )
+        .annotate(confirmadas=F("inscritos_confirmados"))
     )
     form = TreinoForm(user=request.user)
     show_treino_modal = False
@@ -157,21 +163,14 @@ def prof_dashboard(request):
             if form.is_valid():
                 treino = form.save(commit=False)
                 treino.professor = request.user
-                data = form.cleaned_data.get("data")
-                ct = form.cleaned_data.get("ct")
-                hi = form.cleaned_data.get("hora_inicio")
-                hf = form.cleaned_data.get("hora_fim")
-                conflict = False
-                if data and ct and hi and hf:
-                    conflict = Treino.objects.filter(
-                        professor=request.user,
-                        ct=ct,
-                        data=data,
-                        hora_inicio__lt=hf,
-                        hora_fim__gt=hi,
-                    ).exists()
+                conflict = _conflito_agenda(
+                    request.user,
+                    form.cleaned_data.get("data"),
+                    form.cleaned_data.get("hora_inicio"),
+                    form.cleaned_data.get("hora_fim"),
+                )
                 if conflict:
-                    form.add_error(None, "Conflito de horário com outro treino seu neste CT.")
+                    form.add_error(None, CONFLITO_AGENDA)
                     show_treino_modal = True
                     modal_mode = "create"
                 else:
@@ -185,21 +184,15 @@ def prof_dashboard(request):
             treino_obj = get_object_or_404(Treino, pk=treino_id, professor=request.user)
             form = TreinoForm(request.POST, user=request.user, instance=treino_obj)
             if form.is_valid():
-                data = form.cleaned_data.get("data")
-                ct = form.cleaned_data.get("ct")
-                hi = form.cleaned_data.get("hora_inicio")
-                hf = form.cleaned_data.get("hora_fim")
-                conflict = False
-                if data and ct and hi and hf:
-                    conflict = Treino.objects.filter(
-                        professor=request.user,
-                        ct=ct,
-                        data=data,
-                        hora_inicio__lt=hf,
-                        hora_fim__gt=hi,
-                    ).exclude(pk=treino_obj.pk).exists()
+                conflict = _conflito_agenda(
+                    request.user,
+                    form.cleaned_data.get("data"),
+                    form.cleaned_data.get("hora_inicio"),
+                    form.cleaned_data.get("hora_fim"),
+                    exclude_pk=treino_obj.pk,
+                )
                 if conflict:
-                    form.add_error(None, "Conflito de horário com outro treino seu neste CT.")
+                    form.add_error(None, CONFLITO_AGENDA)
                     show_treino_modal = True
                     modal_mode = "edit"
                     editing_treino_id = treino_obj.pk
@@ -276,7 +269,7 @@ def prof_dashboard(request):
     next_treino_alunos = 0
     next_treino = qs.first()
     if next_treino:
-        next_treino_alunos = next_treino.inscricoes.filter(status=Inscricao.Status.CONFIRMADA).count()
+        next_treino_alunos = next_treino.inscritos_confirmados
 
     cts = request.user.cts_associados.order_by("nome")
     context = {
@@ -321,33 +314,39 @@ def meus_treinos(request):
 # --- Inscrições (Aluno) ---
 @aluno_required
 def inscricao_criar(request, treino_id: int):
-    """Cria ou reativa inscrição (CONFIRMADA) respeitando limite de vagas; bloqueia se lotado."""
+    """Cria ou reativa inscrição (CONFIRMADA) respeitando limite de vagas; se lotado, entra na lista de espera."""
     if request.method != "POST":
         return redirect("meus_treinos")
     treino = get_object_or_404(Treino, pk=treino_id)
-    # Verifica capacidade (inscrições confirmadas)
-    confirmadas = Inscricao.objects.filter(
-        treino=treino, status=Inscricao.Status.CONFIRMADA
-    ).count()
-
-    insc = Inscricao.objects.filter(treino=treino, aluno=request.user).first()
-    if insc:
-        if insc.status == Inscricao.Status.CANCELADA:
-            if confirmadas >= treino.vagas:
-                messages.error(request, "Treino lotado. Não foi possível reativar a inscrição.")
-                return redirect("meus_treinos")
-            insc.status = Inscricao.Status.CONFIRMADA
-            insc.save(update_fields=["status"])
+    if treino.sorteio_pendente:
+        registrar_intencao(treino.pk, request.user)
+        encerra = timezone.localtime(treino.sorteio_encerra_em)
+        messages.info(request, f"As vagas deste treino serão sorteadas em {encerra:%d/%m às %H:%M}. Seu pedido foi registrado.")
+        return redirect("meus_treinos")
+    # Reserva atômica: a vaga só é contada se ainda houver (confirmadas + pendentes < vagas)
+    try:
+        inscricao = reservar_vaga(treino.pk, request.user, fila=True)
+    except InscricaoDuplicada:
+        messages.info(request, "Você já está inscrito (ou na lista de espera) neste treino.")
     else:
-        if confirmadas >= treino.vagas:
-            messages.error(request, "Treino lotado. Não foi possível realizar a inscrição.")
-            return redirect("meus_treinos")
-        Inscricao.objects.create(
-            treino=treino, aluno=request.user, status=Inscricao.Status.CONFIRMADA
-        )
+        if inscricao.status == Inscricao.Status.ESPERA:
+            messages.info(request, "Treino lotado. Você entrou na lista de espera e será inscrito quando abrir uma vaga.")
     return redirect("meus_treinos")
 
 
+@aluno_required
+def inscricao_criar_ocorrencia(request, chave: str):
+    """Materializa a ocorrência recorrente virtual e segue o fluxo normal de inscrição."""
+    if request.method != "POST":
+        return redirect("meus_treinos")
+    try:
+        treino = materialize_ocorrencia(chave)
+    except OcorrenciaInvalida as exc:
+        messages.error(request, str(exc))
+        return redirect("meus_treinos")
+    return inscricao_criar(request, treino.pk)
+
+
 @aluno_required
 def inscricao_cancelar(request, pk: int):
     """Cancela (marca como CANCELADA) a inscrição do aluno se não estiver já cancelada."""
@@ -355,11 +354,26 @@ def inscricao_cancelar(request, pk: int):
         return redirect("meus_treinos")
     insc = get_object_or_404(Inscricao, pk=pk, aluno=request.user)
     if insc.status != Inscricao.Status.CANCELADA:
-        insc.status = Inscricao.Status.CANCELADA
-        insc.save(update_fields=["status"])
+        # A vaga liberada vai para o primeiro da lista de espera, na mesma transação
+        cancelar_inscricao(insc)
     return redirect("meus_treinos")
 
 
+def _treinos_do_aluno(user):
+    """Treinos em que o aluno já ocupa vaga ou está na fila: (inscritos_ids, fila_ids).
+
+    `inscritos_ids` inclui a fila (o botão de inscrição não aparece); `fila_ids` permite
+    exibir "na fila" no lugar de "inscrito".
+    """
+    ativas = [Inscricao.Status.PENDENTE, Inscricao.Status.CONFIRMADA, Inscricao.Status.ESPERA]
+    inscritos_ids, fila_ids = [], []
+    for treino_id, status in Inscricao.objects.filter(aluno=user, status__in=ativas).values_list("treino_id", "status"):
+        inscritos_ids.append(treino_id)
+        if status == Inscricao.Status.ESPERA:
+            fila_ids.append(treino_id)
+    return inscritos_ids, fila_ids
+
+
 @aluno_required
 def novo_treino_escolher_ct(request):
     """Passo 1 do fluxo de inscrição: exibe CTs para o aluno escolher."""
@@ -376,18 +390,23 @@ def novo_treino_escolher_treino(request, ct_id: int):
     treinos = (
         Treino.objects.filter(ct=ct, data__gte=today, data__lte=window_end)
         .select_related("ct", "professor")
-        .annotate(confirmadas=Count("inscricoes", filter=Q(inscricoes__status=Inscricao.Status.CONFIRMADA)))
+        .annotate(confirmadas=F("inscritos_confirmados"))
         .order_by("data", "hora_inicio")
     )
-    inscritos_ids = (
-        Inscricao.objects.filter(
-            aluno=request.user, status__in=[Inscricao.Status.PENDENTE, Inscricao.Status.CONFIRMADA]
-        ).values_list("treino_id", flat=True)
-    )
+    if lazy_materialization_enabled():
+        agendamentos = prefetch_recurrence(
+            AgendamentoTreino.objects.filter(ct=ct).select_related("professor")
+        )
+        virtuais = build_virtual_ocorrencias(agendamentos, today, window_end)
+        for treino in virtuais:
+            treino.confirmadas = 0
+        treinos = merge_ocorrencias(treinos, virtuais, newest_first=False)
+    inscritos_ids, fila_ids = _treinos_do_aluno(request.user)
     context = {
         "ct": ct,
         "treinos": treinos,
-        "inscritos_ids": list(inscritos_ids),
+        "inscritos_ids": inscritos_ids,
+        "fila_ids": fila_ids,
     }
     return render(request, "aluno/novo_treino_escolher_treino.html", context)
 
@@ -415,25 +434,17 @@ class CTListView(ListView):
         )
 
         user = self.request.user
-        if user.is_authenticated and hasattr(user, "usuario"):
-            if user.usuario.tipo == Usuario.Tipo.PROFESSOR:
-                qs = qs.filter(professores=user)
+        if user.is_authenticated and permission_context(user).is_professor:
+            qs = qs.filter(professores=user)
 
         return qs.distinct()
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
         user = self.request.user
-        ctx["is_professor"] = (
-            user.is_authenticated
-            and hasattr(user, "usuario")
-            and user.usuario.tipo == Usuario.Tipo.PROFESSOR
-        )
-        ctx["is_gerente"] = (
-            user.is_authenticated
-            and hasattr(user, "usuario")
-            and user.usuario.tipo == Usuario.Tipo.GERENTE
-        )
+        perfil = permission_context(user)
+        ctx["is_professor"] = perfil.is_professor
+        ctx["is_gerente"] = perfil.is_gerente
         return ctx
 
 class CTDetailView(DetailView):
@@ -450,7 +461,7 @@ class CTDetailView(DetailView):
         base_qs = (
             self.object.treinos
             .select_related("ct", "professor")
-            .annotate(confirmadas=Count("inscricoes", filter=Q(inscricoes__status=Inscricao.Status.CONFIRMADA)))
+            .annotate(confirmadas=F("inscritos_confirmados"))
         )
 
         futuros_qs = base_qs.filter(data__gte=today, data__lte=window_end)
@@ -470,13 +481,9 @@ class CTDetailView(DetailView):
             self.object.professores.order_by("first_name", "last_name", "username")
         )
         if self.request.user.is_authenticated:
-            inscritos_ids = Inscricao.objects.filter(
-                aluno=self.request.user,
-                status__in=[Inscricao.Status.PENDENTE, Inscricao.Status.CONFIRMADA],
-            ).values_list("treino_id", flat=True)
-            ctx["inscritos_ids"] = list(inscritos_ids)
+            ctx["inscritos_ids"], ctx["fila_ids"] = _treinos_do_aluno(self.request.user)
         else:
-            ctx["inscritos_ids"] = []
+            ctx["inscritos_ids"], ctx["fila_ids"] = [], []
         return ctx
 
 class CTCreateView(ProfOrManagerRequiredMixin, CreateView):
@@ -489,7 +496,7 @@ class CTCreateView(ProfOrManagerRequiredMixin, CreateView):
     def form_valid(self, form):
         # Se usuário for gerente, define como gerente do CT
         user = self.request.user
-        if hasattr(user, "usuario") and user.usuario.tipo == Usuario.Tipo.GERENTE:
+        if permission_context(user).is_gerente:
             form.instance.gerente = user
         return super().form_valid(form)
 
@@ -505,7 +512,7 @@ class CTUpdateView(ProfOrManagerRequiredMixin, UpdateView):
         u = self.request.user
         if u.is_superuser:
             return qs
-        if hasattr(u, "usuario") and u.usuario.tipo == Usuario.Tipo.GERENTE:
+        if permission_context(u).is_gerente:
             return qs.filter(gerente=u)
         return qs
 
@@ -528,7 +535,7 @@ class TreinoListView(ProfessorRequiredMixin, ListView):
         u = self.request.user
         if u.is_superuser:
             return qs
-        if hasattr(u, "usuario") and u.usuario.tipo == Usuario.Tipo.GERENTE:
+        if permission_context(u).is_gerente:
             return qs.filter(gerente=u)
         return qs
 
@@ -537,7 +544,7 @@ class TreinoListView(ProfessorRequiredMixin, ListView):
 @login_required
 def gerente_meus_cts(request):
     """Dashboard simples do gerente: lista CTs sob sua gestão com métricas agregadas (treinos futuros/professores)."""
-    if not hasattr(request.user, "usuario") or request.user.usuario.tipo != Usuario.Tipo.GERENTE:
+    if not permission_context(request.user).is_gerente:
         # Redireciona conforme perfil
         return redirect("home")
     today = timezone.localdate()
@@ -576,7 +583,7 @@ def gerente_meus_cts(request):
 @login_required
 def gerente_ct_professores(request, pk: int):
     """Permite ao gerente gerenciar o conjunto de professores associados ao CT."""
-    if not hasattr(request.user, "usuario") or request.user.usuario.tipo != Usuario.Tipo.GERENTE:
+    if not permission_context(request.user).is_gerente:
         return redirect("home")
     ct = get_object_or_404(CentroTreinamento, pk=pk, gerente=request.user)
     if request.method == "POST":
@@ -600,7 +607,7 @@ class GerenteCTCreateView(CreateView):
     success_url = reverse_lazy("meus_cts")
 
     def dispatch(self, request, *args, **kwargs):
-        if not request.user.is_authenticated or not hasattr(request.user, "usuario") or request.user.usuario.tipo != Usuario.Tipo.GERENTE:
+        if not request.user.is_authenticated or not permission_context(request.user).is_gerente:
             return redirect("home")
         return super().dispatch(request, *args, **kwargs)
 
@@ -626,22 +633,15 @@ class TreinoCreateView(ProfessorRequiredMixin, CreateView):
         form.instance.professor = self.request.user
         # Revalida associação professor-CT (Treino.clean e form.clean_ct)
         form.instance.full_clean(exclude=None)
-        # validação de conflito de horário para mesmo professor e mesmo CT na mesma data
-        data = form.cleaned_data.get("data")
-        ct = form.cleaned_data.get("ct")
-        hi = form.cleaned_data.get("hora_inicio")
-        hf = form.cleaned_data.get("hora_fim")
-        if data and ct and hi and hf:
-            overlap = Treino.objects.filter(
-                professor=self.request.user,
-                ct=ct,
-                data=data,
-                hora_inicio__lt=hf,
-                hora_fim__gt=hi,
-            ).exists()
-            if overlap:
-                form.add_error(None, "Conflito de horário com outro treino seu neste CT.")
-                return self.form_invalid(form)
+        # validação de conflito de horário com toda a agenda do professor na data
+        if _conflito_agenda(
+            self.request.user,
+            form.cleaned_data.get("data"),
+            form.cleaned_data.get("hora_inicio"),
+            form.cleaned_data.get("hora_fim"),
+        ):
+            form.add_error(None, CONFLITO_AGENDA)
+            return self.form_invalid(form)
         return super().form_valid(form)
 
 
@@ -651,7 +651,7 @@ def perfil_detail(request):
     """Exibe dados do perfil (Aluno/Professor) com lista formatada de certificações."""
     # Apenas Aluno/Professor (ou superuser) podem ver/editar o próprio perfil
     if not request.user.is_superuser:
-        if not hasattr(request.user, "usuario") or request.user.usuario.tipo not in (
+        if permission_context(request.user).tipo not in (
             Usuario.Tipo.ALUNO,
             Usuario.Tipo.PROFESSOR,
         ):
@@ -677,7 +677,7 @@ def perfil_detail(request):
 def perfil_editar(request):
     """Form de edição de perfil (Aluno/Professor); impede outros perfis não autorizados."""
     if not request.user.is_superuser:
-        if not hasattr(request.user, "usuario") or request.user.usuario.tipo not in (
+        if permission_context(request.user).tipo not in (
             Usuario.Tipo.ALUNO,
             Usuario.Tipo.PROFESSOR,
         ):